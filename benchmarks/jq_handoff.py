@@ -0,0 +1,64 @@
+"""
+Compares handing a step's log entries to gcp_logs_find.jq as Python dicts
+(serialized again for jq) vs. as the entries.list responses' JSON text (see
+RawLogEntries in lib/logs_clients.py).
+
+    python -m benchmarks.jq_handoff [--seeds N] [--page-size N] [--repeat N]
+"""
+
+import argparse
+import json
+import timeit
+
+from lib.correlate_logs import extract_search_state, merge_project_entries
+from lib.logs_clients import RawLogEntries
+from lib.replay_backend import make_replay_entries
+
+
+def fetch_pages(entries, page_size):
+    """Decodes pages of entries the way the HTTP transport does."""
+    pages = []
+    for i in range(0, len(entries), page_size):
+        text = json.dumps({"entries": entries[i : i + page_size]})
+        pages.append(RawLogEntries(json.loads(text)["entries"], [text]))
+
+    return pages
+
+
+def step(entries, page_size, raw):
+    pages = fetch_pages(entries, page_size)
+
+    merged = RawLogEntries()
+    for page in pages:
+        merged.extend(page if raw else list(page))
+
+    return extract_search_state(merge_project_entries({"gen-prod": merged}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--seeds", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    (entries, _) = make_replay_entries(
+        args.seeds, fanout=4, depth=2, entries_per_request=12
+    )
+    print(f"{len(entries)} log entries, pages of {args.page_size}\n")
+
+    assert step(entries, args.page_size, raw=True) == step(
+        entries, args.page_size, raw=False
+    )
+
+    for (name, raw) in [("dicts", False), ("response text", True)]:
+        best = min(
+            timeit.repeat(
+                lambda: step(entries, args.page_size, raw), number=1, repeat=args.repeat
+            )
+        )
+        print(f"{name:>14}: {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Load-tests the HTTP entry point (main.correlate_logs) against a local replay of
+the Logging API, reporting throughput, latency percentiles and peak RSS at each
+concurrency level.
+
+    python -m benchmarks.load_test [--concurrency 1,4,16] [--requests N]
+        [--latency MS] [--jitter MS] [--url-ratio R] [--entries FILE ...]
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import functions_framework
+import google.cloud.logging
+
+import lib.correlate_logs
+from lib.correlate_logs import gcp_logs_url, get_state_from_url, parse_gcp_logs_url
+from lib.replay_backend import ReplayBackend, make_replay_entries
+from lib.scheduler import QuotaScheduler
+from lib.spill import current_rss
+
+from .replay import replaying
+
+RSS_SAMPLE_INTERVAL = 0.01  # seconds
+
+
+def load_app():
+    # main.py sends its logs to Cloud Logging; keep them local during the test
+    google.cloud.logging.Client.setup_logging = lambda *args, **kwargs: None
+
+    return functions_framework.create_app(target="correlate_logs", source="main.py")
+
+
+def make_payloads(seeds, time_range, url_ratio):
+    """
+    Builds request bodies for the seeds: new correlations (`url`) and continued
+    ones (`prevSearchState`, as Retool sends after the first response).
+    """
+    payloads = []
+    for (i, seed) in enumerate(seeds):
+        url = gcp_logs_url(f'insertId="{seed}"', time_range)
+
+        # spread url payloads evenly instead of bunching them up
+        if int((i + 1) * url_ratio) > int(i * url_ratio):
+            payloads.append({"url": url})
+        else:
+            state = get_state_from_url(*parse_gcp_logs_url(url))
+            payloads.append({"prevSearchState": state, "prevUrl": url})
+
+    return payloads
+
+
+def percentile(values, p):
+    # nearest-rank
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))]
+
+
+class RssSampler:
+    """Samples the process' RSS in the background to find its peak."""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_level(app, payloads, concurrency, request_count):
+    clients = threading.local()
+
+    def post(payload):
+        # test clients aren't meant to be shared between threads
+        if not hasattr(clients, "client"):
+            clients.client = app.test_client()
+
+        start = time.perf_counter()
+        resp = clients.client.post("/", json=payload)
+        elapsed = time.perf_counter() - start
+
+        ok = resp.status_code == 200 and resp.get_json().get("status") == "ok"
+        return (elapsed, ok)
+
+    requests = [payloads[i % len(payloads)] for i in range(request_count)]
+
+    with RssSampler() as rss, ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(post, requests))
+        elapsed = time.perf_counter() - start
+
+    latencies = [r[0] for r in results]
+    return {
+        "concurrency": concurrency,
+        "requests": request_count,
+        "errors": sum(1 for r in results if not r[1]),
+        "throughput": request_count / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "peakRssMb": rss.peak / 1024 / 1024,
+    }
+
+
+def print_result(result):
+    print(
+        f"{result['concurrency']:>5} {result['requests']:>8} {result['errors']:>6} "
+        f"{result['throughput']:>9.1f} "
+        + " ".join(f"{result[p] * 1000:>8.1f}" for p in ["p50", "p95", "p99"])
+        + f" {result['peakRssMb']:>9.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--concurrency",
+        default="1,4,16",
+        help="comma-separated concurrency levels (default: %(default)s)",
+    )
+    parser.add_argument("--requests", type=int, default=200, help="per level")
+    parser.add_argument(
+        "--latency", type=float, default=50, help="per Logging API call, in ms"
+    )
+    parser.add_argument("--jitter", type=float, default=20, help="in ms")
+    parser.add_argument(
+        "--url-ratio",
+        type=float,
+        default=0.5,
+        help="share of `url` (vs. `prevSearchState`) payloads",
+    )
+    parser.add_argument("--seeds", type=int, default=20, help="generated seeds")
+    parser.add_argument(
+        "--entries",
+        nargs="+",
+        metavar="FILE",
+        help="replay these log entries (e.g. ./traces/*.json) instead of "
+        "generated ones; seeds are their first entries",
+    )
+    parser.add_argument(
+        "--quota",
+        action="store_true",
+        help="apply the Logging API quota, as deployed (default: unlimited)",
+    )
+    parser.add_argument("-o", "--output", help="also write results as JSON")
+    args = parser.parse_args()
+
+    if args.entries:
+        backend = ReplayBackend.from_files(args.entries)
+        seeds = backend.insert_ids()[: args.seeds]
+    else:
+        (entries, seeds) = make_replay_entries(args.seeds)
+        backend = ReplayBackend(entries)
+
+    app = load_app()
+
+    if not args.quota:
+        lib.correlate_logs.LOGS_SCHEDULER = QuotaScheduler(burst=float("inf"))
+
+    with replaying(backend):
+        # built without latency, so only the requests themselves are timed
+        payloads = make_payloads(seeds, backend.time_range(), args.url_ratio)
+        (backend.latency, backend.jitter) = (args.latency / 1000, args.jitter / 1000)
+
+        print(
+            f"{len(backend)} log entries, {len(payloads)} payloads, "
+            f"{args.latency:g}±{args.jitter:g} ms per API call"
+        )
+        print(
+            f"{'conc':>5} {'requests':>8} {'errors':>6} {'req/s':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak RSS MB':>9}"
+        )
+
+        results = []
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            results.append(run_level(app, payloads, concurrency, args.requests))
+            print_result(results[-1])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Compares the memory held by a step's log entries as plain dicts vs. compact
+LogEntry objects (see lib/log_entry.py), along with the time to build them and
+to extract the search state from them.
+
+    python -m benchmarks.log_entries [--seeds N] [--repeat N]
+"""
+
+import argparse
+import gc
+import json
+import timeit
+import tracemalloc
+
+from lib.correlate_logs import extract_search_state_from_log_entries
+from lib.log_entry import LogEntry
+from lib.replay_backend import make_replay_entries
+
+
+def load_dicts(text):
+    return json.loads(text)
+
+
+def load_compact(text):
+    return LogEntry.wrap_all(json.loads(text))
+
+
+def held_bytes(load, text):
+    """Bytes still allocated once the entries are built (i.e. what they hold)."""
+    gc.collect()
+    tracemalloc.start()
+    entries = load(text)
+    gc.collect()
+    (size, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del entries
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--seeds", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    (entries, _) = make_replay_entries(
+        args.seeds, fanout=4, depth=2, entries_per_request=12
+    )
+    # as the HTTP transport gets them
+    text = json.dumps(entries)
+    print(f"{len(entries)} log entries, {len(text) / 1024:.0f} KB of JSON\n")
+
+    print(f"{'':>8} {'held KB':>9} {'B/entry':>8} {'build ms':>9} {'state ms':>9}")
+    for (name, load) in [("dicts", load_dicts), ("compact", load_compact)]:
+        size = held_bytes(load, text)
+        build = min(timeit.repeat(lambda: load(text), number=1, repeat=args.repeat))
+
+        loaded = load(text)
+        state = min(
+            timeit.repeat(
+                lambda: extract_search_state_from_log_entries(loaded),
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+
+        print(
+            f"{name:>8} {size / 1024:>9.0f} {size / len(entries):>8.0f} "
+            f"{build * 1000:>9.1f} {state * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Compares Logging client settings (see lib/logs_clients.py): page sizes, by API
+calls and time for whole correlations against the replay backend, and
+transports, by the client-side cost of decoding pages of log entries from
+HTTP (JSON) vs. gRPC (protobuf) responses.
+
+    python -m benchmarks.logs_clients [--seeds N] [--latency MS]
+        [--entry-latency US] [--repeat N]
+"""
+
+import argparse
+import json
+import time
+import timeit
+
+from google.cloud.logging_v2._gapic import _parse_log_entry
+from google.cloud.logging_v2.types import ListLogEntriesResponse
+from google.protobuf.json_format import ParseDict
+
+import lib.correlate_logs
+from lib.correlate_logs import (
+    find_entries,
+    gcp_logs_url,
+    get_state_from_url,
+    parse_gcp_logs_url,
+)
+from lib.replay_backend import ReplayBackend, make_replay_entries
+from lib.scheduler import QuotaScheduler
+
+from .replay import replaying
+
+PAGE_SIZES = [50, 100, 250, 1000]
+MAX_ITERATIONS = 10
+
+
+def correlate(seed, time_range):
+    """Runs a whole correlation, like the wrapper script's loop."""
+    (url_params, url_qs) = parse_gcp_logs_url(
+        gcp_logs_url(f'insertId="{seed}"', time_range)
+    )
+    state = get_state_from_url(url_params, url_qs)
+
+    for _ in range(MAX_ITERATIONS):
+        (_, resp_data) = find_entries(state, url_params, url_qs)
+        if not resp_data["logEntries"]:
+            break
+
+        state = resp_data["searchState"]
+
+
+def compare_page_sizes(entries, seeds, latency, entry_latency):
+    print(f"{'page size':>9} {'API calls':>9} {'time s':>8}")
+
+    for page_size in PAGE_SIZES:
+        backend = ReplayBackend(
+            entries, latency=latency, page_size=page_size, entry_latency=entry_latency
+        )
+
+        with replaying(backend):
+            start = time.perf_counter()
+            for seed in seeds:
+                correlate(seed, backend.time_range())
+            elapsed = time.perf_counter() - start
+
+        print(f"{page_size:>9} {backend.calls:>9} {elapsed:>8.2f}")
+
+
+def encode_pages(entries, page_size):
+    """Encodes entries as pages of JSON and protobuf entries.list responses."""
+    pages = []
+    for i in range(0, len(entries), page_size):
+        page = entries[i : i + page_size]
+        resp = {"entries": page, "nextPageToken": "next"}
+
+        pb = ListLogEntriesResponse.pb(ListLogEntriesResponse())
+        ParseDict(resp, pb)
+
+        pages.append((json.dumps(resp).encode(), pb.SerializeToString()))
+
+    return pages
+
+
+def decode_http(body):
+    return json.loads(body)["entries"]
+
+
+def decode_grpc(body):
+    # same conversion as LogsClientManager.fetch_page()
+    resp = ListLogEntriesResponse.pb().FromString(body)
+    return [_parse_log_entry(e) for e in resp.entries]
+
+
+def compare_transports(entries, repeat):
+    print(
+        f"{'page size':>9} {'JSON KB':>8} {'proto KB':>8} "
+        f"{'http ms':>8} {'grpc ms':>8}"
+    )
+
+    for page_size in PAGE_SIZES:
+        pages = encode_pages(entries, page_size)
+        (http_bodies, grpc_bodies) = zip(*pages)
+
+        timings = [
+            min(
+                timeit.repeat(
+                    lambda: [decode(body) for body in bodies], number=1, repeat=repeat
+                )
+            )
+            / len(pages)
+            for (decode, bodies) in [
+                (decode_http, http_bodies),
+                (decode_grpc, grpc_bodies),
+            ]
+        ]
+
+        print(
+            f"{page_size:>9} "
+            f"{sum(map(len, http_bodies)) / len(pages) / 1024:>8.1f} "
+            f"{sum(map(len, grpc_bodies)) / len(pages) / 1024:>8.1f} "
+            + " ".join(f"{t * 1000:>8.2f}" for t in timings)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument(
+        "--latency", type=float, default=50, help="per Logging API call, in ms"
+    )
+    parser.add_argument(
+        "--entry-latency",
+        type=float,
+        default=20,
+        help="per log entry returned, in µs (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # request trees big enough to need several pages per query, but small
+    # enough for the insertId exclusions to fit in MAX_FILTER_SIZE
+    (entries, seeds) = make_replay_entries(
+        args.seeds, fanout=4, depth=2, entries_per_request=12
+    )
+    print(f"{len(entries)} log entries, {len(seeds)} seeds\n")
+
+    lib.correlate_logs.LOGS_SCHEDULER = QuotaScheduler(burst=float("inf"))
+    compare_page_sizes(
+        entries, seeds, args.latency / 1000, args.entry_latency / 10**6
+    )
+
+    print()
+    compare_transports(entries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
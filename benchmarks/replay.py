@@ -0,0 +1,11 @@
+"""Helpers for running correlations against lib/replay_backend.py."""
+
+from contextlib import contextmanager
+from unittest import mock
+
+
+@contextmanager
+def replaying(backend):
+    """Makes query_logs() fetch pages from the replay backend instead of the API."""
+    with mock.patch("lib.correlate_logs.fetch_log_entries_page", backend.fetch_page):
+        yield backend
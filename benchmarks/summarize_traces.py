@@ -0,0 +1,93 @@
+"""
+Shows how parallel trace summarization scales with the number of worker
+processes, compared to running summarize_traces.jq on all traces at once.
+
+    python -m benchmarks.summarize_traces [--traces N] [--entries N]
+"""
+
+import argparse
+import os
+import random
+import time
+
+from lib.jq_programs import compile_jq_program
+from lib.summarize_traces import SUMMARIZE_TRACES_PATH, summarize_traces
+
+MESSAGES = [
+    "post:{n} recipe:{n}",
+    "deferring task:{n}",
+    "trace:projects/gen-prod/traces/{n}; recipeCollection:{n}",
+    "nothing to see here",
+]
+
+
+def make_traces(trace_count, entry_count, seed=0):
+    rng = random.Random(seed)
+
+    def entry(trace_id, i):
+        fraction = rng.randrange(10**6)
+        ts = f"2022-11-29T16:{i // 60 % 60:02d}:{i % 60:02d}.{fraction:06d}Z"
+        return {
+            "insertId": f"{trace_id}-{i}",
+            "timestamp": ts,
+            "trace": f"projects/gen-prod/traces/{trace_id}",
+            "resource": {"labels": {"module_id": "default"}},
+            "protoPayload": {
+                "requestId": f"{trace_id}-{i // 10}",
+                "endTime": ts,
+                "line": [
+                    {"logMessage": rng.choice(MESSAGES).format(n=rng.randrange(1000))}
+                    for _ in range(5)
+                ],
+            },
+            "_timestampEnd": ts,
+        }
+
+    # trace sizes vary a lot in practice, so do the same here
+    return {
+        f"{t:032x}": [entry(t, i) for i in range(rng.randrange(1, entry_count * 2))]
+        for t in range(trace_count)
+    }
+
+
+def worker_counts():
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+
+    if counts[-1] != os.cpu_count():
+        counts.append(os.cpu_count() or 1)
+
+    return counts
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--traces", type=int, default=2000)
+    parser.add_argument("--entries", type=int, default=20, help="avg entries/trace")
+    args = parser.parse_args()
+
+    traces = make_traces(args.traces, args.entries)
+    entry_count = sum(len(v) for v in traces.values())
+    print(f"{len(traces)} traces, {entry_count} log entries, {os.cpu_count()} CPUs")
+
+    program = compile_jq_program(SUMMARIZE_TRACES_PATH)
+    baseline = timed(lambda: program.input(traces).first())
+    print(f"{'jq':>10}: {baseline:7.2f} s")
+
+    for workers in worker_counts():
+        elapsed = timed(lambda: summarize_traces(traces, workers=workers))
+        print(
+            f"{workers:>3} worker{'s' if workers > 1 else ' '}: {elapsed:7.2f} s "
+            f"({baseline / elapsed:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares the old timestamp handling (strptime on every comparison, sorting by
+timestamp strings) to parsing once to integer nanoseconds.
+
+    python -m benchmarks.timestamps [--entries N] [--repeat N]
+"""
+
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from lib.timestamps import cached_timestamp_ns, sort_entries_by_timestamp
+
+LOG_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def make_entries(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2022, 11, 29, 16)
+
+    return [
+        {
+            "insertId": str(i),
+            "timestamp": (
+                start + timedelta(microseconds=rng.randrange(3600 * 10**6))
+            ).strftime("%Y-%m-%dT%H:%M:%S.%f")
+            + f"{rng.randrange(1000):03d}Z",
+        }
+        for i in range(count)
+    ]
+
+
+def old_parse(dt_str):
+    return datetime.strptime(f"{dt_str.split('.')[0]}Z", LOG_DATETIME_FORMAT)
+
+
+def old_pipeline(entries):
+    entries = sorted(entries, key=lambda e: e["timestamp"])
+    # window + per-entry datetimes, as before
+    return [old_parse(e["timestamp"]) for e in entries]
+
+
+def new_pipeline(entries):
+    # parse from scratch each run, same as for a new step's entries
+    cached_timestamp_ns.cache_clear()
+    return sort_entries_by_timestamp(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries)
+
+    for (name, fn) in [("strptime", old_pipeline), ("ns", new_pipeline)]:
+        best = min(timeit.repeat(lambda: fn(entries), number=1, repeat=args.repeat))
+        print(f"{name:>10}: {best * 1000:8.1f} ms for {args.entries} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import sys
+
+import coloredlogs
+from dotenv import load_dotenv
+
+from lib.spill import (
+    SpillStore,
+    concat_step_entries,
+    memory_budget_from_env,
+    write_json,
+)
+
+# init coloredlogs based on .env file
+load_dotenv()
+coloredlogs.auto_install()
+
+logger = logging.getLogger(__name__)
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Concatenate log entries from step response JSON files, sorted "
+        "by timestamp, each insertId once. Like concat_log_entries.jq, but within "
+        "a memory budget (one file is read at a time and entries beyond the budget "
+        "are spilled to a temp file)."
+    )
+    parser.add_argument("input", nargs="+", help="Step response JSON files")
+    parser.add_argument(
+        "--memory-budget",
+        action="store",
+        type=float,
+        help="RSS budget in MB (default: $MEMORY_BUDGET_MB, or unlimited)",
+    )
+
+    args = parser.parse_args()
+
+    memory_budget = (
+        int(args.memory_budget * 1024 * 1024)
+        if args.memory_budget
+        else memory_budget_from_env()
+    )
+
+    with SpillStore(memory_budget) as store:
+        concat_step_entries(args.input, store)
+        if store.spilled_count:
+            logger.info(f"Spilled {store.spilled_count} of {len(store)} log entries")
+
+        write_json(store, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    cli()
@@ -9,12 +9,20 @@ from copy import deepcopy
 import coloredlogs
 from dotenv import load_dotenv
 
+from lib.batch import correlate_batch
+from lib.columnar import export_log_entries
 from lib.correlate_logs import FilterTooBigError as FilterError
 from lib.correlate_logs import (
     extract_search_state_from_log_entries,
     find_entries,
     pretty_json,
 )
+from lib.log_entry import compact_entries_from_env
+from lib.profiling import RequestProfiler, profile_dir_from_env
+from lib.scheduler import QuotaWaitError as QuotaError
+from lib.spill import memory_budget_from_env, write_json
+from lib.tail import TAIL_INTERVAL, LiveTail
+from lib.trace_graph import TraceGraph, has_unqueried_traces
 
 # init coloredlogs based on .env file
 load_dotenv()
@@ -47,10 +55,126 @@ class NoMoreEntriesError(CliError):
     msg = "No log entries found with supplied query."
 
 
+class QuotaWaitError(CliError):
+    exit_status = 11
+    msg = "Logging API quota is used up. Rerun in a bit."
+
+
 def read_json_file(f):
     return json.loads(open(f, "r").read())
 
 
+def export_trace_graph(state, graph_file):
+    graph = TraceGraph.from_state(state)
+
+    with open(graph_file, "w") as f:
+        if graph_file.endswith(".dot"):
+            f.write(graph.to_dot())
+        else:
+            print(pretty_json(graph.to_json()), file=f)
+
+    logger.info(f"Exported trace graph to {graph_file}")
+
+
+def read_search_state(input_json, input_filename, is_logs):
+    if not is_logs:
+        return deepcopy(input_json)
+
+    search_state = extract_search_state_from_log_entries(input_json)
+
+    in_state_file = input_filename.replace(".json", ".input-state.json")
+    with open(in_state_file, "w") as f:
+        print(pretty_json(search_state), file=f)
+
+    return search_state
+
+
+# step options that batch_cli() doesn't support, by dest
+BATCH_UNSUPPORTED_ARGS = {
+    "graph_ordering": "--graph-ordering",
+    "graph_out": "--graph-out",
+    "max_entries": "--max-entries",
+    "preview": "--preview",
+    "tail": "--tail",
+    "profile": "--profile",
+    "memory_budget": "--memory-budget",
+    "compact_entries": "--compact-entries",
+    "export": "--export",
+}
+
+
+def batch_cli(args):
+    prev_search_states = [
+        read_search_state(read_json_file(f), f, args.logs) for f in args.file
+    ]
+
+    seeds = [{"prevSearchState": s} for s in prev_search_states]
+    try:
+        (results, merged) = correlate_batch(seeds)
+    except QuotaError as err:
+        logger.warning(str(err))
+        raise QuotaWaitError from err
+
+    for input_filename, result in zip(args.file, results):
+        if not result["data"]:
+            logger.warning(f"{input_filename}: {result['msg']}")
+            continue
+
+        out_state_file = input_filename.replace(".json", ".resp.json")
+        with open(out_state_file, "w") as f:
+            print(pretty_json(result["data"]), file=f)
+
+        logger.info(f"{input_filename}: {result['msg']}")
+
+    if not merged:
+        raise NoMoreEntriesError
+
+    logger.info(f"Found {merged['logEntryCount']} log entries across all seeds")
+
+    # output merged search state to stdout, same as for a single input
+    print(pretty_json(merged["searchState"]), file=sys.stdout)
+
+    if all(
+        r["data"] and r["data"]["searchState"] == s
+        for (r, s) in zip(results, prev_search_states)
+    ):
+        raise IdenticalSearchStateError
+
+    if not merged["logEntries"]:
+        raise NoMoreEntriesError
+
+
+def tail_cli(state, args, input_filename):
+    """
+    Prints new log entries as JSON lines as they come in, until interrupted.
+    The updated search state is saved on exit, so tailing can pick up again.
+    """
+    live_tail = LiveTail(state)
+
+    try:
+        for result in live_tail.run(args.tail_interval):
+            for entry in result["logEntries"]:
+                print(json.dumps(entry, separators=(",", ":")), file=sys.stdout)
+            sys.stdout.flush()
+
+            if result["newIds"]:
+                logger.info(f"Now tracking: {json.dumps(result['newIds'])}")
+    except KeyboardInterrupt:
+        pass
+    except FilterError as err:
+        raise FilterTooBigError from err
+    except QuotaError as err:
+        logger.warning(str(err))
+        raise QuotaWaitError from err
+    finally:
+        # whatever stopped the tail, keep the ids tracked so far
+        out_state_file = input_filename.replace(".json", ".tail-state.json")
+        with open(out_state_file, "w") as f:
+            print(pretty_json(live_tail.state), file=f)
+
+        logger.info(f"Saved tail state to {out_state_file}")
+
+
 def cli():
     parser = argparse.ArgumentParser(
         description="Find associated log entries from GCP logs JSON"
@@ -58,7 +182,11 @@ def cli():
 
     input_group = parser.add_mutually_exclusive_group(required=True)
     input_group.add_argument(
-        "-f", "--file", action="store", help="Filename for input JSON"
+        "-f",
+        "--file",
+        action="store",
+        nargs="+",
+        help="Filename for input JSON. Multiple files are correlated as a batch",
     )
     input_group.add_argument(
         "-i", "--stdin", action="store_true", help="Use stdin for input JSON"
@@ -72,43 +200,193 @@ def cli():
         "-s", "--state", action="store_true", help="treat input JSON as search state"
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "-g",
+        "--graph-ordering",
+        action="store_true",
+        help="query traces breadth-first from the seed via the trace graph",
+    )
+    parser.add_argument(
+        "--graph-out",
+        action="store",
+        help="Filename to export the trace graph to (JSON, or DOT for *.dot)",
+    )
+
+    parser.add_argument(
+        "--max-entries",
+        action="store",
+        type=int,
+        help="stop each query after this many entries and output a continuation "
+        "token with the search state, so the next step continues the query",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--preview",
+        action="store_true",
+        help="only fetch the first page of each id class's query and report "
+        "estimated counts and the first/last entries; the state is unchanged",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--tail",
+        action="store_true",
+        help="live-tail the correlation: print new log entries for the tracked "
+        "ids as JSON lines as they come in, until interrupted",
+    )
+    parser.add_argument(
+        "--tail-interval",
+        action="store",
+        type=float,
+        default=TAIL_INTERVAL,
+        help="seconds between tail refreshes (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store",
+        nargs="?",
+        const=profile_dir_from_env() or "./profiles",
+        metavar="DIR",
+        help="write a CPU profile and allocation snapshot of the step, with the "
+        "input state, to a new directory in DIR (default: $PROFILE_DIR, or "
+        "./profiles)",
+    )
+
+    parser.add_argument(
+        "--memory-budget",
+        action="store",
+        type=float,
+        help="RSS budget in MB; log entries beyond it are spilled to a temp file "
+        "(default: $MEMORY_BUDGET_MB, or unlimited)",
+    )
+
+    parser.add_argument(
+        "--compact-entries",
+        action="store_true",
+        default=compact_entries_from_env(),
+        help="keep log entries as compact JSON instead of dicts, to use less "
+        "memory (default: $COMPACT_LOG_ENTRIES)",
+    )
 
-    input_filename = args.file or "stdin.json"
-    input_file = open(args.file, "r") if args.file else sys.stdin
-    input_json = json.loads(input_file.read())
+    parser.add_argument(
+        "--export",
+        action="store",
+        help="Filename to export found log entries to in a columnar format "
+        "(*.parquet, or *.json for column JSON)",
+    )
 
-    prev_search_state = (
-        extract_search_state_from_log_entries(input_json)
-        if args.logs
-        else deepcopy(input_json)
+    args = parser.parse_args()
+
+    if args.file and len(args.file) > 1:
+        # batches run plain steps (see lib/batch.py), so these would be ignored
+        batch_unsupported = [
+            flag
+            for (dest, flag) in BATCH_UNSUPPORTED_ARGS.items()
+            if getattr(args, dest) != parser.get_default(dest)
+        ]
+        if batch_unsupported:
+            parser.error(
+                f"{', '.join(batch_unsupported)} can't be used with multiple files"
+            )
+
+        return batch_cli(args)
+
+    input_filename = args.file[0] if args.file else "stdin.json"
+    input_file = open(input_filename, "r") if args.file else sys.stdin
+
+    # don't hold on to the input JSON (e.g. a big logs download) once we have
+    # the search state
+    prev_search_state = read_search_state(
+        json.loads(input_file.read()), input_filename, args.logs
     )
 
-    if args.logs:
-        in_state_file = input_filename.replace(".json", ".input-state.json")
-        with open(in_state_file, "w") as f:
-            print(pretty_json(prev_search_state), file=f)
+    # a previous step's output state carries its continuation token, if any
+    continuation = prev_search_state.pop("continuation", None)
+
+    if args.tail:
+        return tail_cli(prev_search_state, args, input_filename)
 
     logger.debug(f"Using search state: {pretty_json(prev_search_state)}")
+
+    if args.profile:
+        with RequestProfiler(args.profile, "cli", prev_search_state):
+            return find_entries_cli(prev_search_state, continuation, args)
+
+    return find_entries_cli(prev_search_state, continuation, args)
+
+
+def find_entries_cli(prev_search_state, continuation, args):
+    input_filename = args.file[0] if args.file else "stdin.json"
+    memory_budget = (
+        int(args.memory_budget * 1024 * 1024)
+        if args.memory_budget
+        else memory_budget_from_env()
+    )
+
     try:
-        (resp_msg, resp_data) = find_entries(prev_search_state)
+        (resp_msg, resp_data) = find_entries(
+            prev_search_state,
+            graph_ordering=args.graph_ordering,
+            export_graph=bool(args.graph_out),
+            memory_budget=memory_budget,
+            max_entries=args.max_entries,
+            continuation=continuation,
+            preview=args.preview,
+            compact=args.compact_entries,
+        )
     except FilterError as err:
         raise FilterTooBigError from err
+    except QuotaError as err:
+        logger.warning(str(err))
+        raise QuotaWaitError from err
+
+    if args.graph_out:
+        export_trace_graph(resp_data["searchState"], args.graph_out)
+
+    if args.export:
+        export_log_entries(resp_data["logEntries"], args.export)
 
     out_state_file = input_filename.replace(".json", ".resp.json")
     with open(out_state_file, "w") as f:
-        print(pretty_json(resp_data), file=f)
+        # streams spilled log entries back from disk, if any
+        write_json(resp_data, f)
+        f.write("\n")
 
     logger.info(resp_msg)
 
+    if args.preview:
+        # same state out as in (continuation included), so the next step does
+        # the full fetch
+        logger.info(f"Preview: {pretty_json(resp_data['preview'])}")
+        out_state = resp_data["searchState"]
+        if continuation:
+            out_state = dict(out_state, continuation=continuation)
+
+        print(pretty_json(out_state), file=sys.stdout)
+        return
+
     # output search state to stdout so it can be redirected/saved however the
-    # harness sees fit
-    print(pretty_json(resp_data["searchState"]), file=sys.stdout)
+    # harness sees fit. a continuation token rides along so the next step picks
+    # up where this one stopped.
+    out_state = resp_data["searchState"]
+    if resp_data.get("continuation"):
+        out_state = dict(out_state, continuation=resp_data["continuation"])
+
+    print(pretty_json(out_state), file=sys.stdout)
+
+    if resp_data.get("continuation"):
+        return
 
     if resp_data["searchState"] == prev_search_state:
         raise IdenticalSearchStateError
 
-    if not resp_data["logEntries"]:
+    # graph-ordered steps query a few traces at a time, so keep going while
+    # there are traces left even if this step found nothing new
+    if not resp_data["logEntries"] and not (
+        args.graph_ordering and has_unqueried_traces(resp_data["searchState"])
+    ):
         raise NoMoreEntriesError
 
 
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import coloredlogs
+from dotenv import load_dotenv
+
+from lib.correlate_logs import pretty_json
+from lib.log_entry import compact_entries_from_env
+from lib.seeds import (
+    DEFAULT_SEED_ITERATIONS,
+    DEFAULT_SEED_WORKERS,
+    SeedRunner,
+    seed_name,
+)
+from lib.spill import write_json
+
+# init coloredlogs based on .env file
+load_dotenv()
+coloredlogs.auto_install()
+
+logger = logging.getLogger(__name__)
+
+# same as the correlate_logs wrapper, paths are relative to the project root
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_seed_files(paths):
+    """Seed files from the given files and directories (their *.json files)."""
+    seed_files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            seed_files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            seed_files.append(path)
+
+    return [os.path.abspath(f) for f in seed_files]
+
+
+def post_process(seed_file, traces_dir):
+    """Runs the correlate_logs wrapper's post-processing on a seed's steps."""
+    trace_path = os.path.join(PROJECT_DIR, traces_dir, seed_name(seed_file))
+    # seeds are post-processed in parallel already
+    env = dict(os.environ, TRACES_DIR=traces_dir)
+    env.setdefault("SUMMARY_WORKERS", "1")
+
+    with open(os.path.join(trace_path, "post_process.log"), "w") as log:
+        status = subprocess.run(
+            ["./correlate_logs", "-s", seed_file],
+            cwd=PROJECT_DIR,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        ).returncode
+
+    if status:
+        logger.error(f"{seed_name(seed_file)}: post-processing failed, see {log.name}")
+
+    return status == 0
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Correlate many seed files (GCP logs JSON) at once. Seeds run "
+        "concurrently, share log entries (deduplicated by insertId) and skip traces "
+        "another seed already covers. Each seed's results go to "
+        "./$TRACES_DIR/<seed name>/, same as the correlate_logs wrapper's, plus a "
+        "combined report and log entries in ./$TRACES_DIR/<name>/."
+    )
+    parser.add_argument(
+        "seeds", nargs="+", help="Seed files, or directories of *.json seed files"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        action="store",
+        type=int,
+        default=DEFAULT_SEED_WORKERS,
+        help="seeds to correlate at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-n",
+        "--name",
+        action="store",
+        default="seeds",
+        help="name of the combined results dir (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-f",
+        "--fresh",
+        action="store_true",
+        help="start fresh: delete the seeds' existing results",
+    )
+    parser.add_argument(
+        "--traces-dir",
+        action="store",
+        default=os.environ.get("TRACES_DIR", "traces"),
+        help="results dir, relative to the project root (default: $TRACES_DIR, or "
+        "traces)",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        action="store",
+        type=int,
+        default=int(os.environ.get("MAX_ITERATIONS", DEFAULT_SEED_ITERATIONS)),
+        help="steps per seed (default: $MAX_ITERATIONS, or %(default)s)",
+    )
+    parser.add_argument(
+        "--max-entries",
+        action="store",
+        type=int,
+        default=os.environ.get("MAX_ENTRIES") or None,
+        help="stop each query after this many entries and continue it in the next "
+        "step (default: $MAX_ENTRIES)",
+    )
+    parser.add_argument(
+        "--compact-entries",
+        action="store_true",
+        default=compact_entries_from_env(),
+        help="keep log entries as compact JSON instead of dicts, to use less "
+        "memory (default: $COMPACT_LOG_ENTRIES)",
+    )
+    parser.add_argument(
+        "-q",
+        "--query-only",
+        action="store_true",
+        help="skip post-processing (indexes, summaries and exports) of each seed",
+    )
+
+    args = parser.parse_args()
+
+    seed_files = find_seed_files(args.seeds)
+    if not seed_files:
+        parser.error("No seed files found")
+
+    names = [seed_name(f) for f in seed_files]
+    if len(set(names)) < len(names) or args.name in names:
+        parser.error("Seed names (file names without .json) must be unique")
+
+    traces_dir = os.path.join(PROJECT_DIR, args.traces_dir)
+    trace_paths = [os.path.join(traces_dir, n) for n in names + [args.name]]
+    existing = [p for p in trace_paths if os.path.exists(p)]
+    if existing and not args.fresh:
+        parser.error(f"Results exist already (use -f to start fresh): {existing}")
+
+    for path in existing:
+        logger.info(f"Deleting {path}")
+        shutil.rmtree(path)
+
+    runner = SeedRunner(
+        traces_dir,
+        max_workers=args.workers,
+        max_iterations=args.max_iterations,
+        max_entries=args.max_entries,
+        compact=args.compact_entries,
+    )
+    logger.info(f"Correlating {len(seed_files)} seeds ({args.workers} at a time)")
+    report = runner.run(seed_files)
+
+    if not args.query_only:
+        logger.info("Post-processing seeds...")
+        ok_seeds = [
+            (f, s) for (f, s) in zip(seed_files, report["seeds"]) if s["status"] == "ok"
+        ]
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            statuses = pool.map(
+                lambda f: post_process(f, args.traces_dir), [f for (f, _) in ok_seeds]
+            )
+            for ((_, seed), ok) in zip(ok_seeds, statuses):
+                seed["postProcessed"] = ok
+
+    report_path = os.path.join(traces_dir, args.name)
+    os.makedirs(report_path)
+
+    with open(os.path.join(report_path, "log_entries.json"), "w") as f:
+        write_json(runner.store.entries(), f)
+        f.write("\n")
+
+    with open(os.path.join(report_path, "report.json"), "w") as f:
+        print(pretty_json(report), file=f)
+
+    failed = [s["name"] for s in report["seeds"] if s["status"] != "ok"]
+    logger.info(
+        f"Found {report['logEntryCount']} log entries across {len(seed_files)} seeds "
+        f"in {report['elapsedSeconds']:.1f}s; saved to {report_path}"
+    )
+    if failed:
+        logger.error(f"Failed seeds: {json.dumps(failed)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
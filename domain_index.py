@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+
+import coloredlogs
+from dotenv import load_dotenv
+
+from lib.correlate_logs import PAST_DATETIME_REGEX, parse_datetime_range
+from lib.domain_index import DOMAIN_INDEX_ENV_VAR, DOMAIN_OBJECT_PATTERNS, DomainIndex
+from lib.timestamps import datetime_to_ns, parse_timestamp_ns
+
+# init coloredlogs based on .env file
+load_dotenv()
+coloredlogs.auto_install()
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time_ns(value):
+    """An RFC3339 timestamp, or a duration into the past (e.g. "P7D", "PT12H")."""
+    if re.match(PAST_DATETIME_REGEX, value):
+        (start_dt, _) = parse_datetime_range(value)
+        return datetime_to_ns(start_dt)
+
+    try:
+        return parse_timestamp_ns(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err)) from err
+
+
+def read_log_entries(filename):
+    """Log entries from a logs download, log_entries.json or a step's response."""
+    with open(filename, "r") as f:
+        data = json.load(f)
+
+    if isinstance(data, dict):
+        data = (data.get("data") or data).get("logEntries") or []
+
+    return data
+
+
+def lookup_cli(index, args):
+    result = index.lookup(args.kind, args.id, args.since, args.until)
+    if not result:
+        logger.info(f"Nothing found for {args.kind} {args.id}")
+        return 1
+
+    logger.info(
+        f"Found {len(result['traces'])} traces for {args.kind} {args.id} "
+        f"({result['timeRangeStart']} - {result['timeRangeEnd']})"
+    )
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def add_cli(index, args):
+    for filename in args.files:
+        count = index.record(read_log_entries(filename))
+        logger.info(f"{filename}: indexed {count} domain object refs")
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Look up which traces and requests mentioned a post, recipe or "
+        "recipe collection, from the index that correlations feed (see "
+        f"${DOMAIN_INDEX_ENV_VAR})."
+    )
+    parser.add_argument(
+        "--index",
+        default=os.environ.get(DOMAIN_INDEX_ENV_VAR),
+        help=f"Domain index SQLite file (default: ${DOMAIN_INDEX_ENV_VAR})",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    lookup_parser = subparsers.add_parser(
+        "lookup", help="Print the traces that mention a domain object, as JSON"
+    )
+    lookup_parser.add_argument("kind", choices=list(DOMAIN_OBJECT_PATTERNS))
+    lookup_parser.add_argument("id")
+    lookup_parser.add_argument(
+        "--since",
+        type=parse_time_ns,
+        help='Only traces since this time (e.g. "2022-11-29T16:00:00Z", or "P7D" '
+        "for the past week)",
+    )
+    lookup_parser.add_argument(
+        "--until", type=parse_time_ns, help="Only traces until this time"
+    )
+
+    add_parser = subparsers.add_parser(
+        "add",
+        help="Index log entries from files, e.g. existing traces/*/log_entries.json",
+    )
+    add_parser.add_argument("files", nargs="+")
+
+    args = parser.parse_args()
+
+    if not args.index:
+        parser.error(f"--index or ${DOMAIN_INDEX_ENV_VAR} is required")
+
+    index = DomainIndex(args.index)
+
+    if args.command == "lookup":
+        return lookup_cli(index, args)
+
+    return add_cli(index, args)
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+import coloredlogs
+from dotenv import load_dotenv
+
+from lib.columnar import export_log_entries
+
+# init coloredlogs based on .env file
+load_dotenv()
+coloredlogs.auto_install()
+
+logger = logging.getLogger(__name__)
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Export log entries JSON (e.g. log_entries.json) in a columnar "
+        "format with pre-parsed timestamps"
+    )
+    parser.add_argument("input", help="Filename for input log entries JSON")
+    parser.add_argument(
+        "output", help="Filename for output (*.parquet, or *.json for column JSON)"
+    )
+
+    args = parser.parse_args()
+
+    if os.path.abspath(args.output) == os.path.abspath(args.input):
+        parser.error("Output would overwrite the input log entries")
+
+    with open(args.input, "r") as f:
+        entries = json.load(f)
+
+    try:
+        export_log_entries(entries, args.output)
+    except (RuntimeError, ValueError) as err:
+        logger.error(err)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,358 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .correlate_logs import (
+    FilterTooBigError,
+    LogsQueryInput,
+    NoEntriesError,
+    create_logs_filter_from_search_state,
+    expand_datetime_window,
+    find_entries,
+    format_gcp_time,
+    gcp_logs_url,
+    get_state_from_url,
+    merge_project_entries,
+    merge_search_states,
+    parse_gcp_logs_url,
+    query_logs,
+    query_projects,
+    state_projects,
+    state_time_range,
+)
+from .timestamps import parse_timestamp_ns, sort_entries_by_timestamp
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 50
+DEFAULT_BATCH_WORKERS = 8
+
+
+class SharedQueryCache:
+    """
+    Memoizes query results by project and query text so that overlapping seeds
+    which end up with identical queries only hit the Logging API once. Concurrent
+    callers of the same query wait on the first caller's result instead of
+    re-querying.
+
+    Only byte-identical queries are shared; ids that some seeds have in common
+    are shared by SharedIds instead.
+    """
+
+    def __init__(self, query_fn=None):
+        self.query_fn = query_fn or query_logs
+        self.queries_run = 0
+        self.queries_shared = 0
+
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def query(self, query, project=None):
+        key = (project, query)
+
+        with self._lock:
+            future = self._futures.get(key)
+            is_owner = future is None
+
+            if is_owner:
+                future = self._futures[key] = Future()
+                self.queries_run += 1
+            else:
+                self.queries_shared += 1
+
+        if is_owner:
+            try:
+                future.set_result(self.query_fn(query, project))
+            except Exception as err:
+                future.set_exception(err)
+
+        return future.result()
+
+
+# state keys of the ids a step queries
+SHARED_ID_KEYS = ["traces", "operationsNew", "tasksNew"]
+
+
+class SharedIds:
+    """
+    Ids that several seeds of a batch step would each query. They're queried
+    once, over the union of those seeds' time windows, and each seed gets the
+    entries that match its own ids and window and that it doesn't know yet
+    (same as its own query would return).
+
+    States are the seeds' states as find_entries() queries them, i.e. with
+    expanded time windows (see expanded_state()).
+    """
+
+    def __init__(self, states):
+        counts = Counter(
+            (k, value)
+            for s in states
+            for k in SHARED_ID_KEYS
+            for value in set(s.get(k) or [])
+        )
+        self.ids = {
+            k: set(value for ((key, value), n) in counts.items() if key == k and n > 1)
+            for k in SHARED_ID_KEYS
+        }
+        self.states = [s for s in states if any(self.ids_for(s).values())]
+        self.entries = []
+
+    def __bool__(self):
+        return bool(self.states)
+
+    def ids_for(self, state):
+        return {k: self.ids[k] & set(state.get(k) or []) for k in SHARED_ID_KEYS}
+
+    def fetch(self, query_fn=None):
+        """Queries the shared ids once (per project, see LogsQueryInput)."""
+        if not self.states:
+            return
+
+        state = merge_search_states(
+            [dict(s, insertIds=[], projects=state_projects(s)) for s in self.states]
+        )
+        state.update({k: sorted(v) for (k, v) in self.ids.items()})
+
+        query_input = LogsQueryInput(state)
+        entries_by_key = query_projects(
+            query_input.queries,
+            query_fn,
+            plans=query_input.plans,
+            planner=query_input.planner,
+        )
+        self.entries = merge_project_entries(entries_by_key)
+
+    def entries_for(self, state):
+        """The fetched entries the state's own query would have returned."""
+        ids = self.ids_for(state)
+        traces = set(
+            f"projects/{p}/traces/{t}"
+            for p in state_projects(state)
+            for t in ids["traces"]
+        )
+        (start_ns, end_ns) = (parse_timestamp_ns(t) for t in state_time_range(state))
+        known = set(state.get("insertIds") or [])
+
+        return [
+            e
+            for e in self.entries
+            if e.get("insertId") not in known
+            and start_ns <= parse_timestamp_ns(e["timestamp"]) <= end_ns
+            and (
+                e.get("trace") in traces
+                or (e.get("operation") or {}).get("id") in ids["operationsNew"]
+                or (e.get("protoPayload") or {}).get("taskName") in ids["tasksNew"]
+            )
+        ]
+
+
+def expanded_state(state):
+    """The state with the time window find_entries() queries."""
+    (start_dt, end_dt) = expand_datetime_window(*state_time_range(state))
+
+    return dict(
+        state,
+        timeRangeStart=format_gcp_time(start_dt),
+        timeRangeEnd=format_gcp_time(end_dt),
+    )
+
+
+class EntryStore:
+    """
+    Thread-safe collection of log entries, deduplicated by insertId.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, insert_id):
+        return insert_id in self._entries
+
+    def add(self, entries):
+        """Adds entries to the store, returning only those not seen before."""
+        added = []
+
+        with self._lock:
+            for entry in entries:
+                insert_id = entry.get("insertId")
+                if insert_id in self._entries:
+                    continue
+
+                self._entries[insert_id] = entry
+                added.append(entry)
+
+        return added
+
+    def entries(self):
+        with self._lock:
+            entries = list(self._entries.values())
+
+        return sort_entries_by_timestamp(entries)
+
+
+# ---
+
+
+def parse_batch_seeds(urls=None, prev_states=None, prev_url=None):
+    seeds = [{"url": url} for url in urls or []] + [
+        {"prevSearchState": s, "prevUrl": prev_url} for s in prev_states or []
+    ]
+
+    if len(seeds) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch is limited to {MAX_BATCH_SIZE} seeds")
+
+    return seeds
+
+
+def resolve_seed(seed, query_fn=None):
+    """Returns (url_params, url_qs, search state) for a seed."""
+    url = seed.get("url")
+    (url_params, url_qs) = parse_gcp_logs_url(url or seed.get("prevUrl") or "")
+
+    prev_state = (
+        get_state_from_url(url_params, url_qs, query_fn=query_fn)
+        if url
+        else seed["prevSearchState"]
+    )
+
+    return (url_params, url_qs, prev_state)
+
+
+def correlate_seed(seed, query_fn=None, shared=None):
+    """Runs one step for a (resolved, see resolve_seed()) seed."""
+    (url_params, url_qs, prev_state) = seed
+    if not shared:
+        return find_entries(prev_state, url_params, url_qs, query_fn=query_fn)
+
+    state = expanded_state(prev_state)
+    return find_entries(
+        prev_state,
+        url_params,
+        url_qs,
+        query_fn=query_fn,
+        shared_ids=shared.ids_for(state),
+        shared_entries=shared.entries_for(state),
+    )
+
+
+def _seed_result(fn, *args, **kwargs):
+    """Runs a seed's work, mapping errors to a seed result."""
+    try:
+        return fn(*args, **kwargs)
+
+    except NoEntriesError:
+        return {"status": "ok", "msg": "Could not find any log entries", "data": None}
+    except FilterTooBigError:
+        resp_msg = "Computed filter is too big for GCP Logging API."
+        return {"status": "error", "msg": resp_msg, "data": None}
+    except ValueError:
+        return {"status": "error", "msg": "Incorrect DateTime format", "data": None}
+    except KeyError:
+        return {"status": "error", "msg": "Missing query param", "data": None}
+
+
+def _correlate_seed_result(seed, cache, shared):
+    # seeds that could not be resolved have their result already
+    if isinstance(seed, dict):
+        return seed
+
+    (resp_msg, resp_data) = correlate_seed(seed, query_fn=cache.query, shared=shared)
+    return {"status": "ok", "msg": resp_msg, "data": resp_data}
+
+
+def correlate_batch(seeds, max_workers=DEFAULT_BATCH_WORKERS, query_fn=None):
+    """
+    Runs one correlation step for each seed concurrently. Ids that several seeds
+    would query are queried once (see SharedIds), identical queries are shared
+    via SharedQueryCache and log entries are deduplicated by insertId for the
+    merged view.
+
+    Returns (results, merged), where results are per-seed response dicts (in
+    seed order) and merged is a response data dict for all seeds combined.
+    """
+    cache = SharedQueryCache(query_fn)
+    store = EntryStore()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        seeds = list(
+            pool.map(lambda s: _seed_result(resolve_seed, s, cache.query), seeds)
+        )
+
+        shared = SharedIds(
+            [
+                expanded_state(state)
+                for s in seeds
+                if not isinstance(s, dict)
+                for state in [s[2]]
+            ]
+        )
+        try:
+            shared.fetch(cache.query)
+        except FilterTooBigError as err:
+            # each seed queries its own ids instead
+            logger.warning(f"Could not query shared ids: {err!r}")
+            shared = None
+
+        results = list(
+            pool.map(
+                lambda s: _seed_result(_correlate_seed_result, s, cache, shared), seeds
+            )
+        )
+
+    for result in results:
+        if result["data"]:
+            store.add(result["data"]["logEntries"])
+
+    logger.info(
+        f"Batch of {len(seeds)} seeds ran {cache.queries_run} queries "
+        f"({cache.queries_shared} shared); "
+        f"{sum(len(v) for v in shared.ids.values()) if shared else 0} ids shared"
+    )
+
+    states = [r["data"]["searchState"] for r in results if r["data"]]
+    if not states:
+        return (results, None)
+
+    merged_state = merge_search_states(states)
+    merged_filter = create_logs_filter_from_search_state(merged_state)
+    merged_entries = store.entries()
+
+    merged = {
+        "searchState": merged_state,
+        "filter": merged_filter,
+        "logEntries": merged_entries,
+        "logEntryCount": len(merged_entries),
+        "url": gcp_logs_url(
+            merged_filter,
+            state_time_range(merged_state),
+            url_query={"project": [merged_state.get("project")]},
+        ),
+    }
+
+    return (results, merged)
+
+
+def compact_batch_results(results):
+    """
+    Replaces each seed's log entries with their insertIds, since the entries
+    themselves are returned (once) in the merged view.
+    """
+    compacted = []
+
+    for result in results:
+        result = dict(result)
+
+        if result["data"]:
+            data = dict(result["data"])
+            data["logEntryIds"] = [e.get("insertId") for e in data.pop("logEntries")]
+            result["data"] = data
+
+        compacted.append(result)
+
+    return compacted
@@ -0,0 +1,205 @@
+import threading
+import unittest
+from unittest import mock
+
+from .batch import (
+    EntryStore,
+    SharedQueryCache,
+    compact_batch_results,
+    correlate_batch,
+    merge_search_states,
+)
+from .correlate_logs import QUERY_PLANNER
+from .testing import mock_entry, mock_state
+
+
+class SharedQueryCacheTest(unittest.TestCase):
+    def test_runs_identical_queries_once(self):
+        calls = []
+
+        def query_fn(query, project=None):
+            calls.append(query)
+            return [query]
+
+        cache = SharedQueryCache(query_fn)
+        self.assertEqual(cache.query("foo"), ["foo"])
+        self.assertEqual(cache.query("foo"), ["foo"])
+        self.assertEqual(cache.query("bar"), ["bar"])
+
+        self.assertEqual(calls, ["foo", "bar"])
+        self.assertEqual(cache.queries_run, 2)
+        self.assertEqual(cache.queries_shared, 1)
+
+    def test_concurrent_callers_share_result(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def query_fn(query, project=None):
+            calls.append(query)
+            started.set()
+            release.wait()
+            return [query]
+
+        cache = SharedQueryCache(query_fn)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.query("foo")))
+            for _ in range(4)
+        ]
+        threads[0].start()
+        started.wait()
+        for t in threads[1:]:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(calls, ["foo"])
+        self.assertEqual(results, [["foo"]] * 4)
+
+    def test_shares_errors(self):
+        def query_fn(query, project=None):
+            raise RuntimeError(query)
+
+        cache = SharedQueryCache(query_fn)
+        with self.assertRaises(RuntimeError):
+            cache.query("foo")
+        with self.assertRaises(RuntimeError):
+            cache.query("foo")
+
+
+class EntryStoreTest(unittest.TestCase):
+    def test_dedupes_by_insert_id(self):
+        store = EntryStore()
+
+        added = store.add([mock_entry("1"), mock_entry("2")])
+        self.assertEqual(len(added), 2)
+
+        added = store.add([mock_entry("2"), mock_entry("3")])
+        self.assertEqual([e["insertId"] for e in added], ["3"])
+        self.assertEqual(len(store), 3)
+        self.assertIn("1", store)
+
+    def test_entries_sorted_by_timestamp(self):
+        store = EntryStore()
+        store.add(
+            [
+                mock_entry("1", 2),
+                mock_entry("2", 1),
+            ]
+        )
+        self.assertEqual([e["insertId"] for e in store.entries()], ["2", "1"])
+
+
+class MergeSearchStatesTest(unittest.TestCase):
+    def test_widens_time_range_and_unions_lists(self):
+        state1 = {
+            "project": "gen-prod",
+            "timeRangeStart": "2022-11-29T16:00:00.000Z",
+            "timeRangeEnd": "2022-11-29T16:05:00.000Z",
+            "traces": ["a", "b"],
+            "tracesNew": ["b"],
+        }
+        state2 = {
+            "project": "gen-prod",
+            "timeRangeStart": "2022-11-29T15:00:00.000Z",
+            "timeRangeEnd": "2022-11-29T16:01:00.000Z",
+            "traces": ["b", "c"],
+            "tracesNew": ["c"],
+        }
+
+        actual = merge_search_states([state1, state2])
+        expected = {
+            "project": "gen-prod",
+            "timeRangeStart": "2022-11-29T15:00:00.000Z",
+            "timeRangeEnd": "2022-11-29T16:05:00.000Z",
+            "traces": ["a", "b", "c"],
+            "tracesNew": ["b", "c"],
+        }
+        self.assertEqual(actual, expected)
+
+
+class CorrelateBatchTest(unittest.TestCase):
+    def setUp(self):
+        # seeds only share queries when they're planned the same way
+        patcher = mock.patch.object(QUERY_PLANNER, "explore_rate", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shares_identical_queries_and_dedupes_entries(self):
+        calls = []
+
+        def query_fn(query, project=None):
+            calls.append(query)
+            if "abc" in query:
+                return [mock_entry("1"), mock_entry("2")]
+            return [mock_entry("2", trace="def")]
+
+        seeds = [
+            {"prevSearchState": mock_state(["abc"])},
+            {"prevSearchState": mock_state(["abc"])},
+            {"prevSearchState": mock_state(["def"])},
+        ]
+
+        (results, merged) = correlate_batch(seeds, query_fn=query_fn)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([r["status"] for r in results], ["ok"] * 3)
+        self.assertEqual(results[0]["data"]["logEntryCount"], 2)
+        self.assertEqual(results[2]["data"]["logEntryCount"], 1)
+        self.assertEqual(merged["logEntryCount"], 2)
+        self.assertEqual(merged["searchState"]["insertIds"], ["1", "2"])
+
+    def test_queries_shared_ids_once(self):
+        calls = []
+        entries = [
+            mock_entry("1", timestamp="2022-11-29T15:00:00.000Z"),
+            mock_entry("2"),
+            mock_entry("3", trace="def"),
+            mock_entry("4", trace="ghi"),
+        ]
+
+        def query_fn(query, project=None):
+            calls.append(query)
+            return [e for e in entries if e["trace"].split("/")[-1] in query]
+
+        state1 = mock_state(["abc", "def"])
+        state2 = dict(
+            mock_state(["abc", "ghi"]),
+            timeRangeStart="2022-11-29T14:59:00.000Z",
+            timeRangeEnd="2022-11-29T15:01:00.000Z",
+        )
+        seeds = [{"prevSearchState": state1}, {"prevSearchState": state2}]
+
+        (results, merged) = correlate_batch(seeds, query_fn=query_fn)
+
+        # abc once (over both windows), then def and ghi
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sum("abc" in q for q in calls), 1)
+        self.assertEqual(
+            [sorted(e["insertId"] for e in r["data"]["logEntries"]) for r in results],
+            [["2", "3"], ["1", "4"]],
+        )
+        self.assertEqual(merged["logEntryCount"], 4)
+
+    def test_returns_no_merged_view_without_results(self):
+        (results, merged) = correlate_batch([{"url": "http://foo/bar"}])
+
+        self.assertEqual(results[0]["status"], "error")
+        self.assertIsNone(merged)
+
+
+class CompactBatchResultsTest(unittest.TestCase):
+    def test_replaces_entries_with_ids(self):
+        results = [
+            {"status": "ok", "msg": "", "data": {"logEntries": [mock_entry("1")]}},
+            {"status": "ok", "msg": "", "data": None},
+        ]
+
+        actual = compact_batch_results(results)
+
+        self.assertEqual(actual[0]["data"], {"logEntryIds": ["1"]})
+        self.assertIsNone(actual[1]["data"])
+        # original results are left as-is
+        self.assertIn("logEntries", results[0]["data"])
@@ -0,0 +1,109 @@
+import json
+import logging
+
+from .log_entry import as_dict
+from .timestamps import entry_timestamp_end_ns, entry_timestamp_ns, parse_duration_ns
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_KINDS = ["protoPayload", "jsonPayload", "textPayload"]
+
+# column name -> (type, value getter). types are arrow-ish type names so the
+# parquet writer can build a schema; the JSON writer ignores them.
+COLUMNS = {
+    "insert_id": ("string", lambda e: e.get("insertId")),
+    "timestamp_ns": ("int64", entry_timestamp_ns),
+    "end_timestamp_ns": ("int64", entry_timestamp_end_ns),
+    "trace": ("string", lambda e: _trace_id(e.get("trace"))),
+    "request_id": ("string", lambda e: _get(e, "protoPayload", "requestId")),
+    "operation_id": ("string", lambda e: _get(e, "operation", "id")),
+    "module_id": ("string", lambda e: _get(e, "resource", "labels", "module_id")),
+    "version_id": ("string", lambda e: _get(e, "resource", "labels", "version_id")),
+    "project_id": ("string", lambda e: _get(e, "resource", "labels", "project_id")),
+    "severity": ("string", lambda e: e.get("severity")),
+    "status": ("int32", lambda e: _get(e, "protoPayload", "status")),
+    "latency_ns": (
+        "int64",
+        lambda e: parse_duration_ns(_get(e, "protoPayload", "latency")),
+    ),
+    "payload_kind": ("string", lambda e: _payload_kind(e)),
+    # nested payloads go in a side column as JSON text; parse on demand
+    "payload": ("string", lambda e: _payload_json(e)),
+}
+
+
+def _get(entry, *path):
+    value = entry
+    for k in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(k)
+
+    return value
+
+
+def _trace_id(trace):
+    return trace.split("/")[-1] if trace else None
+
+
+def _payload_kind(entry):
+    return next((k for k in PAYLOAD_KINDS if k in entry), None)
+
+
+def _payload_json(entry):
+    kind = _payload_kind(entry)
+    return json.dumps(entry[kind], separators=(",", ":")) if kind else None
+
+
+def log_entries_to_columns(entries):
+    """
+    Converts log entries to a dict of typed columns (column name -> list of
+    values), with timestamps and latencies pre-parsed to integer nanoseconds.
+    """
+    columns = {name: [] for name in COLUMNS}
+
+    for entry in entries:
+        # decode compact entries once, not once per column
+        entry = as_dict(entry)
+        for name, (_, getter) in COLUMNS.items():
+            columns[name].append(getter(entry))
+
+    return columns
+
+
+# ---
+
+
+def write_columns_parquet(columns, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as err:
+        raise RuntimeError(
+            "Parquet export requires pyarrow (pip install pyarrow)"
+        ) from err
+
+    schema = pa.schema(
+        [(name, getattr(pa, type_name)()) for name, (type_name, _) in COLUMNS.items()]
+    )
+    pq.write_table(pa.table(columns, schema=schema), path)
+
+
+def write_columns_json(columns, path):
+    # column-oriented JSON; e.g. pandas.DataFrame(json.load(f)) loads it as-is
+    with open(path, "w") as f:
+        json.dump(columns, f, separators=(",", ":"))
+
+
+def export_log_entries(entries, path):
+    """Writes log entries in a columnar format based on the file extension."""
+    columns = log_entries_to_columns(entries)
+
+    if path.endswith(".parquet"):
+        write_columns_parquet(columns, path)
+    elif path.endswith(".json"):
+        write_columns_json(columns, path)
+    else:
+        raise ValueError(f"Unknown columnar export format: {path}")
+
+    logger.info(f"Exported {len(entries)} log entries to {path}")
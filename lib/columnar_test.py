@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+
+from .columnar import export_log_entries, log_entries_to_columns
+from .timestamps import parse_timestamp_ns
+
+
+def mock_entries():
+    return [
+        {
+            "insertId": "1",
+            "timestamp": "2022-11-29T16:00:00.123456Z",
+            "trace": "projects/gen-prod/traces/abc",
+            "resource": {"labels": {"module_id": "default", "version_id": "v1"}},
+            "protoPayload": {
+                "requestId": "req1",
+                "endTime": "2022-11-29T16:00:01.5Z",
+                "status": 200,
+                "latency": "1.376544s",
+                "line": [{"logMessage": "hi"}],
+            },
+        },
+        {
+            "insertId": "2",
+            "timestamp": "2022-11-29T16:00:02Z",
+            "jsonPayload": {"pubSubMessage": {"message_id": "3"}},
+        },
+    ]
+
+
+class LogEntriesToColumnsTest(unittest.TestCase):
+    def test_builds_typed_columns(self):
+        columns = log_entries_to_columns(mock_entries())
+
+        self.assertEqual(columns["insert_id"], ["1", "2"])
+        self.assertEqual(
+            columns["timestamp_ns"],
+            [
+                parse_timestamp_ns("2022-11-29T16:00:00.123456Z"),
+                parse_timestamp_ns("2022-11-29T16:00:02Z"),
+            ],
+        )
+        # entries without an end time end when they start
+        self.assertEqual(
+            columns["end_timestamp_ns"],
+            [
+                parse_timestamp_ns("2022-11-29T16:00:01.5Z"),
+                parse_timestamp_ns("2022-11-29T16:00:02Z"),
+            ],
+        )
+        self.assertEqual(columns["trace"], ["abc", None])
+        self.assertEqual(columns["request_id"], ["req1", None])
+        self.assertEqual(columns["module_id"], ["default", None])
+        self.assertEqual(columns["status"], [200, None])
+        self.assertEqual(columns["latency_ns"], [1376544000, None])
+        self.assertEqual(columns["payload_kind"], ["protoPayload", "jsonPayload"])
+        self.assertEqual(
+            json.loads(columns["payload"][1]), {"pubSubMessage": {"message_id": "3"}}
+        )
+
+
+class ExportLogEntriesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_exports_column_json(self):
+        path = os.path.join(self.tmp_dir.name, "entries.json")
+        export_log_entries(mock_entries(), path)
+
+        with open(path) as f:
+            self.assertEqual(json.load(f)["insert_id"], ["1", "2"])
+
+    def test_exports_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        path = os.path.join(self.tmp_dir.name, "entries.parquet")
+        export_log_entries(mock_entries(), path)
+
+        table = pq.read_table(path)
+        self.assertEqual(table.column("latency_ns").to_pylist(), [1376544000, None])
+        self.assertEqual(str(table.schema.field("timestamp_ns").type), "int64")
+
+    def test_raises_for_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_log_entries(mock_entries(), "entries.csv")
@@ -2,14 +2,36 @@ import json
 import logging
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime, timedelta
 from textwrap import dedent
 from urllib.parse import parse_qs, quote, unquote, urlencode, urlparse
 
-import google.cloud.logging
 import jq
 
+from .cursors import LogsQueryCursor, decode_continuation, encode_continuation
+from .domain_index import record_domain_objects
+from .log_entry import LogEntry, as_dict, json_default, log_entries_json_text
+from .logs_clients import LogsClientManager, RawLogEntries
+from .query_planner import QUERY_EXPLORE_RATE, QueryPlanner
+from .scheduler import QuotaScheduler
+from .spill import SpillStore
+from .timestamps import (
+    entry_timestamp_ns,
+    ns_to_datetime,
+    parse_timestamp_ns,
+    sort_entries_by_timestamp,
+    timedelta_to_ns,
+)
+from .trace_graph import (
+    graph_query_state,
+    has_pending_queries,
+    update_graph_state,
+    without_graph_state,
+)
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
@@ -17,7 +39,9 @@ logger.setLevel(logging.DEBUG)
 # so raise its log level a bit.
 logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
 
-LOGS_CLIENT = google.cloud.logging.Client()
+# see LOGS_TRANSPORT, LOGS_PAGE_SIZE and LOGS_POOL_SIZE in lib/logs_clients.py
+LOGS_CLIENTS = LogsClientManager()
+LOGS_SCHEDULER = QuotaScheduler()
 
 CURRENT_PATH = os.path.abspath(os.path.dirname(__file__))
 JQ_FILTER_FILE = "gcp_logs_filter.jq"
@@ -27,8 +51,11 @@ JQ_FIND_PATH = os.path.join(CURRENT_PATH, JQ_FIND_FILE)
 
 jq_filter = jq.compile(open(JQ_FILTER_PATH, "r").read())
 jq_find = jq.compile(open(JQ_FIND_PATH, "r").read())
+# same, but takes a list of entries.list responses (see RawLogEntries)
+jq_find_responses = jq.compile(
+    f"def find: {open(JQ_FIND_PATH, 'r').read()}; [.[].entries[]?] | find"
+)
 
-LOG_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 DEFAULT_DATETIME_WINDOW = timedelta(minutes=10)  # minutes, +/-
 
 # assuming P means "past"
@@ -68,6 +95,18 @@ MAX_ITERATIONS = 16
 MAX_LOG_ENTRIES = 700
 MAX_FILTER_SIZE = 20000  # characters
 
+# picks filter shapes, learning from the latencies of past queries
+QUERY_PLANNER = QueryPlanner(MAX_FILTER_SIZE, explore_rate=QUERY_EXPLORE_RATE)
+
+# previews fetch one page of this size per id class
+PREVIEW_PAGE_SIZE = 100
+# id class -> the state key its query conditions come from
+PREVIEW_ID_CLASSES = {
+    "traces": "traces",
+    "operations": "operationsNew",
+    "tasks": "tasksNew",
+}
+
 
 class FilterTooBigError(Exception):
     def __init__(self, *args):
@@ -89,21 +128,16 @@ def format_gcp_time(dt):
 
 
 def parse_gcp_datetime(dt_str):
-    # remove milli-/micro-/pico-seconds because the resolution appears to vary
-    # depending on the context. the datetime is also easier to read without such
-    # fine resolution.
-    #
-    # NOTE: our default "window" should take care of ensuring we don't lose any
-    # log entries as the result of (effectively) rounding-down the end time.
-    #
-    # CLEANUP: do this parsing a bit more safely. also, round-up the time.
-    dt_str_simple = f"{dt_str.split('.')[0]}Z"
+    # the resolution of sub-seconds varies depending on the context (milli- to
+    # nano-seconds), so parse via nanoseconds. datetimes keep microseconds;
+    # round_datetime() takes care of rounding when building time windows.
+    ts_ns = parse_timestamp_ns(dt_str)
 
-    return datetime.strptime(dt_str_simple, LOG_DATETIME_FORMAT) if dt_str else None
+    return ns_to_datetime(ts_ns) if ts_ns is not None else None
 
 
 def get_entry_datetime(entry):
-    return parse_gcp_datetime(entry.get("timestamp"))
+    return ns_to_datetime(entry_timestamp_ns(entry))
 
 
 def round_datetime(dt, down=False):
@@ -114,8 +148,15 @@ def round_datetime(dt, down=False):
 
 
 def expand_datetime_window(start_iso_dt, end_iso_dt, window=DEFAULT_DATETIME_WINDOW):
-    start_dt = parse_gcp_datetime(start_iso_dt) - window
-    end_dt = parse_gcp_datetime(end_iso_dt) + window
+    return expand_ns_window(
+        parse_timestamp_ns(start_iso_dt), parse_timestamp_ns(end_iso_dt), window
+    )
+
+
+def expand_ns_window(start_ns, end_ns, window=DEFAULT_DATETIME_WINDOW):
+    window_ns = timedelta_to_ns(window)
+    start_dt = ns_to_datetime(start_ns - window_ns)
+    end_dt = ns_to_datetime(end_ns + window_ns)
 
     return (round_datetime(start_dt, down=True), round_datetime(end_dt))
 
@@ -133,6 +174,19 @@ def state_time_range(state):
     return (state["timeRangeStart"], state["timeRangeEnd"])
 
 
+def union_state_time_range(state, other_state):
+    """Widens the state's time range to also cover the other state's."""
+    (start, end) = state_time_range(state)
+    (other_start, other_end) = state_time_range(other_state)
+
+    new_state = deepcopy(state)
+    new_state.update(
+        timeRangeStart=min(start, other_start, key=parse_timestamp_ns),
+        timeRangeEnd=max(end, other_end, key=parse_timestamp_ns),
+    )
+    return new_state
+
+
 def create_datetime_window_filter(start_dt, end_dt):
     return (
         dedent(
@@ -199,7 +253,7 @@ def quote_slash(value):
 
 
 def preview_entries(entries):
-    return [entries[0], entries[-1]] if entries else None
+    return [as_dict(entries[0]), as_dict(entries[-1])] if entries else None
 
 
 # ---
@@ -270,7 +324,7 @@ def parse_datetime_range(value):
     return (parse_gcp_datetime(start_ts), parse_gcp_datetime(end_ts))
 
 
-def get_state_from_url(url_params, url_qs):
+def get_state_from_url(url_params, url_qs, query_fn=None):
     logs_query = add_datetime_window_to_query(
         url_params["query"],
         # timeRange may not be present
@@ -279,13 +333,21 @@ def get_state_from_url(url_params, url_qs):
 
     logger.info("Extracted logs query from provided URL...\n%s", logs_query)
 
-    log_entries = query_logs(logs_query)
+    log_entries = (query_fn or query_logs)(logs_query, url_project(url_qs))
     if not log_entries:
         raise NoEntriesError
 
     return extract_search_state_from_log_entries(log_entries)
 
 
+def url_project(url_query):
+    # CLEANUP: there's gotta be a better way to do this.
+    try:
+        return url_query.get("project")[0]
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+
 def gcp_logs_url(logs_filter, time_range, url_params=None, url_query=None):
     params = {
         "query": encode_query(logs_filter),
@@ -296,14 +358,8 @@ def gcp_logs_url(logs_filter, time_range, url_params=None, url_query=None):
 
     params_str = ";".join([f"{k}={v}" for k, v in params.items()])
 
-    # CLEANUP: there's gotta be a better way to do this.
-    try:
-        project = url_query.get("project")[0]
-    except (AttributeError, IndexError, TypeError):
-        project = DEFAULT_GCP_PROJECT
-
     query = {
-        "project": project,
+        "project": url_project(url_query) or DEFAULT_GCP_PROJECT,
     }
 
     return f"{GCP_LOGS_URL_BASE};{params_str}?{urlencode(query)}"
@@ -317,6 +373,7 @@ STATE_KEYS_COPY = ["project", "timeRangeStart", "timeRangeEnd"]
 # these keys do make sense to sum; we also want to include found values in the
 # summed state
 STATE_KEYS_TRACK_FOUND = [
+    "projects",
     "tasks",
     "traces",
     "requestIds",
@@ -358,42 +415,188 @@ def sum_search_states(state1, state2):
     return new_state
 
 
+def merge_search_states(states):
+    """
+    Merges peer search states (i.e. from different seeds) into one. Unlike
+    sum_search_states(), no state is considered "previous", so time ranges are
+    widened to cover all states and list values (including "*New" values) are
+    unioned.
+    """
+    merged = {}
+
+    for state in states:
+        for k, v in state.items():
+            if k == "project":
+                merged.setdefault(k, v)
+            elif k == "timeRangeStart":
+                merged[k] = min(merged.get(k) or v, v)
+            elif k == "timeRangeEnd":
+                merged[k] = max(merged.get(k) or v, v)
+            else:
+                merged[k] = sum_sets(merged.get(k) or [], v or [])
+
+    return merged
+
+
 def extract_search_state_from_log_entries(log_entries):
-    return jq_find.input(log_entries).first()
+    if log_entries and all(isinstance(e, LogEntry) for e in log_entries):
+        # compact entries are JSON text already
+        return jq_find.input_text(log_entries_json_text(log_entries)).first()
+
+    return jq_find.input_text(json.dumps(log_entries, default=json_default)).first()
+
+
+def extract_search_state_from_raw_log_entries(entries):
+    """
+    Same as extract_search_state_from_log_entries(), but jq parses the entries
+    from their API responses' text. Entries are only in timestamp order within
+    each response, so the order-dependent values come from the entries list.
+    """
+    state = jq_find_responses.input_text(f"[{','.join(entries.texts)}]").first()
+    state.update(
+        project=((entries[0].get("resource") or {}).get("labels") or {}).get(
+            "project_id"
+        ),
+        timeRangeStart=entries[0].get("timestamp"),
+        timeRangeEnd=entries[-1].get("timestamp"),
+    )
+
+    return state
+
 
+def extract_search_state(entries):
+    if getattr(entries, "texts", None):
+        return extract_search_state_from_raw_log_entries(entries)
+
+    if not isinstance(entries, SpillStore):
+        return extract_search_state_from_log_entries(entries)
+
+    # read spilled entries back in chunks instead of all at once. chunks are in
+    # timestamp order, so the merged time range and project are the same.
+    return merge_search_states(
+        extract_search_state_from_log_entries(chunk) for chunk in entries.chunks()
+    )
 
-def create_logs_filter_from_search_state(state, exclude_insert_ids=True):
+
+def state_projects(state):
+    # states from before multi-project support only have a single project
+    return state.get("projects") or [state.get("project")]
+
+
+def create_logs_filter_from_search_state(state, exclude_insert_ids=True, project=None):
     new_state = deepcopy(state)
 
+    if project:
+        # trace and log_name prefixes are project-specific
+        new_state.update(project=project)
+
     if exclude_insert_ids:
         # exclude known insertIds to reduce response overhead. this introduces
         # complexity with merging state, but it's needed.
         new_state.update(insertIds=[])
 
-    return json.loads(jq_filter.input(new_state).text())
+    return jq_filter.input(new_state).first()
 
 
 # ---
 
 
-def query_for_log_entries(query):
-    return [e.to_api_repr() for e in LOGS_CLIENT.list_entries(filter_=query)]
+def fetch_log_entries_page(query, project=None, page_token=None, page_size=None):
+    """
+    Fetches a single page of log entries, returning (entries, next_page_token).
+    Entries are in their API (JSON) representation, same as to_api_repr().
+    """
+    return LOGS_CLIENTS.fetch_page(query, project, page_token, page_size)
+
+
+def query_for_log_entries(
+    query,
+    project=None,
+    on_page=None,
+    sink=None,
+    cursor=None,
+    compact=False,
+    call_stats=None,
+):
+    """
+    Fetches all pages of log entries for the query. `on_page`, if given, is
+    called with each page's entries as soon as the page arrives. Entries are
+    collected in `sink` (e.g. a SpillStore) if given, otherwise in a
+    RawLogEntries list (keeping the response texts, if any).
+
+    With a LogsQueryCursor, fetching starts at its page token and stops once it
+    has max_entries; the cursor is left with the next page token (if any).
+
+    With compact, each page's entries are wrapped in LogEntry objects as soon as
+    it arrives, so only one page of entry dicts is around at a time.
+
+    Each API call's CallStats (see lib/scheduler.py) are added to call_stats, if
+    given, e.g. to report a request's quota wait.
+    """
+    entries = RawLogEntries() if sink is None else sink
+    page_token = cursor.page_token if cursor else None
+    page_size = cursor.page_size if cursor else None
+    pages_stats = []
+
+    # each page is a separate API call, so each one is scheduled (and retried)
+    # on its own
+    while True:
+        ((page_entries, page_token), stats) = LOGS_SCHEDULER.call(
+            project, fetch_log_entries_page, query, project, page_token, page_size
+        )
+        if compact:
+            page_entries = LogEntry.wrap_all(page_entries)
+        entries.extend(page_entries)
+        pages_stats.append(stats)
+
+        if on_page:
+            on_page(page_entries)
 
+        if cursor:
+            cursor.page_token = page_token
 
-def query_logs(query):
+        if not page_token or (cursor and cursor.is_full(len(entries))):
+            break
+
+    quota_wait = sum(s.quota_wait for s in pages_stats)
+    logger.info(
+        f"Query took {len(pages_stats)} API calls and waited {quota_wait:.3f}s "
+        "for quota",
+        extra={"json_fields": [s.to_json() for s in pages_stats]},
+    )
+    if call_stats is not None:
+        call_stats.extend(pages_stats)
+
+    return entries
+
+
+def query_logs(
+    query,
+    project=None,
+    on_page=None,
+    sink=None,
+    cursor=None,
+    compact=False,
+    call_stats=None,
+):
     if len(query) > MAX_FILTER_SIZE:
         raise FilterTooBigError
 
-    entries = query_for_log_entries(query)
+    entries = query_for_log_entries(
+        query, project, on_page, sink, cursor, compact, call_stats
+    )
     logger.debug(
         f"Query returned {len(entries)} entries...\n",
         extra={"json_fields": preview_entries(entries)},
     )
 
-    if len(entries) >= MAX_LOG_ENTRIES:
+    if cursor and cursor.page_token:
+        logger.info(f"Query stopped at {len(entries)} entries; more to continue")
+    elif len(entries) >= MAX_LOG_ENTRIES and not cursor:
         logger.warning(
             f"Number of log entries received ({len(entries)}) exceeds "
-            f"limit ({MAX_LOG_ENTRIES})!"
+            f"limit ({MAX_LOG_ENTRIES})! Set a max entries limit to page through "
+            "them with continuation tokens."
         )
 
     return entries
@@ -402,18 +605,173 @@ def query_logs(query):
 # ---
 
 
+def query_key(project, part=0):
+    # queries are keyed by project, plus a part number when the planner splits
+    # a project's traces across queries (project ids can't contain "/")
+    return project if not part else f"{project}/{part + 1}"
+
+
+def query_key_project(key):
+    return key.split("/")[0] if key else key
+
+
+def without_ids(state, ids):
+    """Copy of the state without the given ids ({state key: ids}) to query."""
+    if not ids:
+        return state
+
+    state = dict(state)
+    for (k, values) in ids.items():
+        if k in state:
+            state[k] = [v for v in state[k] if v not in values]
+
+    return state
+
+
+def group_entries_by_project(entries):
+    by_project = {}
+    for entry in entries:
+        project = ((entry.get("resource") or {}).get("labels") or {}).get("project_id")
+        by_project.setdefault(project, []).append(entry)
+
+    return by_project
+
+
 class LogsQueryInput:
-    def __init__(self, state):
+    def __init__(self, state, planner=None):
         self.state = state
+        self.planner = planner = planner or QUERY_PLANNER
 
         logger.debug("Preparing logs query from state", extra={"json_fields": state})
-        self.filter = create_logs_filter_from_search_state(
-            state, exclude_insert_ids=False
-        )
 
-        # a query is a filter with a datetime window
-        self.query = self.filter + datetime_window_filter(*state_time_range(state))
-        logger.info("Logs query (%s chars):\n%s", len(self.query), self.query)
+        # each project gets its own query (or queries, see QueryPlanner), since
+        # trace and log_name prefixes are project-specific. a query is a filter
+        # with a datetime window.
+        self.queries = {}
+        self.plans = {}
+        for project in state_projects(state):
+            plan = planner.plan(state, project)
+
+            for (part, part_state) in enumerate(plan.part_states(state)):
+                key = query_key(project, part)
+                query = create_logs_filter_from_search_state(
+                    part_state, exclude_insert_ids=False, project=project
+                ) + datetime_window_filter(*state_time_range(state))
+
+                logger.info("Logs query for %s (%s chars):\n%s", key, len(query), query)
+                self.queries[key] = query
+                self.plans[key] = plan
+
+
+def query_projects(
+    queries,
+    query_fn=None,
+    store=None,
+    cursors=None,
+    plans=None,
+    compact=False,
+    planner=None,
+    call_stats=None,
+):
+    """
+    Runs each project's query concurrently, returning a dict of entries keyed by
+    query key (see query_key()). With a SpillStore, entries go straight into the
+    store (page by page for query_logs()) and the dict values are per-project
+    views of it. With cursors (LogsQueryCursor by key), they're passed on to each
+    query. With plans (QueryPlan by key), query latencies are fed back to the
+    planner that made them (QUERY_PLANNER by default). With compact, entries are
+    LogEntry objects instead of dicts. With call_stats (a list), query_logs()
+    adds each API call's CallStats to it.
+    """
+
+    def query_fn_entries(key, project, **kwargs):
+        entries = query_fn(queries[key], project, **kwargs)
+        return LogEntry.wrap_all(entries) if compact else entries
+
+    def query_project(key):
+        project = query_key_project(key)
+        # only pass cursors when paging, so simple query_fns keep working
+        kwargs = {"cursor": cursors[key]} if cursors else {}
+        start = time.monotonic()
+
+        if store is None:
+            result = (
+                query_fn_entries(key, project, **kwargs)
+                if query_fn
+                else query_logs(
+                    queries[key],
+                    project,
+                    compact=compact,
+                    call_stats=call_stats,
+                    **kwargs,
+                )
+            )
+        else:
+            result = store.for_project(project)
+            if query_fn:
+                result.extend(query_fn_entries(key, project, **kwargs))
+            else:
+                query_logs(
+                    queries[key],
+                    project,
+                    sink=result,
+                    compact=compact,
+                    call_stats=call_stats,
+                    **kwargs,
+                )
+
+        if plans:
+            (planner or QUERY_PLANNER).observe(plans[key], time.monotonic() - start)
+
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        results = pool.map(query_project, queries)
+
+        return dict(zip(queries, results))
+
+
+def quota_wait_seconds(call_stats):
+    """Total time the calls waited for Logging API quota (see lib/scheduler.py)."""
+    return round(sum(s.quota_wait for s in call_stats), 3)
+
+
+def entry_counts_by_project(entries_by_project, store=None):
+    """Entry counts by project, summing the parts of split queries."""
+    if store is not None:
+        # views of the same project share the store's count
+        return {
+            query_key_project(key): store.counts_by_project.get(
+                query_key_project(key), 0
+            )
+            for key in entries_by_project
+        }
+
+    counts = {}
+    for (key, entries) in entries_by_project.items():
+        project = query_key_project(key)
+        counts[project] = counts.get(project, 0) + len(entries)
+
+    return counts
+
+
+def merge_project_entries(entries_by_project):
+    """
+    Merges entries from all projects (and query parts) into one timeline. The
+    response texts are kept if all of them have them (see RawLogEntries).
+    """
+    # split queries may both match an entry (e.g. by trace and by operation)
+    entries = {
+        e.get("insertId"): e for entries in entries_by_project.values() for e in entries
+    }
+    merged = sort_entries_by_timestamp(entries.values())
+
+    texts = [getattr(e, "texts", None) for e in entries_by_project.values()]
+    if merged and all(t is not None for t in texts):
+        # duplicates don't change the extracted search state
+        return RawLogEntries(merged, [t for key_texts in texts for t in key_texts])
+
+    return merged
 
 
 class LogsQueryResult:
@@ -424,15 +782,18 @@ class LogsQueryResult:
         self.entries = entries
         self.entries_count = len(entries)
 
-        self.state = extract_search_state_from_log_entries(entries)
+        self.state = extract_search_state(entries)
+        if isinstance(entries, RawLogEntries):
+            # the response texts aren't needed anymore
+            entries.texts = None
 
         # use first/last entries as next time range, expanding with default
         # window to find even more entries
         self.state = update_state_datetimes(
             self.state,
-            *expand_datetime_window(
-                self.entries[0]["timestamp"],
-                self.entries[-1]["timestamp"],
+            *expand_ns_window(
+                entry_timestamp_ns(self.entries[0]),
+                entry_timestamp_ns(self.entries[-1]),
                 # provide a tighter window so the view is zoomed in
                 window=timedelta(minutes=1),
             ),
@@ -442,25 +803,244 @@ class LogsQueryResult:
 # ---
 
 
-def find_entries(state, url_params=None, url_qs=None):
+def preview_queries(state):
+    """
+    Builds a separate query per project and id class (see PREVIEW_ID_CLASSES),
+    keyed by "<project>/<id class>", skipping classes with nothing to query.
+    """
+    queries = {}
+    for project in state_projects(state):
+        for (id_class, key) in PREVIEW_ID_CLASSES.items():
+            if not state.get(key):
+                continue
+
+            class_state = dict(
+                state, **{k: [] for k in PREVIEW_ID_CLASSES.values() if k != key}
+            )
+            queries[f"{project}/{id_class}"] = create_logs_filter_from_search_state(
+                class_state, exclude_insert_ids=False, project=project
+            ) + datetime_window_filter(*state_time_range(state))
+
+    return queries
+
+
+def estimate_entry_count(entries, complete, time_range):
+    """
+    Extrapolates a query's total entry count from its first page. Entries come
+    back in timestamp order, so the page covers the start of the time range.
+    """
+    if complete or not entries:
+        return len(entries)
+
+    (start_ns, end_ns) = (parse_timestamp_ns(t) for t in time_range)
+    covered_ns = entry_timestamp_ns(entries[-1]) - start_ns
+
+    if covered_ns <= 0:
+        return len(entries)
+
+    return max(len(entries), round(len(entries) * (end_ns - start_ns) / covered_ns))
+
+
+def preview_entries_for_state(state, input_state, url_params, url_qs, query_fn):
+    queries = preview_queries(input_state)
+    cursors = {
+        key: LogsQueryCursor(max_entries=PREVIEW_PAGE_SIZE, page_size=PREVIEW_PAGE_SIZE)
+        for key in queries
+    }
+    call_stats = []
+    entries_by_key = (
+        query_projects(queries, query_fn, cursors=cursors, call_stats=call_stats)
+        if queries
+        else {}
+    )
+    entries = merge_project_entries(entries_by_key)
+    time_range = state_time_range(input_state)
+
+    id_classes = {}
+    for (key, class_entries) in entries_by_key.items():
+        complete = not cursors[key].page_token
+        counts = id_classes.setdefault(
+            key.split("/")[1], {"count": 0, "estimatedCount": 0, "complete": True}
+        )
+        counts["count"] += len(class_entries)
+        counts["estimatedCount"] += estimate_entry_count(
+            class_entries, complete, time_range
+        )
+        counts["complete"] = counts["complete"] and complete
+
+    estimated_count = max(
+        [len(entries)] + [c["estimatedCount"] for c in id_classes.values()]
+    )
+    resp_filter = create_logs_filter_from_search_state(state)
+
+    resp_msg = (
+        f"Previewed {len(entries)} log entries (about {estimated_count} in total)"
+    )
+    resp_data = {
+        # unchanged, so sending it back without preview fetches everything
+        "searchState": deepcopy(state),
+        "filter": resp_filter,
+        "logEntries": preview_entries(entries) or [],
+        "logEntryCount": len(entries),
+        "url": gcp_logs_url(resp_filter, state_time_range(state), url_params, url_qs),
+        "logEntryCountsByProject": entry_counts_by_project(entries_by_key),
+        "quotaWaitSeconds": quota_wait_seconds(call_stats),
+        "preview": {
+            "idClasses": id_classes,
+            "estimatedCount": estimated_count,
+            "complete": all(c["complete"] for c in id_classes.values()),
+            "timeRange": (
+                [entries[0]["timestamp"], entries[-1]["timestamp"]] if entries else None
+            ),
+        },
+    }
+
+    return (resp_msg, resp_data)
+
+
+def find_entries(
+    state,
+    url_params=None,
+    url_qs=None,
+    query_fn=None,
+    graph_ordering=False,
+    memory_budget=None,
+    max_entries=None,
+    continuation=None,
+    preview=False,
+    compact=False,
+    export_graph=False,
+    shared_ids=None,
+    shared_entries=None,
+):
+    """
+    Runs one correlation step from the given search state. With max_entries,
+    each project's query stops after (about) that many entries and the response
+    has a "continuation" token; passing it back (with the response's search
+    state) fetches the next chunk of the same queries instead of a new step.
+
+    With preview, only the first page of each id class's query is fetched, and
+    the response has the first and last entries and (estimated) entry counts
+    instead of all entries. The search state is returned unchanged.
+
+    With compact, log entries are LogEntry objects instead of dicts (see
+    lib/log_entry.py); serialize responses with json_default().
+
+    The trace graph's keys (see lib/trace_graph.py) are only kept in the search
+    state with graph_ordering or export_graph.
+
+    With shared_ids ({state key: ids}), those ids are left out of the queries and
+    shared_entries, already fetched for them (e.g. once for several seeds, see
+    lib/batch.py), are used instead.
+    """
     # expand given datetime window and round microseconds
     input_state = deepcopy(state)
     input_state = update_state_datetimes(
         input_state, *expand_datetime_window(*state_time_range(input_state))
     )
 
+    if preview:
+        return preview_entries_for_state(
+            state, input_state, url_params, url_qs, query_fn
+        )
+
+    # with graph ordering, only query the not-yet-queried traces closest to the
+    # seed instead of all known traces. continued queries were already picked.
+    (query_state, frontier) = (
+        graph_query_state(input_state)
+        if graph_ordering and not continuation
+        else (input_state, None)
+    )
+
+    # with a memory budget, entries beyond it are spilled to disk and the
+    # response's logEntries is the (iterable) store instead of a list
+    store = SpillStore(memory_budget) if memory_budget else None
+
+    (plans, planner) = (None, None)
+    if continuation:
+        cursor_data = decode_continuation(continuation, state)
+        queries = {p: q["query"] for (p, q) in cursor_data["queries"].items()}
+        cursors = {
+            p: LogsQueryCursor(q["pageToken"], max_entries)
+            for (p, q) in cursor_data["queries"].items()
+        }
+        time_range = cursor_data["timeRange"]
+    else:
+        query_state = without_ids(query_state, shared_ids)
+        query_input = (
+            LogsQueryInput(query_state) if has_pending_queries(query_state) else None
+        )
+        queries = query_input.queries if query_input else {}
+        cursors = (
+            {p: LogsQueryCursor(max_entries=max_entries) for p in queries}
+            if max_entries
+            else None
+        )
+        time_range = state_time_range(query_state)
+        (plans, planner) = (
+            (query_input.plans, query_input.planner) if query_input else (None, None)
+        )
+
+    call_stats = []
+    entries_by_project = (
+        query_projects(
+            queries, query_fn, store, cursors, plans, compact, planner, call_stats
+        )
+        if queries
+        else {}
+    )
+    # keyed like a query of their project, so they're counted and merged as such
+    for (project, entries) in group_entries_by_project(shared_entries or []).items():
+        if compact:
+            entries = LogEntry.wrap_all(entries)
+        if store is not None:
+            view = store.for_project(project)
+            view.extend(entries)
+            entries = view
+
+        entries_by_project[f"{project}/shared"] = entries
+    # more pages to fetch for some project
+    truncated = bool(cursors) and any(c.page_token for c in cursors.values())
+
     try:
-        query_result = LogsQueryResult(query_logs(LogsQueryInput(input_state).query))
+        query_result = LogsQueryResult(
+            store if store is not None else merge_project_entries(entries_by_project)
+        )
     except NoEntriesError:
         query_result = None
 
     resp_entries = query_result.entries if query_result else []
+    # see DOMAIN_INDEX
+    record_domain_objects(resp_entries)
     resp_state = (
         sum_search_states(input_state, query_result.state)
         if query_result
         else deepcopy(state)
     )
 
+    if continuation and query_result:
+        # this chunk's entries continue the previous one's, so cover both
+        resp_state = union_state_time_range(resp_state, state)
+
+    if frontier is not None:
+        # traces in a truncated result may still show up in the next chunk
+        update_graph_state(
+            resp_state,
+            input_state,
+            frontier,
+            resp_entries,
+            complete=not truncated,
+        )
+    elif not (graph_ordering or export_graph):
+        resp_state = without_graph_state(resp_state)
+
+    # tied to the final response state, which comes back along with it
+    resp_continuation = (
+        encode_continuation(queries, cursors, time_range, resp_state)
+        if truncated
+        else None
+    )
+
     resp_filter = create_logs_filter_from_search_state(resp_state)
     resp_url = gcp_logs_url(
         resp_filter, state_time_range(resp_state), url_params, url_qs
@@ -473,6 +1053,24 @@ def find_entries(state, url_params=None, url_qs=None):
         "logEntries": resp_entries,
         "logEntryCount": len(resp_entries),
         "url": resp_url,
+        "logEntryCountsByProject": entry_counts_by_project(entries_by_project, store),
+        "quotaWaitSeconds": quota_wait_seconds(call_stats),
     }
 
+    projects = state_projects(resp_state)
+    if len(projects) > 1:
+        resp_data["projectUrls"] = {
+            project: gcp_logs_url(
+                create_logs_filter_from_search_state(resp_state, project=project),
+                state_time_range(resp_state),
+                url_params,
+                {"project": [project]},
+            )
+            for project in projects
+        }
+
+    if resp_continuation:
+        resp_data["continuation"] = resp_continuation
+        resp_msg += " (more to continue)"
+
     return (resp_msg, resp_data)
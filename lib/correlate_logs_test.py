@@ -1,3 +1,4 @@
+import json
 import unittest
 from datetime import datetime
 
@@ -5,12 +6,19 @@ from freezegun import freeze_time
 
 from .correlate_logs import (
     GCP_LOGS_URL_BASE,
+    create_logs_filter_from_search_state,
+    estimate_entry_count,
+    extract_search_state,
+    find_entries,
     gcp_logs_url,
+    merge_project_entries,
     parse_datetime_range,
     parse_gcp_datetime,
     parse_gcp_logs_url,
+    preview_queries,
     sum_search_states,
 )
+from .logs_clients import RawLogEntries
 
 
 def mock_dt():
@@ -223,3 +231,176 @@ class SumSearchStatesTest(unittest.TestCase):
             "tasksNew": [],
         }
         self.assertEqual(actual, expected)
+
+
+def mock_project_entry(insert_id, project, timestamp):
+    return {
+        "insertId": insert_id,
+        "trace": f"projects/{project}/traces/abc",
+        "timestamp": timestamp,
+        "resource": {"labels": {"project_id": project}},
+    }
+
+
+def mock_projects_state():
+    return {
+        "project": "gen-prod",
+        "projects": ["gen-prod", "gen-other"],
+        "timeRangeStart": "2022-11-29T16:00:00.000Z",
+        "timeRangeEnd": "2022-11-29T16:05:00.000Z",
+        "insertIds": [],
+        "traces": ["abc"],
+    }
+
+
+class MultiProjectTest(unittest.TestCase):
+    def test_filter_uses_project_prefixes(self):
+        state = mock_projects_state()
+        state.update(operationsNew=["op1"])
+
+        actual = create_logs_filter_from_search_state(state, project="gen-other")
+
+        self.assertIn('"projects/gen-other/traces/(abc)"', actual)
+        self.assertIn('log_name="projects/gen-other/logs/', actual)
+        self.assertNotIn("gen-prod", actual)
+
+    def test_queries_each_project_and_merges_timeline(self):
+        queries = {}
+
+        def query_fn(query, project=None):
+            queries[project] = query
+            if project == "gen-prod":
+                return [mock_project_entry("1", project, "2022-11-29T16:00:02.000Z")]
+            return [mock_project_entry("2", project, "2022-11-29T16:00:01.000Z")]
+
+        (_, resp_data) = find_entries(mock_projects_state(), query_fn=query_fn)
+
+        self.assertEqual(sorted(queries), ["gen-other", "gen-prod"])
+        self.assertIn("projects/gen-other/traces/", queries["gen-other"])
+        self.assertEqual([e["insertId"] for e in resp_data["logEntries"]], ["2", "1"])
+        self.assertEqual(
+            resp_data["logEntryCountsByProject"], {"gen-prod": 1, "gen-other": 1}
+        )
+        self.assertEqual(
+            resp_data["searchState"]["projects"], ["gen-other", "gen-prod"]
+        )
+        self.assertEqual(sorted(resp_data["projectUrls"]), ["gen-other", "gen-prod"])
+
+    def test_found_projects_are_added(self):
+        state1 = {"projects": ["gen-prod"]}
+        state2 = {"projects": ["gen-prod"], "projectsFound": ["gen-other"]}
+
+        actual = sum_search_states(state1, state2)
+        self.assertEqual(actual["projects"], ["gen-other", "gen-prod"])
+        self.assertEqual(actual["projectsNew"], ["gen-other"])
+
+
+def mock_raw_entries(*entries):
+    text = json.dumps({"entries": list(entries), "nextPageToken": "next"})
+    return RawLogEntries(json.loads(text)["entries"], [text])
+
+
+class RawLogEntriesTest(unittest.TestCase):
+    def test_merge_keeps_response_texts(self):
+        merged = merge_project_entries(
+            {
+                "gen-prod": mock_raw_entries(
+                    mock_project_entry("2", "gen-prod", "2022-11-29T16:00:02.000Z")
+                ),
+                "gen-other": mock_raw_entries(
+                    mock_project_entry("1", "gen-other", "2022-11-29T16:00:01.000Z")
+                ),
+            }
+        )
+
+        self.assertEqual([e["insertId"] for e in merged], ["1", "2"])
+        self.assertEqual(len(merged.texts), 2)
+
+    def test_merge_drops_texts_if_any_are_missing(self):
+        merged = merge_project_entries(
+            {
+                "gen-prod": mock_raw_entries(
+                    mock_project_entry("2", "gen-prod", "2022-11-29T16:00:02.000Z")
+                ),
+                "gen-other": [
+                    mock_project_entry("1", "gen-other", "2022-11-29T16:00:01.000Z")
+                ],
+            }
+        )
+
+        self.assertIsNone(getattr(merged, "texts", None))
+
+    def test_extracts_same_state_as_entries(self):
+        entries = [
+            mock_project_entry("1", "gen-other", "2022-11-29T16:00:01.000Z"),
+            mock_project_entry("2", "gen-prod", "2022-11-29T16:00:02.000Z"),
+            mock_project_entry("3", "gen-prod", "2022-11-29T16:00:03.000Z"),
+        ]
+        # responses out of timestamp order, with a duplicate
+        raw = RawLogEntries(
+            entries,
+            [
+                mock_raw_entries(*entries[1:]).texts[0],
+                mock_raw_entries(*entries[:2]).texts[0],
+            ],
+        )
+
+        self.assertEqual(extract_search_state(raw), extract_search_state(entries))
+
+
+def mock_preview_state():
+    return {
+        "project": "gen-prod",
+        "timeRangeStart": "2022-11-29T16:00:00.000Z",
+        "timeRangeEnd": "2022-11-29T16:10:00.000Z",
+        "insertIds": [],
+        "traces": ["abc"],
+        "operationsNew": ["op1"],
+        "tasksNew": [],
+    }
+
+
+class PreviewTest(unittest.TestCase):
+    def test_queries_each_id_class(self):
+        queries = preview_queries(mock_preview_state())
+
+        self.assertEqual(sorted(queries), ["gen-prod/operations", "gen-prod/traces"])
+        self.assertNotIn("operation.id", queries["gen-prod/traces"])
+        self.assertNotIn("trace", queries["gen-prod/operations"])
+
+    def test_estimates_count_from_first_page(self):
+        entries = [{"timestamp": f"2022-11-29T16:0{i}:00.000Z"} for i in range(1, 3)]
+        time_range = ("2022-11-29T16:00:00.000Z", "2022-11-29T16:10:00.000Z")
+
+        # the page covers the first 2 of 10 minutes
+        self.assertEqual(estimate_entry_count(entries, False, time_range), 10)
+        self.assertEqual(estimate_entry_count(entries, True, time_range), 2)
+
+    def test_previews_first_pages(self):
+        def query_fn(query, project=None, cursor=None):
+            self.assertEqual(cursor.page_size, 100)
+            if "operation.id" in query:
+                return [mock_project_entry("op", project, "2022-11-29T16:01:00.000Z")]
+
+            # more pages to go
+            cursor.page_token = "next"
+            return [
+                mock_project_entry(str(i), project, f"2022-11-29T15:5{i}:00.000Z")
+                for i in range(5, 8)
+            ]
+
+        state = mock_preview_state()
+        (_, resp_data) = find_entries(state, query_fn=query_fn, preview=True)
+
+        self.assertEqual(resp_data["searchState"], state)
+        self.assertEqual(resp_data["logEntryCount"], 4)
+        self.assertEqual([e["insertId"] for e in resp_data["logEntries"]], ["5", "op"])
+
+        preview = resp_data["preview"]
+        self.assertFalse(preview["complete"])
+        self.assertEqual(preview["idClasses"]["operations"]["estimatedCount"], 1)
+        self.assertGreater(preview["idClasses"]["traces"]["estimatedCount"], 3)
+        self.assertEqual(
+            preview["timeRange"],
+            ["2022-11-29T15:55:00.000Z", "2022-11-29T16:01:00.000Z"],
+        )
@@ -0,0 +1,118 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import zlib
+
+CONTINUATION_VERSION = 2
+
+# tokens carry the queries to continue, so they're signed to keep callers from
+# running their own filters. without a secret, a random one is used and tokens
+# only work on the instance that issued them.
+CONTINUATION_SECRET = os.environ.get("CONTINUATION_SECRET", "").encode()
+if not CONTINUATION_SECRET:
+    CONTINUATION_SECRET = os.urandom(32)
+
+
+class InvalidContinuationError(ValueError):
+    pass
+
+
+class LogsQueryCursor:
+    """
+    Where a (project's) query left off: the Logging API page token to resume
+    from. With max_entries, query_for_log_entries() stops fetching pages once it
+    has at least that many entries and leaves the next page token here. With
+    page_size, pages are requested at that size instead of the default.
+    """
+
+    def __init__(self, page_token=None, max_entries=None, page_size=None):
+        self.page_token = page_token
+        self.max_entries = max_entries
+        self.page_size = page_size
+
+    def is_full(self, entries_count):
+        return bool(self.max_entries) and entries_count >= self.max_entries
+
+
+def state_digest(state):
+    """
+    Hash of the search state a continuation token goes with. Empty and derived
+    ("*New", "*Found") values are left out, since delta clients (see
+    lib/deltas.py) rebuild the state without them.
+    """
+    values = {
+        k: v
+        for (k, v) in state.items()
+        if v and k != "continuation" and not k.endswith(("New", "Found"))
+    }
+    raw = json.dumps(values, sort_keys=True, separators=(",", ":")).encode()
+
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _signature(payload):
+    return hmac.new(CONTINUATION_SECRET, payload, hashlib.sha256).digest()
+
+
+def encode_continuation(queries, cursors, time_range, state):
+    """
+    Builds a continuation token from each project's query and next page token
+    (projects without one are done). Returns None when all projects are done.
+    The query includes the time window, but it's kept separately as well so the
+    continued response can cover the whole range.
+
+    The token is signed and only valid along with the given (response) search
+    state; see decode_continuation().
+    """
+    pending = {
+        project: {"query": queries[project], "pageToken": cursor.page_token}
+        for (project, cursor) in cursors.items()
+        if cursor.page_token
+    }
+    if not pending:
+        return None
+
+    data = {
+        "v": CONTINUATION_VERSION,
+        "queries": pending,
+        "timeRange": list(time_range),
+        "state": state_digest(state),
+    }
+    # filters are long and repetitive, so they compress well
+    payload = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+
+    return ".".join(
+        base64.urlsafe_b64encode(p).decode() for p in [payload, _signature(payload)]
+    )
+
+
+def decode_continuation(token, state):
+    """
+    Checks a continuation token's signature and that it goes with the given
+    search state, returning its data.
+    """
+    try:
+        (payload, signature) = (base64.urlsafe_b64decode(p) for p in token.split("."))
+    except (binascii.Error, ValueError, TypeError, AttributeError) as err:
+        raise InvalidContinuationError("Invalid continuation token") from err
+
+    if not hmac.compare_digest(signature, _signature(payload)):
+        raise InvalidContinuationError("Invalid continuation token")
+
+    try:
+        data = json.loads(zlib.decompress(payload))
+    except (zlib.error, ValueError) as err:
+        raise InvalidContinuationError("Invalid continuation token") from err
+
+    if not isinstance(data, dict) or data.get("v") != CONTINUATION_VERSION:
+        raise InvalidContinuationError("Unsupported continuation token")
+
+    if data.get("state") != state_digest(state):
+        raise InvalidContinuationError(
+            "Continuation token doesn't match the search state"
+        )
+
+    return data
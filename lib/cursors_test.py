@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+
+from .correlate_logs import find_entries
+from .cursors import (
+    InvalidContinuationError,
+    LogsQueryCursor,
+    decode_continuation,
+    encode_continuation,
+    state_digest,
+)
+from .testing import mock_entry, mock_state
+
+MOCK_PAGES = {
+    None: ([mock_entry("1", 1), mock_entry("2", 2)], "page2"),
+    "page2": ([mock_entry("3", 9)], None),
+}
+
+
+def mock_fetch_page(query, project, page_token, page_size):
+    return MOCK_PAGES[page_token]
+
+
+def mock_token(state):
+    return encode_continuation(
+        {"gen-prod": "foo", "gen-other": "bar"},
+        {"gen-prod": LogsQueryCursor("abc"), "gen-other": LogsQueryCursor()},
+        ("2022-11-29T16:00:00.000Z", "2022-11-29T16:05:00.000Z"),
+        state,
+    )
+
+
+class ContinuationTokenTest(unittest.TestCase):
+    def test_round_trip(self):
+        actual = decode_continuation(mock_token(mock_state()), mock_state())
+        self.assertEqual(
+            actual["queries"], {"gen-prod": {"query": "foo", "pageToken": "abc"}}
+        )
+
+    def test_none_when_done(self):
+        self.assertIsNone(
+            encode_continuation(
+                {"p": "foo"}, {"p": LogsQueryCursor()}, ("a", "b"), mock_state()
+            )
+        )
+
+    def test_rejects_invalid_tokens(self):
+        for token in ["nope", "", "eJzLSM3JyQcABiwCFQ==", None]:
+            with self.assertRaises(InvalidContinuationError):
+                decode_continuation(token, mock_state())
+
+    def test_rejects_tampered_tokens(self):
+        (payload, signature) = mock_token(mock_state()).split(".")
+        forged = encode_continuation(
+            {"other-project": 'logName:"secrets"'},
+            {"other-project": LogsQueryCursor("abc")},
+            ("a", "b"),
+            mock_state(),
+        ).split(".")[0]
+
+        with self.assertRaises(InvalidContinuationError):
+            decode_continuation(f"{forged}.{signature}", mock_state())
+
+    def test_rejects_other_states(self):
+        token = mock_token(mock_state())
+
+        with self.assertRaises(InvalidContinuationError):
+            decode_continuation(token, dict(mock_state(), traces=["def"]))
+
+    def test_state_digest_ignores_derived_and_empty_values(self):
+        state = mock_state()
+
+        self.assertEqual(
+            state_digest(state),
+            state_digest(dict(state, tracesNew=["abc"], tasks=[], continuation="x")),
+        )
+
+
+@mock.patch("lib.correlate_logs.fetch_log_entries_page")
+class FindEntriesContinuationTest(unittest.TestCase):
+    def test_pages_through_results(self, fetch_page):
+        fetch_page.side_effect = mock_fetch_page
+
+        (_, resp1) = find_entries(mock_state(), max_entries=2)
+
+        self.assertEqual([e["insertId"] for e in resp1["logEntries"]], ["1", "2"])
+        self.assertIn("continuation", resp1)
+        self.assertEqual(fetch_page.call_count, 1)
+
+        (_, resp2) = find_entries(
+            resp1["searchState"], max_entries=2, continuation=resp1["continuation"]
+        )
+
+        # same query, resumed from the page token
+        (query1, _, _, _) = fetch_page.call_args_list[0].args
+        self.assertEqual(fetch_page.call_args.args, (query1, "gen-prod", "page2", None))
+
+        self.assertEqual([e["insertId"] for e in resp2["logEntries"]], ["3"])
+        self.assertNotIn("continuation", resp2)
+        self.assertEqual(resp2["searchState"]["insertIds"], ["1", "2", "3"])
+        # the token only continues the state it came with
+        with self.assertRaises(InvalidContinuationError):
+            find_entries(
+                mock_state(), max_entries=2, continuation=resp1["continuation"]
+            )
+        self.assertEqual(
+            resp2["searchState"]["timeRangeStart"],
+            resp1["searchState"]["timeRangeStart"],
+        )
+
+    def test_fetches_everything_without_limit(self, fetch_page):
+        fetch_page.side_effect = mock_fetch_page
+
+        (_, resp) = find_entries(mock_state())
+
+        self.assertEqual(resp["logEntryCount"], 3)
+        self.assertNotIn("continuation", resp)
@@ -0,0 +1,107 @@
+from copy import deepcopy
+
+from .correlate_logs import STATE_KEYS_COPY, sum_sets
+from .spill import SpillStore
+
+# keys that sum_search_states() derives from other keys
+DERIVED_KEY_SUFFIXES = ("Found", "New")
+
+# response keys derived from the full search state, which delta clients don't
+# need every step (they can build them from their state)
+FILTER_KEYS = ["filter", "url", "projectUrls"]
+
+
+def is_summed_key(k):
+    return k not in STATE_KEYS_COPY and not k.endswith(DERIVED_KEY_SUFFIXES)
+
+
+def search_state_delta(state, version, full=False):
+    """
+    Creates a versioned diff of a search state from the "*New" values computed
+    by sum_search_states(). Applying diffs in version order (see
+    apply_search_state_delta()) reconstructs the full search state.
+
+    A full delta (baseVersion=None) carries the whole state instead, so clients
+    can resync when they've missed a version.
+    """
+    if full:
+        return {
+            "version": version,
+            "baseVersion": None,
+            "set": {k: v for k, v in state.items() if not k.endswith("New")},
+            "add": {k[: -len("New")]: v for k, v in state.items() if k.endswith("New")},
+        }
+
+    return {
+        "version": version,
+        "baseVersion": version - 1,
+        "set": {k: state[k] for k in STATE_KEYS_COPY if k in state},
+        "add": {
+            k[: -len("New")]: v for k, v in state.items() if k.endswith("New") and v
+        },
+    }
+
+
+class DeltaVersionError(Exception):
+    pass
+
+
+def apply_search_state_delta(state, version, delta):
+    """
+    Applies a delta to the given state (at the given version), returning the
+    new state, the same as the server would have computed it.
+    """
+    if delta["baseVersion"] is None:
+        state = {}
+    elif delta["baseVersion"] != version:
+        raise DeltaVersionError(
+            f"Cannot apply delta for version {delta['baseVersion']} to {version}"
+        )
+
+    new_state = deepcopy(state)
+    new_state.update(delta["set"])
+
+    all_keys = set(k for k in new_state if is_summed_key(k)) | set(delta["add"])
+    for k in all_keys:
+        added = delta["add"].get(k) or []
+
+        new_state[k] = sum_sets(new_state.get(k) or [], added)
+        new_state[f"{k}New"] = added
+
+    return new_state
+
+
+def new_log_entries(entries, prev_state):
+    known_insert_ids = set(prev_state.get("insertIds") or [])
+
+    if isinstance(entries, SpillStore):
+        # spilled entries stay on disk until they're written out
+        return entries.without(known_insert_ids)
+
+    return [e for e in entries if e.get("insertId") not in known_insert_ids]
+
+
+def delta_response_data(
+    resp_data, prev_state, version, full=False, include_filter=False
+):
+    """
+    Converts find_entries() response data into a delta response: only log
+    entries that are new since prev_state plus a versioned state diff. The
+    filter and urls (see FILTER_KEYS) are left out unless include_filter.
+    """
+    delta_data = {
+        k: v
+        for k, v in resp_data.items()
+        if k != "searchState" and (include_filter or k not in FILTER_KEYS)
+    }
+
+    log_entries = new_log_entries(resp_data["logEntries"], prev_state)
+    delta_data.update(
+        logEntries=log_entries,
+        logEntryCount=len(log_entries),
+        searchStateDelta=search_state_delta(
+            resp_data["searchState"], version, full=full
+        ),
+    )
+
+    return delta_data
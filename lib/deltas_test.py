@@ -0,0 +1,164 @@
+import re
+import unittest
+
+from .correlate_logs import find_entries, sum_search_states
+from .deltas import (
+    DeltaVersionError,
+    apply_search_state_delta,
+    delta_response_data,
+    new_log_entries,
+    search_state_delta,
+)
+from .spill import SpillStore, is_spilled
+from .testing import mock_entry
+
+
+def mock_prev_state():
+    return {
+        "project": "gen-prod",
+        "timeRangeStart": "2022-11-29T16:00:00.000Z",
+        "timeRangeEnd": "2022-11-29T16:05:00.000Z",
+        "insertIds": ["1", "2"],
+        "traces": ["a"],
+        "tasks": [],
+    }
+
+
+def mock_found_state():
+    return {
+        "project": "gen-prod",
+        "timeRangeStart": "2022-11-29T15:59:00.000Z",
+        "timeRangeEnd": "2022-11-29T16:06:00.000Z",
+        "insertIds": ["3"],
+        "traces": ["a", "b"],
+        "tasks": [],
+        "tasksFound": ["7"],
+    }
+
+
+def non_empty(state):
+    return {k: v for (k, v) in state.items() if v}
+
+
+class SearchStateDeltaTest(unittest.TestCase):
+    def test_contains_only_new_values(self):
+        state = sum_search_states(mock_prev_state(), mock_found_state())
+
+        actual = search_state_delta(state, 3)
+        expected = {
+            "version": 3,
+            "baseVersion": 2,
+            "set": {
+                "project": "gen-prod",
+                "timeRangeStart": "2022-11-29T15:59:00.000Z",
+                "timeRangeEnd": "2022-11-29T16:06:00.000Z",
+            },
+            "add": {"insertIds": ["3"], "traces": ["b"], "tasks": ["7"]},
+        }
+        self.assertEqual(actual, expected)
+
+    def test_applying_delta_reconstructs_state(self):
+        prev_state = mock_prev_state()
+        state = sum_search_states(prev_state, mock_found_state())
+
+        actual = apply_search_state_delta(prev_state, 2, search_state_delta(state, 3))
+        self.assertEqual(actual, state)
+
+    def test_applying_full_delta_reconstructs_state(self):
+        state = sum_search_states(mock_prev_state(), mock_found_state())
+
+        delta = search_state_delta(state, 5, full=True)
+        self.assertIsNone(delta["baseVersion"])
+
+        actual = apply_search_state_delta({"foo": ["bar"]}, 1, delta)
+        self.assertEqual(actual, state)
+
+    def test_graph_ordering_round_trip(self):
+        # trace a defers task 7, which runs in trace b
+        entries = {
+            r"traces/\(?a\b": mock_entry(
+                "3", trace="a", protoPayload={"line": [{"logMessage": "task:7"}]}
+            ),
+            r'taskName=\("7"\)': mock_entry(
+                "4", trace="b", protoPayload={"taskName": "7"}
+            ),
+        }
+
+        def query_fn(query, project=None):
+            return [e for (pattern, e) in entries.items() if re.search(pattern, query)]
+
+        (server_state, client_state) = (mock_prev_state(), mock_prev_state())
+        for version in range(2, 6):
+            (_, resp_data) = find_entries(
+                server_state, query_fn=query_fn, graph_ordering=True
+            )
+            server_state = resp_data["searchState"]
+
+            delta = search_state_delta(server_state, version)
+            client_state = apply_search_state_delta(client_state, version - 1, delta)
+            # deltas leave out keys that are still empty
+            self.assertEqual(non_empty(client_state), non_empty(server_state))
+
+        self.assertEqual(client_state["tracesQueried"], ["a", "b"])
+        self.assertEqual(client_state["tracesExhausted"], ["b"])
+        self.assertEqual(client_state["graphRoots"], ["trace:a"])
+
+    def test_applying_out_of_order_delta_raises(self):
+        state = sum_search_states(mock_prev_state(), mock_found_state())
+
+        with self.assertRaises(DeltaVersionError):
+            apply_search_state_delta(mock_prev_state(), 1, search_state_delta(state, 3))
+
+
+class NewLogEntriesTest(unittest.TestCase):
+    def test_excludes_known_insert_ids(self):
+        entries = [{"insertId": "1"}, {"insertId": "3"}]
+
+        actual = new_log_entries(entries, mock_prev_state())
+        self.assertEqual(actual, [{"insertId": "3"}])
+
+    def test_keeps_spilled_entries_on_disk(self):
+        with SpillStore(0, rss_fn=lambda: 1) as store:
+            store.extend([mock_entry("1", trace="a"), mock_entry("3", trace="a")])
+
+            actual = new_log_entries(store, mock_prev_state())
+
+            self.assertTrue(is_spilled(actual))
+            self.assertEqual([e["insertId"] for e in actual], ["3"])
+            self.assertEqual(len(actual), 1)
+
+
+class DeltaResponseDataTest(unittest.TestCase):
+    def test_replaces_search_state_with_delta(self):
+        state = sum_search_states(mock_prev_state(), mock_found_state())
+        resp_data = {
+            "searchState": state,
+            "filter": "foo",
+            "logEntries": [{"insertId": "2"}, {"insertId": "3"}],
+            "logEntryCount": 2,
+            "url": "http://foo/bar",
+        }
+
+        actual = delta_response_data(resp_data, mock_prev_state(), 1)
+
+        self.assertNotIn("searchState", actual)
+        self.assertEqual(actual["logEntries"], [{"insertId": "3"}])
+        self.assertEqual(actual["logEntryCount"], 1)
+        self.assertEqual(actual["searchStateDelta"]["version"], 1)
+        self.assertNotIn("filter", actual)
+        self.assertNotIn("url", actual)
+
+    def test_includes_filter_on_request(self):
+        resp_data = {
+            "searchState": mock_prev_state(),
+            "filter": "foo",
+            "logEntries": [],
+            "logEntryCount": 0,
+            "url": "http://foo/bar",
+        }
+
+        actual = delta_response_data(
+            resp_data, mock_prev_state(), 1, include_filter=True
+        )
+
+        self.assertEqual((actual["filter"], actual["url"]), ("foo", "http://foo/bar"))
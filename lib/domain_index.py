@@ -0,0 +1,201 @@
+import logging
+import os
+import re
+import sqlite3
+
+from .log_entry import as_dict
+from .timestamps import entry_timestamp_ns, ns_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# path of the SQLite database for the domain object index, e.g.
+# "/tmp/domain_index.db". correlations aren't indexed when unset.
+#
+# NOTE: same as SESSION_STORE, /tmp on Cloud Functions is local to each
+# instance; point this at shared storage to index across instances.
+DOMAIN_INDEX_ENV_VAR = "DOMAIN_INDEX"
+
+# domain object kind -> pattern in log messages. same as postsFound, recipesFound
+# and recipeCollectionsFound in gcp_logs_find.jq.
+DOMAIN_OBJECT_PATTERNS = {
+    "post": re.compile(r"post:(\d+)"),
+    "recipe": re.compile(r"recipe:(\d+)"),
+    "recipeCollection": re.compile(r"recipeCollection:(\d+)"),
+}
+
+
+def format_ns(ts_ns):
+    return ns_to_datetime(ts_ns).isoformat(timespec="microseconds") + "Z"
+
+
+def domain_object_refs(entries):
+    """
+    Finds the domain objects mentioned in the entries' log messages, returning
+    {(kind, id, trace id, requestId, project): [first ns, last ns]}. Entries
+    without a trace aren't indexed.
+    """
+    refs = {}
+
+    for entry in entries:
+        trace = entry.get("trace")
+        if not isinstance(trace, str):
+            continue
+
+        # decode compact entries once
+        entry = as_dict(entry)
+        proto_payload = entry.get("protoPayload") or {}
+        lines = proto_payload.get("line") or []
+        messages = [line.get("logMessage") or "" for line in lines]
+        if not messages:
+            continue
+
+        ts_ns = entry_timestamp_ns(entry) or 0
+        labels = (entry.get("resource") or {}).get("labels") or {}
+        context = (
+            trace.split("/")[-1],
+            proto_payload.get("requestId") or "",
+            labels.get("project_id") or "",
+        )
+
+        for (kind, pattern) in DOMAIN_OBJECT_PATTERNS.items():
+            object_ids = {m for message in messages for m in pattern.findall(message)}
+            for object_id in object_ids:
+                ref = refs.setdefault((kind, object_id, *context), [ts_ns, ts_ns])
+                ref[0] = min(ref[0], ts_ns)
+                ref[1] = max(ref[1], ts_ns)
+
+    return refs
+
+
+class DomainIndex:
+    """
+    Persistent index from domain objects (posts, recipes and recipe collections,
+    by id) to the traces and requestIds whose log entries mention them, and when.
+    Fed with the log entries of each correlation step, so it accumulates across
+    correlations. Recording the same entries again (e.g. re-running a
+    correlation) doesn't change anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS domain_refs ("
+                "kind TEXT, object_id TEXT, trace TEXT, request_id TEXT, "
+                "project TEXT, first_ns INTEGER, last_ns INTEGER, "
+                "PRIMARY KEY (kind, object_id, trace, request_id))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS domain_refs_by_time "
+                "ON domain_refs (kind, object_id, last_ns)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def record(self, entries):
+        """Indexes the entries' domain objects, returning how many refs they have."""
+        refs = domain_object_refs(entries)
+        if not refs:
+            return 0
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO domain_refs "
+                "(kind, object_id, trace, request_id, project, first_ns, last_ns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, object_id, trace, request_id) DO UPDATE SET "
+                "first_ns = min(first_ns, excluded.first_ns), "
+                "last_ns = max(last_ns, excluded.last_ns)",
+                [(*key, *ref) for (key, ref) in refs.items()],
+            )
+
+        return len(refs)
+
+    def lookup(self, kind, object_id, since_ns=None, until_ns=None):
+        """
+        Returns the traces (with their requestIds and time ranges) that mention
+        the domain object, limited to those overlapping since/until if given, or
+        None if there are none.
+        """
+        if kind not in DOMAIN_OBJECT_PATTERNS:
+            raise ValueError(f"Unknown domain object kind: {kind}")
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT trace, request_id, project, first_ns, last_ns "
+                "FROM domain_refs WHERE kind = ? AND object_id = ? "
+                "AND last_ns >= ? AND first_ns <= ? ORDER BY first_ns",
+                (
+                    kind,
+                    str(object_id),
+                    since_ns if since_ns is not None else 0,
+                    until_ns if until_ns is not None else 2**63 - 1,
+                ),
+            ).fetchall()
+
+        if not rows:
+            return None
+
+        traces = {}
+        for (trace, request_id, project, first_ns, last_ns) in rows:
+            t = traces.setdefault(
+                trace,
+                {
+                    "trace": trace,
+                    "project": project,
+                    "requestIds": [],
+                    "firstNs": first_ns,
+                    "lastNs": last_ns,
+                },
+            )
+            if request_id:
+                t["requestIds"].append(request_id)
+            t["firstNs"] = min(t["firstNs"], first_ns)
+            t["lastNs"] = max(t["lastNs"], last_ns)
+
+        for t in traces.values():
+            t["requestIds"] = sorted(set(t["requestIds"]))
+            t["timeRangeStart"] = format_ns(t.pop("firstNs"))
+            t["timeRangeEnd"] = format_ns(t.pop("lastNs"))
+
+        return {
+            "kind": kind,
+            "id": str(object_id),
+            "traces": list(traces.values()),
+            "requestIds": sorted({r for t in traces.values() for r in t["requestIds"]}),
+            "projects": sorted({t["project"] for t in traces.values() if t["project"]}),
+            "timeRangeStart": format_ns(min(r[3] for r in rows)),
+            "timeRangeEnd": format_ns(max(r[4] for r in rows)),
+        }
+
+
+_domain_index = None
+
+
+def get_domain_index():
+    """Returns the configured domain index, or None if indexing is disabled."""
+    global _domain_index
+
+    if _domain_index is None and os.environ.get(DOMAIN_INDEX_ENV_VAR):
+        _domain_index = DomainIndex(os.environ[DOMAIN_INDEX_ENV_VAR])
+        logger.info(f"Using domain index: {os.environ[DOMAIN_INDEX_ENV_VAR]}")
+
+    return _domain_index
+
+
+def record_domain_objects(entries):
+    """Feeds the configured domain index, if any; indexing never fails a step."""
+    if not entries:
+        return
+
+    try:
+        index = get_domain_index()
+        count = index.record(entries) if index else 0
+    except sqlite3.Error as err:
+        logger.warning(f"Could not update domain index: {err}")
+        return
+
+    if count:
+        logger.debug(f"Indexed {count} domain object refs")
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .domain_index import (
+    DomainIndex,
+    domain_object_refs,
+    get_domain_index,
+    record_domain_objects,
+)
+from .log_entry import LogEntry
+from .testing import mock_entry
+from .timestamps import parse_timestamp_ns
+
+
+def mock_request_entry(insert_id, timestamp, trace, request_id, *messages):
+    proto = {"requestId": request_id, "line": [{"logMessage": m} for m in messages]}
+    return mock_entry(insert_id, trace=trace, timestamp=timestamp, protoPayload=proto)
+
+
+def mock_entries():
+    return [
+        mock_request_entry(
+            "1", "2022-11-29T16:00:01.000Z", "abc", "req1", "saved post:123"
+        ),
+        mock_request_entry(
+            "2",
+            "2022-11-29T16:00:05.000Z",
+            "abc",
+            "req1",
+            "post:123 in recipeCollection:7",
+        ),
+        mock_request_entry(
+            "3", "2022-11-30T09:00:00.000Z", "def", "req2", "recipe:9 post:123"
+        ),
+        mock_request_entry(
+            "4", "2022-11-30T09:00:01.000Z", "ghi", "req3", "nothing here"
+        ),
+    ]
+
+
+class DomainObjectRefsTest(unittest.TestCase):
+    def test_finds_refs_by_trace_and_request(self):
+        refs = domain_object_refs(mock_entries())
+
+        self.assertEqual(
+            sorted(refs),
+            [
+                ("post", "123", "abc", "req1", "gen-prod"),
+                ("post", "123", "def", "req2", "gen-prod"),
+                ("recipe", "9", "def", "req2", "gen-prod"),
+                ("recipeCollection", "7", "abc", "req1", "gen-prod"),
+            ],
+        )
+        # first and last mention within the trace
+        self.assertEqual(
+            refs[("post", "123", "abc", "req1", "gen-prod")],
+            [
+                parse_timestamp_ns("2022-11-29T16:00:01.000Z"),
+                parse_timestamp_ns("2022-11-29T16:00:05.000Z"),
+            ],
+        )
+
+    def test_compact_entries(self):
+        self.assertEqual(
+            domain_object_refs(LogEntry.wrap_all(mock_entries())),
+            domain_object_refs(mock_entries()),
+        )
+
+
+class DomainIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.index = DomainIndex(os.path.join(self.tmpdir.name, "index.db"))
+
+    def test_lookup(self):
+        self.index.record(mock_entries())
+
+        result = self.index.lookup("post", "123")
+        self.assertEqual([t["trace"] for t in result["traces"]], ["abc", "def"])
+        self.assertEqual(result["requestIds"], ["req1", "req2"])
+        self.assertEqual(result["projects"], ["gen-prod"])
+        self.assertEqual(result["timeRangeStart"], "2022-11-29T16:00:01.000000Z")
+        self.assertEqual(result["timeRangeEnd"], "2022-11-30T09:00:00.000000Z")
+
+        self.assertIsNone(self.index.lookup("post", "456"))
+        with self.assertRaises(ValueError):
+            self.index.lookup("user", "1")
+
+    def test_lookup_within_time_range(self):
+        self.index.record(mock_entries())
+
+        result = self.index.lookup(
+            "post", 123, since_ns=parse_timestamp_ns("2022-11-30T00:00:00Z")
+        )
+        self.assertEqual([t["trace"] for t in result["traces"]], ["def"])
+
+    def test_accumulates_across_correlations(self):
+        self.index.record(mock_entries()[:1])
+        self.index.record(mock_entries()[1:])
+        # recording the same entries again doesn't change anything
+        self.index.record(mock_entries())
+
+        (trace,) = [
+            t for t in self.index.lookup("post", "123")["traces"] if t["trace"] == "abc"
+        ]
+        self.assertEqual(trace["timeRangeStart"], "2022-11-29T16:00:01.000000Z")
+        self.assertEqual(trace["timeRangeEnd"], "2022-11-29T16:00:05.000000Z")
+
+    def test_record_from_env(self):
+        path = os.path.join(self.tmpdir.name, "env.db")
+
+        with mock.patch.dict(os.environ, {"DOMAIN_INDEX": path}), mock.patch(
+            "lib.domain_index._domain_index", None
+        ):
+            record_domain_objects(mock_entries())
+            self.assertIsNotNone(get_domain_index().lookup("recipe", "9"))
+
+
+if __name__ == "__main__":
+    unittest.main()
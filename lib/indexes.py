@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+
+from .timestamps import entry_timestamp_end_ns, entry_timestamp_ns
+
+logger = logging.getLogger(__name__)
+
+# index name -> file in the trace dir, same as the index_log_entries_by_*.jq
+# programs' output
+INDEX_FILES = {
+    "insertId": "log_entries_by_insert_id.json",
+    "requestId": "log_entries_by_request_id.json",
+    "traceId": "log_entries_by_trace_id.json",
+}
+# what's been merged so far, and what's needed to merge more
+INDEX_STATE_FILE = ".indexes.json"
+
+_decoder = json.JSONDecoder()
+
+
+def format_trace_id(trace):
+    """Only the trailing ID of the trace string, same as formatTraceId in utils.jq."""
+    return trace.split("/")[-1]
+
+
+def add_sort_time(entry):
+    """Same as addSortTime in index_log_entries_by_trace_id.jq."""
+    proto_payload = entry.get("protoPayload")
+
+    return dict(
+        entry,
+        _timestampEnd=(
+            proto_payload.get("endTime")
+            if proto_payload is not None
+            else entry.get("timestamp")
+        ),
+    )
+
+
+class JsonObjectFile:
+    """
+    A JSON object file written with one key per line, so keys can be added or
+    replaced without decoding (or encoding) the other keys' values: those lines
+    are copied as is. Files are replaced atomically, so readers always see a
+    complete object.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def _line(key, value):
+        return f"{json.dumps(key)}: {json.dumps(value, separators=(',', ':'))}"
+
+    def update(self, changes, merge=None):
+        """
+        Adds the changed keys' values. With merge, merge(old value, change)
+        gives the value of a key that exists already (and merge(None, change)
+        of a new one). Without, the keys must be new; the existing file is then
+        copied without looking at its keys.
+        """
+        if not changes and os.path.exists(self.path):
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        changes = dict(changes)
+        with open(tmp_path, "w") as f:
+            count = self._merge_lines(f, changes, merge) if merge else self._copy(f)
+
+            for (key, change) in changes.items():
+                value = merge(None, change) if merge else change
+                f.write(",\n" if count else "\n")
+                f.write(self._line(key, value))
+                count += 1
+
+            f.write("\n}\n")
+
+        os.replace(tmp_path, self.path)
+
+    def _copy(self, f):
+        """Copies the existing object, without its closing brace, to f."""
+        if not os.path.exists(self.path):
+            f.write("{")
+            return 0
+
+        with open(self.path, "r") as existing:
+            body = existing.read().rstrip()[:-1].rstrip()
+
+        f.write(body)
+        return int(body != "{")
+
+    def _merge_lines(self, f, changes, merge):
+        """
+        Copies the existing object, without its closing brace, to f, merging the
+        changes of existing keys (which are removed from changes).
+        """
+        if not os.path.exists(self.path):
+            f.write("{")
+            return 0
+
+        # compact JSON has no raw newlines, so lines are exactly the keys (plus
+        # the braces)
+        with open(self.path, "r") as existing:
+            lines = existing.read().rstrip().split("\n")[1:-1]
+
+        # a line's key is matched by its encoding, which is always the same
+        encoded_keys = {json.dumps(key): key for key in changes}
+
+        for (i, line) in enumerate(lines):
+            encoded_key = line[: line.find('": ') + 1]
+            # keys with escaped quotes could end early; decode those properly
+            if encoded_key.endswith('\\"'):
+                encoded_key = json.dumps(_decoder.raw_decode(line)[0])
+
+            key = encoded_keys.get(encoded_key)
+            if key is not None and key in changes:
+                comma = "," if line.endswith(",") else ""
+                old = json.loads(line[len(encoded_key) + 1 :].rstrip(","))
+                lines[i] = self._line(key, merge(old, changes.pop(key))) + comma
+
+        f.write("{\n" + "\n".join(lines) if lines else "{")
+        return len(lines)
+
+
+class LogEntryIndexes:
+    """
+    Keeps a trace dir's log_entries_by_{insert,request,trace}_id.json up to date
+    as step responses come in, instead of rebuilding them from all log entries
+    once querying is done. Merging a step only decodes the new entries and the
+    requests and traces they belong to, so the indexes can be used mid-run.
+
+    Orphan entries (without a trace) are assigned to their request's trace via
+    a map of operation (request) IDs to traces; orphans whose request hasn't
+    been found yet wait for a later step. Unlike the .jq programs, entries found
+    by more than one step are only indexed once.
+    """
+
+    def __init__(self, trace_path):
+        self.trace_path = trace_path
+        self.state_path = os.path.join(trace_path, INDEX_STATE_FILE)
+
+        state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        elif any(os.path.exists(self._path(name)) for name in INDEX_FILES):
+            # built by the .jq programs; start over
+            for name in INDEX_FILES:
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+
+        # step file -> [size, mtime ns] when merged
+        self.steps = state.get("steps") or {}
+        self.insert_ids = set(state.get("insertIds") or [])
+        # request ID -> [end ns, trace ID] of its last entry with a trace
+        self.request_traces = state.get("requestTraces") or {}
+        self.orphans = state.get("orphans") or []
+
+    def _path(self, name):
+        return os.path.join(self.trace_path, INDEX_FILES[name])
+
+    @staticmethod
+    def _step_signature(step_file):
+        stat = os.stat(step_file)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def is_merged(self, step_file):
+        return self.steps.get(os.path.basename(step_file)) == self._step_signature(
+            step_file
+        )
+
+    def merge_step(self, step_file):
+        """Merges a step response's log entries, unless it's merged already."""
+        if self.is_merged(step_file):
+            return 0
+
+        with open(step_file, "r") as f:
+            entries = json.load(f).get("logEntries") or []
+
+        count = self.add(entries)
+        self.steps[os.path.basename(step_file)] = self._step_signature(step_file)
+        self.save_state()
+
+        return count
+
+    def add(self, entries):
+        """Indexes the entries not seen before, returning how many there were."""
+        by_insert_id = {}
+        for entry in entries:
+            insert_id = entry.get("insertId")
+            if insert_id is None:
+                continue
+            if insert_id not in self.insert_ids and insert_id not in by_insert_id:
+                by_insert_id[insert_id] = entry
+
+        new_entries = sorted(by_insert_id.values(), key=entry_timestamp_ns)
+
+        by_request_id = {}
+        by_trace_id = {}
+        for entry in new_entries:
+            proto_payload = entry.get("protoPayload")
+            request_id = (proto_payload or {}).get("requestId")
+            if request_id is not None:
+                by_request_id.setdefault(request_id, []).append(entry)
+
+            trace = entry.get("trace")
+            if trace:
+                by_trace_id.setdefault(format_trace_id(trace), []).append(entry)
+                if request_id is not None:
+                    self._add_request_trace(request_id, entry, trace)
+            else:
+                self.orphans.append(entry)
+
+        # orphans from earlier steps may belong to requests found in this one
+        pending = []
+        for entry in self.orphans:
+            operation_id = (entry.get("operation") or {}).get("id")
+            (_, trace_id) = self.request_traces.get(operation_id) or (None, None)
+            if trace_id:
+                by_trace_id.setdefault(trace_id, []).append(entry)
+            else:
+                pending.append(entry)
+        self.orphans = pending
+
+        JsonObjectFile(self._path("insertId")).update(by_insert_id)
+        JsonObjectFile(self._path("requestId")).update(
+            by_request_id,
+            lambda old, new: sorted((old or []) + new, key=entry_timestamp_end_ns),
+        )
+        JsonObjectFile(self._path("traceId")).update(
+            by_trace_id,
+            lambda old, new: sorted(
+                (old or []) + [add_sort_time(e) for e in new],
+                key=entry_timestamp_end_ns,
+            ),
+        )
+
+        self.insert_ids.update(by_insert_id)
+        if self.orphans:
+            logger.debug(f"{len(self.orphans)} orphan entries without a trace yet")
+
+        return len(new_entries)
+
+    def _add_request_trace(self, request_id, entry, trace):
+        # the request's last entry has its trace, same as traceIdFromEntry in
+        # index_log_entries_by_trace_id.jq assumes
+        end_ns = entry_timestamp_end_ns(entry)
+        (prev_end_ns, _) = self.request_traces.get(request_id) or (None, None)
+        if prev_end_ns is None or end_ns >= prev_end_ns:
+            self.request_traces[request_id] = [end_ns, format_trace_id(trace)]
+
+    def save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            # dumps() encodes in C, dump() doesn't
+            f.write(
+                json.dumps(
+                    {
+                        "steps": self.steps,
+                        "insertIds": list(self.insert_ids),
+                        "requestTraces": self.request_traces,
+                        "orphans": self.orphans,
+                    }
+                )
+            )
+
+        os.replace(tmp_path, self.state_path)
+
+
+def step_number(step_file):
+    name = os.path.basename(step_file)
+    return int(name.split("_")[1].split(".")[0])
+
+
+def update_indexes(trace_path, step_files=None):
+    """
+    Merges step responses (by default, all of the trace dir's step_N.resp.json
+    files not merged yet) into the trace dir's indexes, returning how many new
+    log entries they had.
+    """
+    if step_files is None:
+        step_files = [
+            os.path.join(trace_path, f)
+            for f in os.listdir(trace_path)
+            if f.startswith("step_") and f.endswith(".resp.json")
+        ]
+
+    indexes = LogEntryIndexes(trace_path)
+    return sum(indexes.merge_step(f) for f in sorted(step_files, key=step_number))
@@ -0,0 +1,170 @@
+import json
+import os
+import tempfile
+import unittest
+
+from .indexes import INDEX_FILES, JsonObjectFile, LogEntryIndexes, update_indexes
+
+
+def mock_request_entry(insert_id, request_id, trace, timestamp, end_time):
+    return {
+        "insertId": insert_id,
+        "timestamp": timestamp,
+        "trace": f"projects/gen-prod/traces/{trace}",
+        "protoPayload": {"requestId": request_id, "endTime": end_time},
+    }
+
+
+def mock_orphan_entry(insert_id, operation_id, timestamp):
+    return {
+        "insertId": insert_id,
+        "timestamp": timestamp,
+        "operation": {"id": operation_id},
+        "jsonPayload": {"message": "no trace"},
+    }
+
+
+def mock_json_entry(insert_id, trace, timestamp):
+    return {
+        "insertId": insert_id,
+        "timestamp": timestamp,
+        "trace": f"projects/gen-prod/traces/{trace}",
+        "jsonPayload": {"message": "hi"},
+    }
+
+
+class JsonObjectFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "index.json")
+
+    def read(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_adds_and_merges_keys(self):
+        index = JsonObjectFile(self.path)
+
+        index.update({})
+        self.assertEqual(self.read(), {})
+
+        index.update({"a": [1], "b": [2]})
+        index.update({"b": [3], "c": [4]}, lambda old, new: (old or []) + new)
+        self.assertEqual(self.read(), {"a": [1], "b": [2, 3], "c": [4]})
+
+        index.update({"d": [6]})
+        self.assertEqual(self.read(), {"a": [1], "b": [2, 3], "c": [4], "d": [6]})
+
+    def test_odd_keys(self):
+        index = JsonObjectFile(self.path)
+
+        index.update({'with "quotes": and, commas': 1, "ünïcode": {"x": ":"}})
+        index.update({"ünïcode": {"y": 2}}, lambda old, new: dict(old, **new))
+
+        self.assertEqual(
+            self.read(),
+            {'with "quotes": and, commas': 1, "ünïcode": {"x": ":", "y": 2}},
+        )
+
+
+class LogEntryIndexesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.trace_path = self.tmpdir.name
+
+    def write_step(self, i, entries):
+        filename = os.path.join(self.trace_path, f"step_{i}.resp.json")
+        with open(filename, "w") as f:
+            json.dump({"logEntries": entries}, f)
+
+        return filename
+
+    def read_index(self, name):
+        with open(os.path.join(self.trace_path, INDEX_FILES[name])) as f:
+            return json.load(f)
+
+    def test_merges_steps_as_they_come(self):
+        self.write_step(
+            0,
+            [
+                mock_request_entry(
+                    "r2",
+                    "req1",
+                    "abc",
+                    "2022-11-29T16:00:01.000Z",
+                    "2022-11-29T16:00:03.000Z",
+                ),
+                mock_json_entry("j1", "abc", "2022-11-29T16:00:02.000Z"),
+                # its request isn't known yet
+                mock_orphan_entry("o1", "req2", "2022-11-29T16:00:04.000Z"),
+            ],
+        )
+        self.assertEqual(update_indexes(self.trace_path), 3)
+
+        self.assertEqual(sorted(self.read_index("insertId")), ["j1", "o1", "r2"])
+        self.assertEqual(list(self.read_index("requestId")), ["req1"])
+        by_trace_id = self.read_index("traceId")
+        self.assertEqual([e["insertId"] for e in by_trace_id["abc"]], ["j1", "r2"])
+        self.assertEqual(
+            by_trace_id["abc"][1]["_timestampEnd"], "2022-11-29T16:00:03.000Z"
+        )
+
+        # entries found again aren't indexed twice; the orphan's request shows up
+        self.write_step(
+            1,
+            [
+                mock_request_entry(
+                    "r2",
+                    "req1",
+                    "abc",
+                    "2022-11-29T16:00:01.000Z",
+                    "2022-11-29T16:00:03.000Z",
+                ),
+                mock_request_entry(
+                    "r1",
+                    "req1",
+                    "abc",
+                    "2022-11-29T16:00:00.000Z",
+                    "2022-11-29T16:00:00.500Z",
+                ),
+                mock_request_entry(
+                    "r3",
+                    "req2",
+                    "def",
+                    "2022-11-29T16:00:03.000Z",
+                    "2022-11-29T16:00:05.000Z",
+                ),
+            ],
+        )
+        self.assertEqual(update_indexes(self.trace_path), 2)
+        # merged steps are skipped
+        self.assertEqual(update_indexes(self.trace_path), 0)
+
+        self.assertEqual(
+            [e["insertId"] for e in self.read_index("requestId")["req1"]], ["r1", "r2"]
+        )
+        by_trace_id = self.read_index("traceId")
+        self.assertEqual(
+            [e["insertId"] for e in by_trace_id["abc"]], ["r1", "j1", "r2"]
+        )
+        self.assertEqual([e["insertId"] for e in by_trace_id["def"]], ["o1", "r3"])
+        self.assertEqual(len(self.read_index("insertId")), 5)
+
+    def test_replaces_jq_built_indexes(self):
+        for filename in INDEX_FILES.values():
+            with open(os.path.join(self.trace_path, filename), "w") as f:
+                json.dump({"stale": []}, f, indent=2)
+
+        step_file = self.write_step(
+            0, [mock_json_entry("j1", "abc", "2022-11-29T16:00:02.000Z")]
+        )
+        LogEntryIndexes(self.trace_path).merge_step(step_file)
+
+        self.assertEqual(list(self.read_index("traceId")), ["abc"])
+        self.assertEqual(self.read_index("requestId"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
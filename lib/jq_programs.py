@@ -0,0 +1,33 @@
+import os
+import re
+
+import jq
+
+# the root-level post-processing programs use `module` and `include` directives,
+# which the jq python bindings can't resolve (no library path option), so
+# includes are inlined from the including program's directory.
+MODULE_RE = re.compile(r"^\s*module\s*\{.*?\};", re.DOTALL)
+INCLUDE_RE = re.compile(r'^include\s+"([^"]+)"\s*;', re.MULTILINE)
+
+
+def read_jq_program(path, _seen=None):
+    """Reads a jq program with any `include "<name>";` directives inlined."""
+    seen = _seen if _seen is not None else set()
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    with open(path, "r") as f:
+        program = MODULE_RE.sub("", f.read(), count=1)
+
+    def inline(match):
+        include_path = os.path.join(base_dir, f"{match.group(1)}.jq")
+        if include_path in seen:
+            return ""
+
+        seen.add(include_path)
+        return read_jq_program(include_path, seen)
+
+    return INCLUDE_RE.sub(inline, program)
+
+
+def compile_jq_program(path, args=None):
+    return jq.compile(read_jq_program(path), args=args)
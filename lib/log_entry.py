@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+from collections.abc import Mapping
+
+from .timestamps import entry_timestamp_end_ns, entry_timestamp_ns
+
+# e.g. COMPACT_LOG_ENTRIES=true. unset means plain dicts (as before).
+COMPACT_ENTRIES_ENV = "COMPACT_LOG_ENTRIES"
+
+
+def compact_entries_from_env():
+    return os.environ.get(COMPACT_ENTRIES_ENV, "").lower() in ["1", "true", "yes"]
+
+
+class LogEntry(Mapping):
+    """
+    Compact, read-only log entry. The fields Python code reads for every entry
+    (ids, parsed timestamps, trace, project) are extracted once into slots; the
+    whole entry is kept as compact JSON bytes, only decoded when something asks
+    for any other field. Works as a drop-in for an entry dict when reading (e.g.
+    entry.get("trace")), and the raw bytes go straight into jq input, which
+    extracts everything else (see gcp_logs_find.jq).
+
+    Use to_dict() (or json_default() with json.dumps()) for output; to_dict()
+    returns the same dict as the entry it was created from.
+    """
+
+    __slots__ = (
+        "insert_id",
+        "timestamp_ns",
+        "timestamp_end_ns",
+        "trace",
+        "operation_id",
+        "project_id",
+        "raw",
+    )
+
+    def __init__(self, entry):
+        project_id = ((entry.get("resource") or {}).get("labels") or {}).get(
+            "project_id"
+        )
+
+        self.insert_id = entry.get("insertId")
+        self.timestamp_ns = entry_timestamp_ns(entry)
+        self.timestamp_end_ns = entry_timestamp_end_ns(entry)
+        self.trace = entry.get("trace")
+        self.operation_id = (entry.get("operation") or {}).get("id")
+        # a handful of projects across all entries
+        self.project_id = sys.intern(project_id) if project_id else None
+        self.raw = json.dumps(entry, separators=(",", ":")).encode()
+
+    # payload fields are only read once per step (by jq), so they're decoded on
+    # demand rather than kept around
+
+    @property
+    def request_id(self):
+        return (self.get("protoPayload") or {}).get("requestId")
+
+    @property
+    def task_name(self):
+        return (self.get("protoPayload") or {}).get("taskName")
+
+    @property
+    def log_messages(self):
+        lines = (self.get("protoPayload") or {}).get("line") or []
+        return tuple(line.get("logMessage") for line in lines)
+
+    @property
+    def pubsub_message_id(self):
+        message = (self.get("jsonPayload") or {}).get("pubSubMessage") or {}
+        return message.get("message_id")
+
+    @classmethod
+    def wrap_all(cls, entries):
+        """Wraps entry dicts, leaving already wrapped ones as they are."""
+        return [e if isinstance(e, cls) else cls(e) for e in entries]
+
+    def to_dict(self):
+        return json.loads(self.raw)
+
+    # these are served without decoding the entry; trace is the only one that
+    # can be missing
+    def __getitem__(self, key):
+        if key == "insertId":
+            return self.insert_id
+        if key == "trace" and self.trace is not None:
+            return self.trace
+
+        return self.to_dict()[key]
+
+    def __contains__(self, key):
+        if key == "insertId":
+            return True
+
+        return key in self.to_dict()
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, LogEntry):
+            return self.raw == other.raw
+
+        return isinstance(other, Mapping) and self.to_dict() == dict(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"LogEntry({self.insert_id!r}, {self.timestamp_ns!r})"
+
+
+def as_dict(entry):
+    return entry.to_dict() if isinstance(entry, LogEntry) else entry
+
+
+def json_default(obj):
+    """`default` for json.dumps() et al., for data that may have LogEntry values."""
+    if isinstance(obj, LogEntry):
+        return obj.to_dict()
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def log_entries_json_text(entries):
+    """A JSON array of the entries, without re-serializing LogEntry values."""
+    return (b"[" + b",".join(e.raw for e in entries) + b"]").decode("utf-8")
@@ -0,0 +1,101 @@
+import json
+import unittest
+
+from .correlate_logs import extract_search_state_from_log_entries, find_entries
+from .log_entry import LogEntry, json_default
+from .spill import SpillStore, iter_json
+from .testing import mock_entry, mock_state
+
+
+def mock_request_entry(insert_id="1", second=1):
+    return mock_entry(
+        insert_id,
+        second,
+        operation={"id": "op1", "first": True},
+        resource={"labels": {"project_id": "gen-prod", "module_id": "default"}},
+        protoPayload={
+            "requestId": "req1",
+            "endTime": "2022-11-29T16:00:01.500Z",
+            "line": [
+                {"logMessage": "task:123"},
+                {"logMessage": "trace:projects/gen-prod/traces/def"},
+            ],
+        },
+    )
+
+
+class LogEntryTest(unittest.TestCase):
+    def test_extracts_fields(self):
+        entry = LogEntry(mock_request_entry())
+
+        self.assertEqual(entry.insert_id, "1")
+        self.assertEqual(entry.trace, "projects/gen-prod/traces/abc")
+        self.assertEqual(entry.operation_id, "op1")
+        self.assertEqual(entry.request_id, "req1")
+        self.assertEqual(
+            entry.log_messages, ("task:123", "trace:projects/gen-prod/traces/def")
+        )
+        self.assertEqual(entry.project_id, "gen-prod")
+        self.assertEqual(entry.timestamp_end_ns - entry.timestamp_ns, 500_000_000)
+
+    def test_reads_like_a_dict(self):
+        entry = LogEntry(mock_request_entry())
+
+        self.assertEqual(entry.get("insertId"), "1")
+        self.assertEqual(entry["protoPayload"]["requestId"], "req1")
+        self.assertIsNone(entry.get("jsonPayload"))
+        self.assertIn("protoPayload", entry)
+        # same as the dict
+        self.assertEqual(entry.to_dict(), mock_request_entry())
+        self.assertEqual(entry, LogEntry(mock_request_entry()))
+
+    def test_serializes_as_its_dict(self):
+        entry = LogEntry(mock_request_entry())
+        data = {"logEntries": [entry]}
+
+        self.assertEqual(
+            json.loads(json.dumps(data, default=json_default)),
+            {"logEntries": [entry.to_dict()]},
+        )
+        self.assertEqual(
+            json.loads("".join(iter_json(data))), {"logEntries": [entry.to_dict()]}
+        )
+
+    def test_extracts_same_search_state(self):
+        entries = [mock_request_entry("1"), mock_request_entry("2", 2)]
+
+        self.assertEqual(
+            extract_search_state_from_log_entries(LogEntry.wrap_all(entries)),
+            extract_search_state_from_log_entries(entries),
+        )
+
+    def test_spills_raw_entries(self):
+        store = SpillStore(0, rss_fn=lambda: 1)
+        store.extend([LogEntry(mock_request_entry())])
+
+        self.assertEqual(store.spilled_count, 1)
+        self.assertEqual(list(store), [mock_request_entry()])
+        store.close()
+
+
+class CompactFindEntriesTest(unittest.TestCase):
+    def test_same_response_as_dicts(self):
+        def query_fn(query, project=None):
+            return [mock_request_entry("2", 2), mock_request_entry("1")]
+
+        (_, resp_data) = find_entries(mock_state(), query_fn=query_fn)
+        (_, compact_resp_data) = find_entries(
+            mock_state(), query_fn=query_fn, compact=True
+        )
+
+        self.assertTrue(
+            all(isinstance(e, LogEntry) for e in compact_resp_data["logEntries"])
+        )
+        self.assertEqual(
+            json.dumps(compact_resp_data, default=json_default),
+            json.dumps(resp_data),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
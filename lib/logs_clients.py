@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import threading
+
+import google.auth
+import google.cloud.logging
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud.logging_v2._gapic import _parse_log_entry
+from google.cloud.logging_v2.client import _add_defaults_to_filter
+from google.cloud.logging_v2.types import ListLogEntriesRequest
+from google.cloud.logging_v2.types import LogEntry as LogEntryPB
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ["http", "grpc"]
+
+# HTTP (JSON) is what we've always used. unset page size means the API's default
+# (up to 1000 entries), and unset pool size means requests' default (10).
+DEFAULT_LOGS_TRANSPORT = os.environ.get("LOGS_TRANSPORT", "http")
+DEFAULT_LOGS_PAGE_SIZE = int(os.environ.get("LOGS_PAGE_SIZE", 0)) or None
+DEFAULT_LOGS_POOL_SIZE = int(os.environ.get("LOGS_POOL_SIZE", 0)) or None
+
+
+class RawLogEntries(list):
+    """
+    Log entries (API representation) along with the JSON text of the entries.list
+    responses they were parsed from, so jq can take the text as is instead of
+    the entries being serialized again. `texts` is None once entries without a
+    response text (e.g. from gRPC) are added.
+    """
+
+    def __init__(self, entries=(), texts=None):
+        super().__init__(entries)
+        self.texts = texts if texts is not None else ([] if not entries else None)
+
+    def extend(self, entries):
+        super().extend(entries)
+
+        texts = getattr(entries, "texts", None)
+        if self.texts is not None and texts is not None:
+            self.texts.extend(texts)
+        else:
+            self.texts = None
+
+    def __iadd__(self, entries):
+        self.extend(entries)
+        return self
+
+    def append(self, entry):
+        super().append(entry)
+        self.texts = None
+
+
+class LogsClientManager:
+    """
+    Owns one Logging client per project (created on first use), all using the
+    same transport, page size and (for HTTP) connection pool size. Clients are
+    thread-safe, so each is shared by all queries for its project.
+    """
+
+    def __init__(
+        self,
+        transport=DEFAULT_LOGS_TRANSPORT,
+        page_size=DEFAULT_LOGS_PAGE_SIZE,
+        pool_size=DEFAULT_LOGS_POOL_SIZE,
+        client_factory=google.cloud.logging.Client,
+    ):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown Logging API transport: {transport}")
+
+        self.transport = transport
+        self.page_size = page_size
+        self.pool_size = pool_size
+        self.client_factory = client_factory
+
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _http_session(self):
+        (credentials, _) = google.auth.default(scopes=google.cloud.logging.Client.SCOPE)
+        session = AuthorizedSession(credentials)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+
+        return session
+
+    def client(self, project=None):
+        """The client for the project; no project means the default project."""
+        with self._lock:
+            if project not in self._clients:
+                kwargs = {"_use_grpc": self.transport == "grpc"}
+                if self.transport == "http" and self.pool_size:
+                    kwargs["_http"] = self._http_session()
+
+                self._clients[project] = self.client_factory(project=project, **kwargs)
+                logger.debug(
+                    f"Created {self.transport} Logging client for "
+                    f"{project or 'default project'}"
+                )
+
+            return self._clients[project]
+
+    def fetch_page(self, query, project=None, page_token=None, page_size=None):
+        """
+        Fetches a single page of log entries, returning (entries, next_page_token).
+        Entries are in their API (JSON) representation, same as to_api_repr().
+        Over HTTP, they're RawLogEntries with the response's JSON text.
+        """
+        client = self.client(project)
+        resource_name = f"projects/{project or client.project}"
+        page_size = page_size or self.page_size
+        # same defaults as client.list_entries()
+        query = _add_defaults_to_filter(query)
+
+        if self.transport == "grpc":
+            return _fetch_page_grpc(client, resource_name, query, page_token, page_size)
+
+        return _fetch_page_http(client, resource_name, query, page_token, page_size)
+
+
+def _fetch_page_http(client, resource_name, query, page_token, page_size):
+    data = {"resourceNames": [resource_name], "filter": query}
+    if page_size:
+        data["pageSize"] = page_size
+    if page_token:
+        data["pageToken"] = page_token
+
+    # keep the response text around for jq (see RawLogEntries). json.loads() is
+    # what api_request() would do anyway.
+    body = client._connection.api_request(
+        method="POST", path="/entries:list", data=data, expect_json=False
+    )
+    text = body.decode("utf-8") if body else "{}"
+    resp = json.loads(text)
+
+    return (RawLogEntries(resp.get("entries", []), [text]), resp.get("nextPageToken"))
+
+
+def _fetch_page_grpc(client, resource_name, query, page_token, page_size):
+    request = ListLogEntriesRequest(
+        resource_names=[resource_name],
+        filter=query,
+        page_size=page_size,
+        page_token=page_token,
+    )
+    # the pager fetches later pages lazily, so this is a single API call
+    pager = client.logging_api._gapic_api.list_log_entries(request=request)
+    page = next(iter(pager.pages))
+
+    # same conversion as client.list_entries(), minus building LogEntry objects
+    entries = [_parse_log_entry(LogEntryPB.pb(e)) for e in page.entries]
+
+    return (entries, page.next_page_token or None)
@@ -0,0 +1,138 @@
+import json
+import unittest
+from unittest import mock
+
+import google.cloud.logging
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.logging_v2.types import ListLogEntriesResponse, LogEntry
+
+from .logs_clients import LogsClientManager
+
+
+def mock_client_factory(project=None, **kwargs):
+    client = mock.Mock(project=project or "gen-prod", kwargs=kwargs)
+    client._connection.api_request.return_value = json.dumps(
+        {"entries": [{"insertId": "1"}], "nextPageToken": "page2"}
+    ).encode()
+
+    pager = client.logging_api._gapic_api.list_log_entries.return_value
+    pager.pages = iter(
+        [
+            ListLogEntriesResponse(
+                entries=[LogEntry(insert_id="1", text_payload="hi")],
+                next_page_token="page2",
+            )
+        ]
+    )
+
+    return client
+
+
+def real_client_factory(project=None, **kwargs):
+    return google.cloud.logging.Client(
+        project=project or "gen-prod", credentials=AnonymousCredentials(), **kwargs
+    )
+
+
+class LogsClientManagerTest(unittest.TestCase):
+    def test_one_client_per_project(self):
+        manager = LogsClientManager(client_factory=mock_client_factory)
+
+        self.assertIs(manager.client("gen-prod"), manager.client("gen-prod"))
+        self.assertIsNot(manager.client("gen-prod"), manager.client("other"))
+        self.assertEqual(manager.client("other").project, "other")
+
+    def test_rejects_unknown_transport(self):
+        with self.assertRaises(ValueError):
+            LogsClientManager(transport="carrier-pigeon")
+
+    def test_http_fetch_page(self):
+        manager = LogsClientManager(
+            transport="http", page_size=50, client_factory=mock_client_factory
+        )
+
+        (entries, token) = manager.fetch_page('trace="abc"', "gen-prod", "page1")
+
+        self.assertEqual(entries, [{"insertId": "1"}])
+        self.assertEqual(token, "page2")
+        # the response text is kept for jq
+        self.assertEqual(json.loads(entries.texts[0])["entries"], entries)
+
+        client = manager.client("gen-prod")
+        self.assertFalse(client.kwargs["_use_grpc"])
+        data = client._connection.api_request.call_args.kwargs["data"]
+        self.assertEqual(data["resourceNames"], ["projects/gen-prod"])
+        self.assertEqual(data["pageSize"], 50)
+        self.assertEqual(data["pageToken"], "page1")
+
+    def test_grpc_fetch_page(self):
+        manager = LogsClientManager(
+            transport="grpc", page_size=50, client_factory=mock_client_factory
+        )
+
+        (entries, token) = manager.fetch_page('trace="abc"', "gen-prod")
+
+        self.assertEqual(entries, [{"insertId": "1", "textPayload": "hi"}])
+        self.assertEqual(token, "page2")
+
+        client = manager.client("gen-prod")
+        self.assertTrue(client.kwargs["_use_grpc"])
+        request = client.logging_api._gapic_api.list_log_entries.call_args.kwargs[
+            "request"
+        ]
+        self.assertEqual(request.page_size, 50)
+        self.assertEqual(list(request.resource_names), ["projects/gen-prod"])
+
+
+class ClientInternalsTest(unittest.TestCase):
+    """
+    fetch_page() uses google-cloud-logging internals (see requirements.txt for
+    the versions it's pinned to); these fail if they go away.
+    """
+
+    def test_http_internals(self):
+        manager = LogsClientManager(
+            transport="http", client_factory=real_client_factory
+        )
+        client = manager.client("gen-prod")
+        text = json.dumps({"entries": [{"insertId": "1"}]})
+
+        # the raw response text (expect_json=False) is what goes to jq
+        with mock.patch.object(
+            client._connection, "api_request", autospec=True
+        ) as api_request:
+            api_request.return_value = text.encode()
+            (entries, token) = manager.fetch_page(
+                'timestamp>="2022-11-29T16:00:00Z"', "gen-prod"
+            )
+
+        self.assertEqual(entries, [{"insertId": "1"}])
+        self.assertEqual(entries.texts, [text])
+        self.assertIsNone(token)
+
+    def test_grpc_internals(self):
+        manager = LogsClientManager(
+            transport="grpc", client_factory=real_client_factory
+        )
+        client = manager.client("gen-prod")
+        response = ListLogEntriesResponse(
+            entries=[LogEntry(insert_id="1", text_payload="hi")]
+        )
+
+        with mock.patch.object(
+            client.logging_api._gapic_api, "list_log_entries", autospec=True
+        ) as list_log_entries:
+            list_log_entries.return_value.pages = iter([response])
+            (entries, token) = manager.fetch_page(
+                'timestamp>="2022-11-29T16:00:00Z"', "gen-prod"
+            )
+
+        self.assertEqual(entries, [{"insertId": "1", "textPayload": "hi"}])
+        self.assertIsNone(token)
+        # timestamped filters are left as they are
+        request = list_log_entries.call_args.kwargs["request"]
+        self.assertEqual(request.filter, 'timestamp>="2022-11-29T16:00:00Z"')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+from .correlate_logs import find_entries, url_project
+
+logger = logging.getLogger(__name__)
+
+# e.g. PREFETCH=true. after answering a step, warm instances start the next
+# step's queries in the background, so the follow-up request (with the state we
+# just returned) is answered from the prefetched result.
+#
+# NOTE: the prefetch runs after the response is sent, so on Cloud Functions it
+# needs CPU to stay allocated between requests (2nd gen, "CPU always
+# allocated"); otherwise it only makes progress while other requests run.
+PREFETCH_ENV_VAR = "PREFETCH"
+
+# prefetched results are dropped this many seconds after they were started, so
+# late-arriving log entries aren't missed for long
+PREFETCH_TTL = float(os.environ.get("PREFETCH_TTL", 120))
+# at most this many results are kept (and in flight); the oldest go first
+PREFETCH_MAX_RESULTS = int(os.environ.get("PREFETCH_MAX_RESULTS", 8))
+# and at most this many per client, so one client can't crowd out the others
+PREFETCH_MAX_PER_CLIENT = int(os.environ.get("PREFETCH_MAX_PER_CLIENT", 1))
+
+
+def prefetch_key(state, **options):
+    """
+    Hash of a search state plus the options its step runs with. Unset options
+    (None) are left out, same as not passing them; functions (query_fn) count by
+    identity.
+    """
+    options = {k: v for (k, v) in options.items() if v is not None}
+    data = json.dumps(
+        {"state": state, "options": options},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=id,
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class Prefetcher:
+    """
+    Runs speculative work in a background thread, keeping results by key until
+    they're taken or expire. Taking a result that's still being computed waits
+    for it, since starting over would take longer; work that hasn't started yet
+    (queued behind other clients') is dropped instead, for the caller to do
+    inline. Each client (if given) has at most max_per_client results;
+    scheduling more drops its oldest.
+    """
+
+    def __init__(
+        self,
+        ttl=PREFETCH_TTL,
+        max_results=PREFETCH_MAX_RESULTS,
+        max_per_client=PREFETCH_MAX_PER_CLIENT,
+        workers=1,
+        clock=time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_results = max_results
+        self.max_per_client = max_per_client
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="prefetch"
+        )
+        # key -> (started, client, future), oldest first
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def _drop(self, key):
+        (_, _, future) = self._results.pop(key)
+        future.cancel()
+
+    def _expire(self):
+        now = self.clock()
+        for (key, (started, _, _)) in list(self._results.items()):
+            if now - started > self.ttl:
+                self._drop(key)
+
+    def schedule(self, key, fn, *args, client=None, **kwargs):
+        """Starts fn(*args, **kwargs) unless there's a result for key already."""
+        with self._lock:
+            self._expire()
+            if key in self._results:
+                return False
+
+            if client is not None:
+                client_keys = [k for (k, r) in self._results.items() if r[1] == client]
+                while client_keys and len(client_keys) >= self.max_per_client:
+                    self._drop(client_keys.pop(0))
+
+            while len(self._results) >= self.max_results:
+                self._drop(next(iter(self._results)))
+
+            self._results[key] = (
+                self.clock(),
+                client,
+                self._pool.submit(fn, *args, **kwargs),
+            )
+
+        return True
+
+    def take(self, key):
+        """Returns (and forgets) the result for key, or None if there's none."""
+        with self._lock:
+            self._expire()
+            item = self._results.pop(key, None)
+
+        if item is None:
+            self.misses += 1
+            return None
+
+        (_, _, future) = item
+        # still queued behind other work, which the caller shouldn't wait on
+        if future.cancel():
+            self.misses += 1
+            return None
+
+        try:
+            result = future.result()
+        except Exception as err:
+            # the request does the work itself instead
+            logger.warning(f"Prefetch failed: {err!r}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return result
+
+
+_prefetcher = None
+
+
+def get_prefetcher():
+    """Returns the prefetcher, or None if prefetching is disabled."""
+    global _prefetcher
+
+    enabled = os.environ.get(PREFETCH_ENV_VAR, "").lower() in ["1", "true", "yes"]
+    if _prefetcher is None and enabled:
+        _prefetcher = Prefetcher()
+        logger.info("Prefetching next steps")
+
+    return _prefetcher
+
+
+def find_entries_prefetched(
+    state, url_params=None, url_qs=None, client=None, **options
+):
+    """
+    Same as find_entries(), but answered from a prefetched result if there is
+    one, and with prefetching enabled, starts the next step (from the returned
+    state) in the background, as the given client's (see Prefetcher). Previews
+    and spilled results (memory budget) are never prefetched.
+    """
+    prefetcher = get_prefetcher()
+    if prefetcher is None or options.get("preview") or options.get("memory_budget"):
+        return find_entries(state, url_params, url_qs, **options)
+
+    # the URL only matters for its project (for response URLs)
+    project = url_project(url_qs)
+    result = prefetcher.take(prefetch_key(state, project=project, **options))
+    if result:
+        logger.info("Answering from prefetched step")
+    else:
+        result = find_entries(state, url_params, url_qs, **options)
+
+    # nothing new means the client is done
+    (_, resp_data) = result
+    if resp_data["logEntries"] or resp_data.get("continuation"):
+        next_state = deepcopy(resp_data["searchState"])
+        next_options = dict(options, continuation=resp_data.get("continuation"))
+        prefetcher.schedule(
+            prefetch_key(next_state, project=project, **next_options),
+            find_entries,
+            next_state,
+            url_params,
+            url_qs,
+            client=client,
+            **next_options,
+        )
+
+    return result
@@ -0,0 +1,147 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+from .prefetch import Prefetcher, find_entries_prefetched, get_prefetcher, prefetch_key
+from .testing import mock_entry, mock_state
+
+
+class PrefetchKeyTest(unittest.TestCase):
+    def test_ignores_key_order(self):
+        state = mock_state()
+        reordered = dict(reversed(list(state.items())))
+
+        self.assertEqual(prefetch_key(state), prefetch_key(reordered))
+        self.assertEqual(prefetch_key(state), prefetch_key(state, continuation=None))
+        self.assertNotEqual(prefetch_key(state), prefetch_key(state, max_entries=10))
+
+
+class PrefetcherTest(unittest.TestCase):
+    def test_take_returns_result_once(self):
+        prefetcher = Prefetcher()
+
+        self.assertTrue(prefetcher.schedule("a", lambda: 42))
+        self.assertFalse(prefetcher.schedule("a", lambda: 43))
+        self.assertEqual(prefetcher.take("a"), 42)
+        self.assertIsNone(prefetcher.take("a"))
+        self.assertEqual((prefetcher.hits, prefetcher.misses), (1, 1))
+
+    def test_take_waits_for_running_work(self):
+        prefetcher = Prefetcher()
+        started = threading.Event()
+        release = threading.Event()
+
+        def work():
+            started.set()
+            release.wait()
+            return "done"
+
+        prefetcher.schedule("a", work)
+        started.wait()
+        threading.Timer(0.05, release.set).start()
+
+        self.assertEqual(prefetcher.take("a"), "done")
+
+    def test_queued_work_is_dropped(self):
+        prefetcher = Prefetcher()
+        started = threading.Event()
+        release = threading.Event()
+        ran = []
+
+        def busy():
+            started.set()
+            release.wait()
+
+        prefetcher.schedule("other", busy)
+        started.wait()
+        prefetcher.schedule("a", lambda: ran.append("a"))
+
+        # "a" is stuck behind "other", so the caller does it inline
+        self.assertIsNone(prefetcher.take("a"))
+        release.set()
+        prefetcher.take("other")
+        self.assertEqual(ran, [])
+
+    def test_limits_results_per_client(self):
+        prefetcher = Prefetcher(max_per_client=1)
+        done = {k: threading.Event() for k in ["b", "c"]}
+
+        def work(key, value):
+            done[key].set()
+            return value
+
+        prefetcher.schedule("a", lambda: 1, client="one")
+        prefetcher.schedule("b", work, "b", 2, client="two")
+        prefetcher.schedule("c", work, "c", 3, client="one")
+        for event in done.values():
+            event.wait()
+
+        # dropped for the client's newer step
+        self.assertIsNone(prefetcher.take("a"))
+        self.assertEqual(prefetcher.take("b"), 2)
+        self.assertEqual(prefetcher.take("c"), 3)
+
+    def test_failed_work_is_a_miss(self):
+        prefetcher = Prefetcher()
+
+        def work():
+            raise ValueError("nope")
+
+        prefetcher.schedule("a", work)
+        self.assertIsNone(prefetcher.take("a"))
+
+    def test_expires_and_evicts(self):
+        clock = [0.0]
+        prefetcher = Prefetcher(ttl=10, max_results=2, clock=lambda: clock[0])
+
+        prefetcher.schedule("a", lambda: 1)
+        prefetcher.schedule("b", lambda: 2)
+        prefetcher.schedule("c", lambda: 3)
+        # oldest goes first
+        self.assertIsNone(prefetcher.take("a"))
+
+        clock[0] = 11
+        self.assertIsNone(prefetcher.take("b"))
+        self.assertEqual(len(prefetcher), 0)
+
+
+class FindEntriesPrefetchedTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("lib.prefetch._prefetcher", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_next_step_is_prefetched(self):
+        calls = []
+
+        def query_fn(query, project=None):
+            calls.append(query)
+            # the first step finds a new trace; the next finds its entries
+            if len(calls) == 1:
+                return [mock_entry("1", 1)]
+            return [mock_entry("2", 2, trace="def")]
+
+        with mock.patch.dict(os.environ, {"PREFETCH": "true"}):
+            (_, resp_data) = find_entries_prefetched(mock_state(), query_fn=query_fn)
+            # the client sends back the state it got
+            (_, next_resp_data) = find_entries_prefetched(
+                resp_data["searchState"], query_fn=query_fn
+            )
+            prefetcher = get_prefetcher()
+
+        self.assertEqual([e["insertId"] for e in next_resp_data["logEntries"]], ["2"])
+        # the follow-up was answered by the prefetch
+        self.assertEqual(prefetcher.hits, 1)
+
+    def test_disabled_by_default(self):
+        with mock.patch.dict(os.environ, {"PREFETCH": ""}), mock.patch(
+            "lib.prefetch.find_entries", return_value=("msg", {})
+        ) as find_entries:
+            find_entries_prefetched(mock_state())
+
+        find_entries.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# where profiles go. profiling is only available when this is set, since each
+# profile is a few files on disk (in memory, for /tmp on Cloud Functions).
+PROFILE_DIR_ENV = "PROFILE_DIR"
+# set to profile every request, not just the ones that ask for it
+PROFILE_REQUESTS_ENV = "PROFILE_REQUESTS"
+
+TRACEMALLOC_FRAMES = 10
+TOP_STATS = 40
+
+# only one CPU profiler can be active at a time (per process, since 3.12), and
+# tracemalloc is process-wide, so concurrent profiles share it
+_cpu_profile_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def profile_dir_from_env():
+    return os.environ.get(PROFILE_DIR_ENV) or None
+
+
+def profile_all_from_env():
+    return os.environ.get(PROFILE_REQUESTS_ENV, "").lower() in ["1", "true", "yes"]
+
+
+def _start_tracing():
+    global _tracing_users
+
+    with _tracing_lock:
+        if not _tracing_users and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+
+    with _tracing_lock:
+        snapshot = tracemalloc.take_snapshot()
+        (_, peak) = tracemalloc.get_traced_memory()
+
+        _tracing_users -= 1
+        if not _tracing_users:
+            tracemalloc.stop()
+
+    return (snapshot, peak)
+
+
+class RequestProfiler:
+    """
+    Captures a CPU profile (cProfile) and an allocation snapshot (tracemalloc)
+    of the code run within it, and writes them to a new directory under
+    profile_dir along with the input:
+
+    - cpu.prof: load with pstats or e.g. snakeviz
+    - cpu.txt: top functions by cumulative time
+    - allocations.tracemalloc: load with tracemalloc.Snapshot.load()
+    - allocations.txt: top allocation sites
+    - input.json, profile.json (timing and memory summary)
+
+    The CPU profile only covers the calling thread; per-project queries run in
+    worker threads, but those mostly wait on the Logging API. Allocations are
+    process-wide, so concurrent requests show up in them too.
+    """
+
+    def __init__(self, profile_dir, label, input_data=None):
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
+        self.path = os.path.join(profile_dir, f"{stamp}-{label}")
+        self.input_data = input_data
+
+        self._cpu_profile = None
+        self._started = None
+
+    def __enter__(self):
+        # a concurrent profile has the CPU profiler; still get allocations
+        if _cpu_profile_lock.acquire(blocking=False):
+            self._cpu_profile = cProfile.Profile()
+            self._cpu_profile.enable()
+        else:
+            logger.warning("Another request is being CPU profiled; skipping")
+
+        _start_tracing()
+        self._started = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._started
+        (snapshot, peak) = _stop_tracing()
+
+        if self._cpu_profile:
+            self._cpu_profile.disable()
+            _cpu_profile_lock.release()
+
+        try:
+            self._write(elapsed, snapshot, peak)
+        except OSError as err:
+            logger.error(f"Could not write profile to {self.path}: {err}")
+            return
+
+        logger.info(f"Wrote profile ({elapsed:.3f}s) to {self.path}")
+
+    def _write(self, elapsed, snapshot, peak):
+        os.makedirs(self.path, exist_ok=True)
+
+        if self._cpu_profile:
+            self._cpu_profile.dump_stats(os.path.join(self.path, "cpu.prof"))
+
+            out = io.StringIO()
+            stats = pstats.Stats(self._cpu_profile, stream=out)
+            stats.sort_stats("cumulative").print_stats(TOP_STATS)
+            self._write_file("cpu.txt", out.getvalue())
+
+        # skip tracemalloc's own allocations
+        snapshot = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        snapshot.dump(os.path.join(self.path, "allocations.tracemalloc"))
+        self._write_file(
+            "allocations.txt",
+            "\n".join(str(s) for s in snapshot.statistics("lineno")[:TOP_STATS]),
+        )
+
+        self._write_file("input.json", json.dumps(self.input_data, indent=2))
+        self._write_file(
+            "profile.json",
+            json.dumps(
+                {
+                    "elapsedSeconds": round(elapsed, 6),
+                    "peakTracedMemoryBytes": peak,
+                    "cpuProfiled": bool(self._cpu_profile),
+                },
+                indent=2,
+            ),
+        )
+
+    def _write_file(self, name, text):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(text)
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from .profiling import RequestProfiler
+
+
+def busy():
+    return sorted([str(i) for i in range(10000)])
+
+
+class RequestProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_writes_profile(self):
+        with RequestProfiler(self.tmpdir.name, "test", {"traces": ["abc"]}) as p:
+            busy()
+
+        self.assertTrue(p.path.startswith(self.tmpdir.name))
+        self.assertTrue(p.path.endswith("-test"))
+        self.assertEqual(
+            sorted(os.listdir(p.path)),
+            [
+                "allocations.tracemalloc",
+                "allocations.txt",
+                "cpu.prof",
+                "cpu.txt",
+                "input.json",
+                "profile.json",
+            ],
+        )
+
+        with open(os.path.join(p.path, "input.json")) as f:
+            self.assertEqual(json.load(f), {"traces": ["abc"]})
+        with open(os.path.join(p.path, "cpu.txt")) as f:
+            self.assertIn("busy", f.read())
+
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_nested_skips_cpu_profile(self):
+        with RequestProfiler(self.tmpdir.name, "outer") as outer:
+            with RequestProfiler(self.tmpdir.name, "inner") as inner:
+                busy()
+
+            # the outer profile still traces allocations
+            self.assertTrue(tracemalloc.is_tracing())
+
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIn("cpu.prof", os.listdir(outer.path))
+        self.assertNotIn("cpu.prof", os.listdir(inner.path))
+
+        with open(os.path.join(inner.path, "profile.json")) as f:
+            self.assertFalse(json.load(f)["cpuProfiled"])
+
+    def test_exception_still_writes_profile(self):
+        with self.assertRaises(ValueError):
+            with RequestProfiler(self.tmpdir.name, "error") as p:
+                raise ValueError
+
+        self.assertIn("profile.json", os.listdir(p.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
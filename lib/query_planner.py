@@ -0,0 +1,230 @@
+import itertools
+import logging
+import math
+import os
+import random
+import threading
+from copy import deepcopy
+
+logger = logging.getLogger(__name__)
+
+# clause forms supported by gcp_logs_filter.jq (see `plan` there)
+TRACE_FORMS = ["regex", "equals"]
+INSERT_ID_FORMS = ["regex", "equals"]
+LOG_NAME_OPTIONS = [True, False]
+
+# seconds per query until any latency is observed. shapes without observations
+# are assumed to be as fast as the default shape (see QueryPlan), so the planner
+# sticks with it until exploration measures something faster.
+DEFAULT_QUERY_LATENCY = 1.0
+
+# share of plans that try another shape (with as many queries) to measure it
+QUERY_EXPLORE_RATE = float(os.environ.get("QUERY_EXPLORE_RATE", 0.05))
+
+# weight of the newest observation in the moving average
+LATENCY_EWMA_ALPHA = 0.3
+
+# room for the datetime window and the surrounding parens/joins
+FILTER_OVERHEAD = 200
+
+
+class QueryPlan:
+    """
+    Clause forms for one project's query, plus how many queries the project's
+    traces are split across.
+    """
+
+    def __init__(self, traces="regex", insert_ids="regex", log_name=True, parts=1):
+        self.traces = traces
+        self.insert_ids = insert_ids
+        self.log_name = log_name
+        self.parts = parts
+
+    @property
+    def shape(self):
+        return (self.traces, self.insert_ids, self.log_name)
+
+    def to_json(self):
+        # same keys as gcp_logs_filter.jq expects
+        return {
+            "traces": self.traces,
+            "insertIds": self.insert_ids,
+            "logName": self.log_name,
+        }
+
+    def part_states(self, state):
+        """Splits the state's traces into one state per query part."""
+        traces = sorted(state.get("traces") or [])
+        size = math.ceil(len(traces) / self.parts) if traces else 0
+
+        states = []
+        for i in range(self.parts):
+            part_state = deepcopy(state)
+            part_state.update(
+                plan=self.to_json(), traces=traces[i * size : (i + 1) * size]
+            )
+
+            if i > 0:
+                # only the first part queries new operations and tasks, so parts
+                # don't return the same request log entries
+                part_state.update(operationsNew=[], tasksNew=[])
+
+            states.append(part_state)
+
+        return states
+
+
+# ---
+# filter length estimates; these mirror the clauses in gcp_logs_filter.jq
+
+
+def _conditional_length(values):
+    # "a" OR "b"
+    return sum(len(v) + 2 for v in values) + 4 * max(len(values) - 1, 0)
+
+
+def _regex_length(values):
+    # a|b
+    return sum(len(v) for v in values) + max(len(values) - 1, 0)
+
+
+def trace_clause_length(project, traces, form):
+    if not traces:
+        return 0
+
+    prefix = f"projects/{project}/traces/"
+    if form == "equals":
+        return len("trace=()") + _conditional_length([prefix + t for t in traces])
+
+    return len('trace=~"()"') + len(prefix) + _regex_length(traces)
+
+
+def insert_ids_clause_length(insert_ids, form):
+    if len(insert_ids) <= 1:
+        return 0
+
+    if form == "equals":
+        return len("-insertId=()") + _conditional_length(insert_ids)
+
+    return len('-insertId=~"()"') + _regex_length(insert_ids)
+
+
+def request_log_clause_length(project, state, log_name):
+    operations = state.get("operationsNew") or []
+    tasks = state.get("tasksNew") or []
+    if not (operations or tasks):
+        return 0
+
+    length = (len("operation.id=() OR ") + _conditional_length(operations)) + (
+        len("protoPayload.taskName=() OR ") + _conditional_length(tasks)
+    )
+    if log_name:
+        length += len(
+            f'log_name="projects/{project}/logs/appengine.googleapis.com%2Frequest_log"'
+        )
+
+    return length
+
+
+# ---
+
+
+class QueryPlanner:
+    """
+    Picks the cheapest filter shape for each project's query: trace and insertId
+    clause forms, whether to restrict request log conditions by log_name, and
+    how many queries to split the traces across so each stays under the filter
+    size limit. Cost is the number of queries times the expected latency of the
+    shape, using latencies observed for past queries. Ties go to the default
+    shape.
+
+    With explore_rate, that share of plans picks another shape that needs as
+    many queries, so shapes get observed at all.
+    """
+
+    def __init__(
+        self, max_filter_size, alpha=LATENCY_EWMA_ALPHA, explore_rate=0, rng=None
+    ):
+        self.max_filter_size = max_filter_size
+        self.alpha = alpha
+        self.explore_rate = explore_rate
+        self.rng = rng or random.Random()
+
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def expected_latency(self, shape):
+        with self._lock:
+            observed = self._latencies.get(shape)
+            if observed is None:
+                observed = self._latencies.get(QueryPlan().shape)
+
+        return DEFAULT_QUERY_LATENCY if observed is None else observed
+
+    def observe(self, plan, seconds):
+        """Records how long a query with the plan's shape took."""
+        with self._lock:
+            prev = self._latencies.get(plan.shape)
+            self._latencies[plan.shape] = (
+                seconds
+                if prev is None
+                else self.alpha * seconds + (1 - self.alpha) * prev
+            )
+
+    def candidates(self, state, project):
+        traces = state.get("traces") or []
+        insert_ids = state.get("insertIds") or []
+
+        for (trace_form, insert_id_form, log_name) in itertools.product(
+            TRACE_FORMS, INSERT_ID_FORMS, LOG_NAME_OPTIONS
+        ):
+            # every part excludes all insertIds; the 1st also has request logs
+            fixed_length = (
+                FILTER_OVERHEAD
+                + insert_ids_clause_length(insert_ids, insert_id_form)
+                + request_log_clause_length(project, state, log_name)
+            )
+            traces_length = trace_clause_length(project, traces, trace_form)
+            room = self.max_filter_size - fixed_length
+
+            if room <= 0 or (traces and room < traces_length / len(traces)):
+                continue
+
+            parts = max(1, math.ceil(traces_length / room))
+            plan = QueryPlan(trace_form, insert_id_form, log_name, parts)
+            cost = parts * self.expected_latency(plan.shape)
+
+            yield (cost, fixed_length * parts + traces_length, plan)
+
+    def plan(self, state, project):
+        default_shape = QueryPlan().shape
+        candidates = sorted(
+            self.candidates(state, project),
+            key=lambda c: (c[0], c[2].shape != default_shape, c[1]),
+        )
+
+        # nothing fits; use the default shape and let the filter size check fail
+        if not candidates:
+            logger.warning(f"No query plan fits the filter size limit for {project}")
+            return QueryPlan()
+
+        (cost, length, plan) = candidates[0]
+        others = [c for c in candidates[1:] if c[2].parts == plan.parts]
+        explore = bool(others) and self.rng.random() < self.explore_rate
+        if explore:
+            (cost, length, plan) = self.rng.choice(others)
+
+        logger.info(
+            f"Query plan for {project}{' (exploring)' if explore else ''}: "
+            f"traces={plan.traces} "
+            f"insertIds={plan.insert_ids} logName={plan.log_name} "
+            f"parts={plan.parts} (cost {cost:.2f}s, ~{length} chars)",
+            extra={
+                "json_fields": [
+                    dict(p.to_json(), parts=p.parts, cost=c, length=n)
+                    for (c, n, p) in candidates
+                ]
+            },
+        )
+
+        return plan
@@ -0,0 +1,158 @@
+import unittest
+from unittest import mock
+
+from .correlate_logs import (
+    QUERY_PLANNER,
+    LogsQueryInput,
+    create_logs_filter_from_search_state,
+    query_projects,
+)
+from .query_planner import INSERT_ID_FORMS, LOG_NAME_OPTIONS, QueryPlan, QueryPlanner
+from .testing import mock_state
+
+
+def mock_planner_state(**kwargs):
+    return mock_state(
+        **{"traces": ["abc", "def"], "operationsNew": ["op1"], "tasksNew": [], **kwargs}
+    )
+
+
+def many_traces(n):
+    return [f"{i:032x}" for i in range(n)]
+
+
+def observe_trace_forms(planner, latencies):
+    for (traces, seconds) in latencies.items():
+        for insert_ids in INSERT_ID_FORMS:
+            for log_name in LOG_NAME_OPTIONS:
+                planner.observe(QueryPlan(traces, insert_ids, log_name), seconds)
+
+
+class QueryPlannerTest(unittest.TestCase):
+    def test_default_shape_until_observed(self):
+        plan = QueryPlanner(20000).plan(mock_planner_state(), "gen-prod")
+
+        self.assertEqual(plan.shape, QueryPlan().shape)
+        self.assertEqual(plan.parts, 1)
+
+        # another shape being slow isn't a reason to switch either
+        planner = QueryPlanner(20000)
+        observe_trace_forms(planner, {"equals": 5.0})
+        self.assertEqual(
+            planner.plan(mock_planner_state(), "gen-prod").shape, plan.shape
+        )
+
+    def test_falls_back_to_regex_when_equals_needs_more_queries(self):
+        # the full trace names make equals clauses much longer than a regex
+        state = mock_planner_state(traces=many_traces(150))
+        planner = QueryPlanner(6000)
+        observe_trace_forms(planner, {"regex": 1.5, "equals": 1.0})
+        plan = planner.plan(state, "gen-prod")
+
+        self.assertEqual(plan.traces, "regex")
+        self.assertEqual(plan.parts, 1)
+
+    def test_splits_traces_when_nothing_fits(self):
+        state = mock_planner_state(traces=many_traces(500))
+        plan = QueryPlanner(6000).plan(state, "gen-prod")
+
+        self.assertGreater(plan.parts, 1)
+        for part_state in plan.part_states(state):
+            query = create_logs_filter_from_search_state(part_state, project="gen-prod")
+            self.assertLess(len(query), 6000)
+
+    def test_observed_latency_changes_plan(self):
+        planner = QueryPlanner(20000)
+        observe_trace_forms(planner, {"regex": 5.0, "equals": 1.0})
+
+        self.assertEqual(
+            planner.plan(mock_planner_state(), "gen-prod").traces, "equals"
+        )
+
+    def test_explores_other_shapes(self):
+        rng = mock.Mock()
+        rng.random.return_value = 0.0
+        rng.choice.side_effect = lambda others: others[-1]
+        planner = QueryPlanner(20000, explore_rate=0.1, rng=rng)
+
+        plan = planner.plan(mock_planner_state(), "gen-prod")
+
+        self.assertNotEqual(plan.shape, QueryPlan().shape)
+        self.assertEqual(plan.parts, 1)
+
+        rng.random.return_value = 0.5
+        plan = planner.plan(mock_planner_state(), "gen-prod")
+        self.assertEqual(plan.shape, QueryPlan().shape)
+
+    def test_observed_latency_is_averaged(self):
+        planner = QueryPlanner(20000, alpha=0.5)
+        plan = QueryPlan()
+        planner.observe(plan, 2.0)
+        planner.observe(plan, 4.0)
+
+        self.assertEqual(planner.expected_latency(plan.shape), 3.0)
+
+
+class QueryPlanTest(unittest.TestCase):
+    def test_part_states_split_traces(self):
+        state = mock_planner_state(traces=["a", "b", "c"])
+        part_states = QueryPlan(parts=2).part_states(state)
+
+        self.assertEqual([s["traces"] for s in part_states], [["a", "b"], ["c"]])
+        # only the first part queries request logs
+        self.assertEqual(part_states[0]["operationsNew"], ["op1"])
+        self.assertEqual(part_states[1]["operationsNew"], [])
+        # the original state is untouched
+        self.assertNotIn("plan", state)
+
+    def test_filter_without_plan_is_unchanged(self):
+        state = mock_planner_state()
+        with_default_plan = dict(state, plan=QueryPlan().to_json())
+
+        self.assertEqual(
+            create_logs_filter_from_search_state(state, project="gen-prod"),
+            create_logs_filter_from_search_state(with_default_plan, project="gen-prod"),
+        )
+
+    def test_equals_form(self):
+        state = dict(
+            mock_planner_state(), plan=QueryPlan("equals", "equals", False).to_json()
+        )
+        query = create_logs_filter_from_search_state(state, project="gen-prod")
+
+        self.assertIn('trace=("projects/gen-prod/traces/abc"', query)
+        self.assertNotIn("log_name", query)
+
+
+class LogsQueryInputTest(unittest.TestCase):
+    def test_keys_split_queries_by_part(self):
+        planner = QueryPlanner(20000)
+        planner.plan = lambda state, project: QueryPlan(parts=2)
+
+        query_input = LogsQueryInput(mock_planner_state(), planner)
+
+        self.assertEqual(list(query_input.queries), ["gen-prod", "gen-prod/2"])
+        self.assertIn("abc", query_input.queries["gen-prod"])
+        self.assertIn("def", query_input.queries["gen-prod/2"])
+
+    def test_observes_on_its_planner(self):
+        planner = QueryPlanner(20000)
+        query_input = LogsQueryInput(mock_planner_state(), planner)
+
+        with mock.patch.object(planner, "observe") as observe, mock.patch.object(
+            QUERY_PLANNER, "observe"
+        ) as global_observe:
+            query_projects(
+                query_input.queries,
+                lambda query, project=None: [],
+                plans=query_input.plans,
+                planner=query_input.planner,
+            )
+
+        observe.assert_called_once()
+        self.assertIs(observe.call_args[0][0], query_input.plans["gen-prod"])
+        global_observe.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,256 @@
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .correlate_logs import format_gcp_time
+from .logs_clients import RawLogEntries
+from .timestamps import ns_to_datetime, parse_timestamp_ns
+
+# same as the Logging API's default page size
+DEFAULT_REPLAY_PAGE_SIZE = 1000
+
+# ids in filters are quoted strings or regex alternatives; either way they're
+# made of these characters
+FILTER_TOKEN_RE = re.compile(r"[\w.-]+")
+TIMESTAMP_BOUND_RE = re.compile(r'timestamp(>=|<=)"([^"]+)"')
+
+
+def entry_ids(entry):
+    """The ids an entry can be matched by in a filter."""
+    proto = entry.get("protoPayload") or {}
+    ids = [
+        entry.get("insertId"),
+        proto.get("requestId"),
+        (entry.get("operation") or {}).get("id"),
+    ]
+
+    # traces and tasks are matched by id, not full name
+    for name in [entry.get("trace"), proto.get("taskName")]:
+        if name:
+            ids.append(name.split("/")[-1])
+
+    return [i for i in ids if i]
+
+
+def parse_filter(query):
+    """
+    Returns (tokens, excluded insertId tokens, (start ns, end ns)) for a filter.
+    Good enough for the filters correlate_logs builds (and simple console
+    queries), not a real filter parser.
+    """
+    bounds = {
+        op: parse_timestamp_ns(ts) for (op, ts) in TIMESTAMP_BOUND_RE.findall(query)
+    }
+    (query, _, excluded) = TIMESTAMP_BOUND_RE.sub("", query).partition("-insertId")
+
+    return (
+        set(FILTER_TOKEN_RE.findall(query)),
+        set(FILTER_TOKEN_RE.findall(excluded)),
+        (bounds.get(">="), bounds.get("<=")),
+    )
+
+
+class ReplayBackend:
+    """
+    Serves log entries from memory in place of the Logging API's entries.list,
+    with configurable latency per call (plus per entry returned, to model the
+    transfer of bigger pages). An entry matches a filter when any of
+    its ids (see entry_ids()) appears in the filter, it's within the filter's
+    timestamp bounds and its insertId isn't excluded.
+
+    Patch fetch_page() in for lib.correlate_logs.fetch_log_entries_page (see
+    benchmarks/replay.py) to make query_logs() fetch from it, e.g. for load
+    tests and benchmarks that shouldn't (or can't) hit the real API.
+    """
+
+    def __init__(
+        self,
+        entries,
+        latency=0.0,
+        jitter=0.0,
+        page_size=DEFAULT_REPLAY_PAGE_SIZE,
+        seed=None,
+        entry_latency=0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.entry_latency = entry_latency
+        self.page_size = page_size
+        self.calls = 0
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        # entries are kept as JSON text and parsed per call, like API responses
+        self._entries = []
+        self._index = {}
+        for entry in sorted(entries, key=lambda e: parse_timestamp_ns(e["timestamp"])):
+            i = len(self._entries)
+            self._entries.append(
+                (
+                    parse_timestamp_ns(entry["timestamp"]),
+                    (entry.get("resource") or {}).get("labels", {}).get("project_id"),
+                    entry.get("insertId"),
+                    json.dumps(entry),
+                )
+            )
+            for entry_id in entry_ids(entry):
+                self._index.setdefault(entry_id, set()).add(i)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def time_range(self, padding=timedelta(seconds=1)):
+        """Time range covering all entries, as console URL timestamps."""
+        (start, end) = (self._entries[0][0], self._entries[-1][0])
+
+        return (
+            format_gcp_time(ns_to_datetime(start) - padding),
+            format_gcp_time(ns_to_datetime(end) + padding),
+        )
+
+    def insert_ids(self):
+        """insertIds of all entries, sorted by timestamp."""
+        return [e[2] for e in self._entries]
+
+    @classmethod
+    def from_files(cls, paths, **kwargs):
+        """
+        Loads entries from JSON files of log entries, e.g. the ./traces/*.json
+        files from the wrapper script.
+        """
+        entries = []
+        for path in paths:
+            with open(path, "r") as f:
+                data = json.load(f)
+
+            # either a list of entries or a correlate_logs.py response
+            entries.extend(data if isinstance(data, list) else data["logEntries"])
+
+        return cls(entries, **kwargs)
+
+    def match(self, query, project=None):
+        (tokens, excluded, (start_ns, end_ns)) = parse_filter(query)
+        matches = set().union(*(self._index.get(t, ()) for t in tokens))
+
+        return [
+            i
+            for i in sorted(matches)
+            if (project is None or self._entries[i][1] == project)
+            and (start_ns is None or self._entries[i][0] >= start_ns)
+            and (end_ns is None or self._entries[i][0] <= end_ns)
+            and self._entries[i][2] not in excluded
+        ]
+
+    def delay(self, entry_count=0):
+        with self._lock:
+            self.calls += 1
+            jitter = self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0
+
+        return max(0.0, self.latency + jitter) + entry_count * self.entry_latency
+
+    def fetch_page(self, query, project=None, page_token=None, page_size=None):
+        """Same signature and return value as fetch_log_entries_page()."""
+        matches = self.match(query, project)
+        offset = int(page_token or 0)
+        end = offset + (page_size or self.page_size)
+
+        page = matches[offset:end]
+        time.sleep(self.delay(len(page)))
+
+        next_page_token = str(end) if end < len(matches) else None
+
+        # same as the HTTP transport: entries along with the response text
+        text = json.dumps(
+            {
+                "entries": [json.loads(self._entries[i][3]) for i in page],
+                "nextPageToken": next_page_token,
+            }
+        )
+        return (RawLogEntries(json.loads(text)["entries"], [text]), next_page_token)
+
+
+# ---
+
+TASK_QUEUE_NAME = "projects/{project}/locations/us-central1/queues/default/tasks"
+REQUEST_LOG_TYPE = "type.googleapis.com/google.appengine.logging.v1.RequestLog"
+
+
+def make_replay_entries(
+    seed_count, fanout=3, depth=2, entries_per_request=5, project="gen-prod", seed=0
+):
+    """
+    Generates log entries for seed_count request trees: each request's app log
+    messages mention the traces of the requests it fans out to (as tasks), down
+    to the given depth. Returns (entries, seed insertIds), each seed being an
+    app log entry of a root request, which is where a user would start from.
+    """
+    rng = random.Random(seed)
+    start = datetime(2022, 11, 29, 16)
+    entries = []
+    ids = iter(range(10**9))
+
+    def request(trace_id, level, ts, task_id=None):
+        request_id = f"{rng.getrandbits(224):056x}"
+        children = (
+            [(f"{rng.getrandbits(128):032x}", str(next(ids))) for _ in range(fanout)]
+            if level < depth
+            else []
+        )
+        messages = [f"post:{rng.randrange(1000)} recipe:{rng.randrange(1000)}"] + [
+            f"deferring task:{child_task} trace:projects/{project}/traces/{child}"
+            for (child, child_task) in children
+        ]
+
+        def timestamp(offset_ms):
+            dt = ts + timedelta(milliseconds=offset_ms)
+            return dt.strftime("%Y-%m-%dT%H:%M:%S.%f") + "Z"
+
+        base = {
+            "trace": f"projects/{project}/traces/{trace_id}",
+            "resource": {"type": "gae_app", "labels": {"project_id": project}},
+        }
+        proto = {
+            "@type": REQUEST_LOG_TYPE,
+            "requestId": request_id,
+            "endTime": timestamp(entries_per_request * 10),
+            "latency": f"{entries_per_request / 100}s",
+            "status": 200,
+            "line": [{"logMessage": m} for m in messages],
+        }
+        if task_id:
+            proto["taskName"] = f"{TASK_QUEUE_NAME.format(project=project)}/{task_id}"
+
+        entries.append(
+            dict(
+                base,
+                insertId=f"{request_id}-r",
+                timestamp=timestamp(0),
+                protoPayload=proto,
+            )
+        )
+        entries.extend(
+            dict(
+                base,
+                insertId=f"{request_id}-{i}",
+                timestamp=timestamp(i * 10),
+                jsonPayload={"message": rng.choice(messages)},
+            )
+            for i in range(1, entries_per_request)
+        )
+
+        for (i, (child, child_task)) in enumerate(children):
+            request(child, level + 1, ts + timedelta(seconds=i + 1), child_task)
+
+        return request_id
+
+    seeds = []
+    for n in range(seed_count):
+        trace_id = f"{rng.getrandbits(128):032x}"
+        request_id = request(trace_id, 0, start + timedelta(seconds=n * 30))
+        seeds.append(f"{request_id}-1")
+
+    return (entries, seeds)
@@ -0,0 +1,74 @@
+import unittest
+from unittest import mock
+
+from .correlate_logs import find_entries
+from .replay_backend import ReplayBackend, make_replay_entries, parse_filter
+from .testing import FETCH_PAGE, mock_entry
+
+MOCK_QUERY = """(
+  trace=~"projects/gen-prod/traces/(abc|def)"
+)
+-insertId=~"(2|3)"
+timestamp>="2022-11-29T16:00:00.000Z"
+timestamp<="2022-11-29T16:00:05.000Z"
+"""
+
+
+class ParseFilterTest(unittest.TestCase):
+    def test_parses_tokens_exclusions_and_bounds(self):
+        (tokens, excluded, (start_ns, end_ns)) = parse_filter(MOCK_QUERY)
+
+        self.assertIn("abc", tokens)
+        self.assertIn("def", tokens)
+        self.assertEqual(excluded, {"2", "3"})
+        self.assertLess(start_ns, end_ns)
+
+
+class ReplayBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = ReplayBackend(
+            [
+                mock_entry("1", 1),
+                mock_entry("2", 2),
+                mock_entry("4", 4, trace="def"),
+                mock_entry("5", 9),
+                mock_entry("6", 3, trace="xyz"),
+            ],
+            page_size=1,
+        )
+
+    def test_fetches_matching_entries_by_page(self):
+        (entries, token) = self.backend.fetch_page(MOCK_QUERY, "gen-prod")
+        self.assertEqual([e["insertId"] for e in entries], ["1"])
+
+        (entries, token) = self.backend.fetch_page(MOCK_QUERY, "gen-prod", token)
+        self.assertEqual([e["insertId"] for e in entries], ["4"])
+        self.assertIsNone(token)
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_filters_by_project(self):
+        (entries, _) = self.backend.fetch_page(MOCK_QUERY, "other-project")
+        self.assertEqual(entries, [])
+
+    def test_correlates_generated_entries(self):
+        (entries, seeds) = make_replay_entries(2, fanout=2, depth=1)
+        backend = ReplayBackend(entries)
+        seed_entry = next(e for e in entries if e["insertId"] == seeds[0])
+        state = {
+            "project": "gen-prod",
+            "timeRangeStart": seed_entry["timestamp"],
+            "timeRangeEnd": seed_entry["timestamp"],
+            "traces": [seed_entry["trace"].split("/")[-1]],
+            "insertIds": [seeds[0]],
+        }
+
+        with mock.patch(FETCH_PAGE, backend.fetch_page):
+            (_, resp_data) = find_entries(state)
+            (_, resp_data) = find_entries(resp_data["searchState"])
+
+        # the seed's request and the requests it fanned out to
+        self.assertEqual(len(resp_data["searchState"]["insertIds"]), 15)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from google.api_core import exceptions as api_exceptions
+
+logger = logging.getLogger(__name__)
+
+# the Logging API's read quota is 60 entries.list requests per minute per
+# project, so allow a minute's worth of burst and refill at 1 request/second.
+# NOTE: each function instance has its own buckets.
+DEFAULT_QUOTA_RATE = float(os.environ.get("LOGS_QUOTA_RATE", 1.0))  # per second
+DEFAULT_QUOTA_BURST = int(os.environ.get("LOGS_QUOTA_BURST", 60))
+# calls that would wait longer than this for quota fail right away (with how
+# long to wait before retrying), rather than holding up the request
+DEFAULT_MAX_QUOTA_WAIT = float(os.environ.get("LOGS_MAX_QUOTA_WAIT", 30))  # seconds
+
+DEFAULT_MAX_RETRIES = int(os.environ.get("LOGS_MAX_RETRIES", 5))
+DEFAULT_BACKOFF_BASE = 1.0  # seconds
+DEFAULT_BACKOFF_MAX = 32.0  # seconds
+
+# ResourceExhausted (quota) is a subclass of TooManyRequests
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+)
+
+
+class QuotaWaitError(Exception):
+    def __init__(self, project, retry_after):
+        self.project = project
+        self.retry_after = retry_after
+        super().__init__(
+            f"Logging API quota for {project} is used up; "
+            f"retry in {math.ceil(retry_after)}s"
+        )
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens are reserved rather than polled for, so
+    callers are served in the order they arrive.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """
+        Takes a token, returning how long (in seconds) to wait before use. With
+        max_wait, no token is taken if the wait would be longer than that.
+        """
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if max_wait is None or wait <= max_wait:
+                self.tokens -= 1
+
+            return wait
+
+
+def backoff_delay(attempt, base=DEFAULT_BACKOFF_BASE, maximum=DEFAULT_BACKOFF_MAX):
+    # "full jitter": https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/  # noqa:E501
+    return random.uniform(0, min(maximum, base * 2**attempt))
+
+
+class CallStats:
+    def __init__(self, project):
+        self.project = project
+        self.quota_wait = 0.0
+        self.retry_wait = 0.0
+        self.retries = 0
+
+    def to_json(self):
+        return {
+            "project": self.project,
+            "quotaWaitSeconds": round(self.quota_wait, 3),
+            "retryWaitSeconds": round(self.retry_wait, 3),
+            "retries": self.retries,
+        }
+
+
+class QuotaScheduler:
+    """
+    Runs Logging API calls within a per-project request budget, retrying
+    transient and quota errors with jittered exponential backoff. Calls that
+    would wait longer than max_quota_wait for the budget raise QuotaWaitError.
+    """
+
+    def __init__(
+        self,
+        rate=DEFAULT_QUOTA_RATE,
+        burst=DEFAULT_QUOTA_BURST,
+        max_retries=DEFAULT_MAX_RETRIES,
+        max_quota_wait=DEFAULT_MAX_QUOTA_WAIT,
+        sleep=time.sleep,
+        clock=time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_quota_wait = max_quota_wait
+
+        self._sleep = sleep
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._totals = defaultdict(lambda: {"calls": 0, "quotaWaitSeconds": 0.0})
+
+    def bucket(self, project):
+        with self._lock:
+            if project not in self._buckets:
+                self._buckets[project] = TokenBucket(
+                    self.rate, self.burst, clock=self._clock
+                )
+
+            return self._buckets[project]
+
+    def call(self, project, fn, *args, **kwargs):
+        """
+        Calls fn once a token for the project is available. Returns a tuple of
+        (result, CallStats).
+        """
+        stats = CallStats(project)
+
+        for attempt in range(self.max_retries + 1):
+            wait = self.bucket(project).reserve(self.max_quota_wait)
+            if self.max_quota_wait is not None and wait > self.max_quota_wait:
+                logger.warning(
+                    f"Logging API call would wait {wait:.2f}s for quota",
+                    extra={"json_fields": stats.to_json()},
+                )
+                raise QuotaWaitError(project, wait)
+            if wait:
+                self._sleep(wait)
+                stats.quota_wait += wait
+
+            try:
+                result = fn(*args, **kwargs)
+                break
+
+            except RETRYABLE_ERRORS as err:
+                if attempt >= self.max_retries:
+                    logger.error(
+                        f"Logging API call failed after {attempt} retries: {err}",
+                        extra={"json_fields": stats.to_json()},
+                    )
+                    raise
+
+                delay = backoff_delay(attempt)
+                logger.warning(
+                    f"Logging API call failed ({err}); retrying in {delay:.2f}s"
+                )
+                self._sleep(delay)
+                stats.retry_wait += delay
+                stats.retries += 1
+
+        with self._lock:
+            self._totals[project]["calls"] += 1
+            self._totals[project]["quotaWaitSeconds"] += stats.quota_wait
+
+        return (result, stats)
+
+    def totals(self):
+        with self._lock:
+            return {project: dict(totals) for project, totals in self._totals.items()}
@@ -0,0 +1,129 @@
+import unittest
+
+from google.api_core import exceptions as api_exceptions
+
+from .scheduler import QuotaScheduler, QuotaWaitError, TokenBucket, backoff_delay
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_allows_burst_without_waiting(self):
+        bucket = TokenBucket(rate=1, capacity=3, clock=MockClock())
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0])
+
+    def test_waits_are_queued_beyond_burst(self):
+        bucket = TokenBucket(rate=2, capacity=1, clock=MockClock())
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0.5, 1.0])
+
+    def test_refills_over_time(self):
+        clock = MockClock()
+        bucket = TokenBucket(rate=1, capacity=1, clock=clock)
+        bucket.reserve()
+
+        clock.sleep(1)
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_takes_no_token_beyond_max_wait(self):
+        bucket = TokenBucket(rate=1, capacity=1, clock=MockClock())
+        bucket.reserve()
+
+        self.assertEqual(bucket.reserve(max_wait=0.5), 1)
+        self.assertEqual(bucket.reserve(), 1)
+
+
+class BackoffDelayTest(unittest.TestCase):
+    def test_is_capped(self):
+        for attempt in range(10):
+            delay = backoff_delay(attempt, base=1, maximum=8)
+            self.assertLessEqual(delay, min(8, 2**attempt))
+            self.assertGreaterEqual(delay, 0)
+
+
+class QuotaSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = MockClock()
+
+    def scheduler(self, **kwargs):
+        return QuotaScheduler(sleep=self.clock.sleep, clock=self.clock, **kwargs)
+
+    def test_reports_quota_wait(self):
+        scheduler = self.scheduler(rate=1, burst=1)
+
+        (_, stats1) = scheduler.call("p", lambda: None)
+        (result, stats2) = scheduler.call("p", lambda: "foo")
+
+        self.assertEqual(result, "foo")
+        self.assertEqual(stats1.quota_wait, 0)
+        self.assertEqual(stats2.quota_wait, 1)
+        self.assertEqual(scheduler.totals()["p"]["calls"], 2)
+
+    def test_fails_fast_beyond_max_quota_wait(self):
+        scheduler = self.scheduler(rate=1, burst=2, max_quota_wait=0.5)
+        calls = []
+
+        scheduler.call("p", calls.append, 1)
+        scheduler.call("p", calls.append, 2)
+        with self.assertRaises(QuotaWaitError) as cm:
+            scheduler.call("p", calls.append, 3)
+
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual((cm.exception.project, cm.exception.retry_after), ("p", 1))
+
+    def test_buckets_are_per_project(self):
+        scheduler = self.scheduler(rate=1, burst=1)
+
+        scheduler.call("p1", lambda: None)
+        (_, stats) = scheduler.call("p2", lambda: None)
+
+        self.assertEqual(stats.quota_wait, 0)
+
+    def test_retries_retryable_errors(self):
+        scheduler = self.scheduler()
+        errors = [api_exceptions.ResourceExhausted("quota"), None]
+
+        def fn():
+            err = errors.pop(0)
+            if err:
+                raise err
+            return "foo"
+
+        (result, stats) = scheduler.call("p", fn)
+
+        self.assertEqual(result, "foo")
+        self.assertEqual(stats.retries, 1)
+
+    def test_raises_after_max_retries(self):
+        scheduler = self.scheduler(max_retries=2)
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise api_exceptions.ServiceUnavailable("down")
+
+        with self.assertRaises(api_exceptions.ServiceUnavailable):
+            scheduler.call("p", fn)
+
+        self.assertEqual(len(calls), 3)
+
+    def test_does_not_retry_other_errors(self):
+        scheduler = self.scheduler()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise api_exceptions.BadRequest("bad filter")
+
+        with self.assertRaises(api_exceptions.BadRequest):
+            scheduler.call("p", fn)
+
+        self.assertEqual(len(calls), 1)
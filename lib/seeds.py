@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .batch import EntryStore
+from .correlate_logs import (
+    FilterTooBigError,
+    extract_search_state_from_log_entries,
+    find_entries,
+    merge_search_states,
+    pretty_json,
+)
+from .indexes import update_indexes
+from .spill import write_json
+
+logger = logging.getLogger(__name__)
+
+# seeds mostly wait on the Logging API, so a batch of them can run at once
+DEFAULT_SEED_WORKERS = 20
+# same default as the correlate_logs wrapper's $MAX_ITERATIONS
+DEFAULT_SEED_ITERATIONS = 32
+
+
+def seed_name(seed_file):
+    """Trace dir name for a seed file, same as the correlate_logs wrapper's."""
+    name = os.path.basename(seed_file)
+    return name[: -len(".json")] if name.endswith(".json") else name
+
+
+def without_traces(state, traces):
+    """Copy of the state without the given traces (to query)."""
+    if not traces:
+        return state
+
+    state = dict(state)
+    for k in ["traces", "tracesNew"]:
+        if k in state:
+            state[k] = [t for t in state[k] if t not in traces]
+
+    return state
+
+
+def with_traces(state, traces):
+    """Copy of the state with the given traces (to query) added."""
+    if not traces:
+        return state
+
+    return dict(state, traces=sorted(set(state.get("traces") or []) | set(traces)))
+
+
+class TraceRegistry:
+    """
+    Which seed covers (queries) each trace. The first seed to get to a trace
+    covers it; other seeds leave it out of their queries. A seed that fails
+    releases its traces, so the others take them over.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owners = {}
+        self._released = set()
+
+    def claim(self, seed, traces):
+        """Claims the traces for the seed, returning {trace: seed} of the others'."""
+        covered = {}
+
+        with self._lock:
+            for trace in traces:
+                owner = self._owners.setdefault(trace, seed)
+                if owner != seed:
+                    covered[trace] = owner
+
+            self._released.difference_update(traces)
+
+        return covered
+
+    def release(self, seed):
+        """Releases the seed's traces, returning them."""
+        with self._lock:
+            traces = [t for (t, owner) in self._owners.items() if owner == seed]
+            for trace in traces:
+                del self._owners[trace]
+
+            self._released.update(traces)
+
+        return traces
+
+    def released(self, covered):
+        """The covered traces ({trace: seed}) that their seed has released since."""
+        with self._lock:
+            return [t for (t, seed) in covered.items() if self._owners.get(t) != seed]
+
+    def uncovered(self):
+        """Released traces no seed has taken over (e.g. they were all done)."""
+        with self._lock:
+            return sorted(self._released)
+
+
+class SeedRunner:
+    """
+    Correlates seed files (GCP logs JSON) concurrently, each until no new log
+    entries are found, same as the correlate_logs wrapper does for one seed. Each
+    seed's steps are written to <traces dir>/<seed name>/ in the wrapper's layout
+    (step_N.json, step_N.resp.json and the indexes), so its post-processing
+    works as is.
+
+    Seeds share one entry store (deduplicated by insertId) and a trace registry,
+    so a trace is only queried by the first seed that gets to it (or, if that
+    seed fails, by the seeds still running).
+    """
+
+    def __init__(
+        self,
+        traces_dir,
+        max_workers=DEFAULT_SEED_WORKERS,
+        max_iterations=DEFAULT_SEED_ITERATIONS,
+        max_entries=None,
+        compact=False,
+        query_fn=None,
+    ):
+        self.traces_dir = traces_dir
+        self.max_workers = max_workers
+        self.max_iterations = max_iterations
+        self.max_entries = max_entries
+        self.compact = compact
+        self.query_fn = query_fn
+
+        self.store = EntryStore()
+        self.registry = TraceRegistry()
+
+    def run(self, seed_files):
+        """Correlates all seeds, returning the combined report."""
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            seeds = list(pool.map(self._run_seed_safely, seed_files))
+
+        states = [s.pop("searchState") for s in seeds if s.get("searchState")]
+
+        uncovered = self.registry.uncovered()
+        if uncovered:
+            logger.warning(f"{len(uncovered)} traces of failed seeds were not covered")
+
+        return {
+            "seeds": seeds,
+            "uncoveredTraces": uncovered,
+            "logEntryCount": len(self.store),
+            "searchState": merge_search_states(states) if states else None,
+            "elapsedSeconds": round(time.monotonic() - started, 3),
+        }
+
+    def _run_seed_safely(self, seed_file):
+        # one bad seed shouldn't take the others' results with it
+        try:
+            return self.run_seed(seed_file)
+        except Exception as err:
+            logger.exception(f"{seed_name(seed_file)}: failed")
+            self.registry.release(seed_name(seed_file))
+            return {"name": seed_name(seed_file), "status": "error", "msg": str(err)}
+
+    def run_seed(self, seed_file):
+        name = seed_name(seed_file)
+        trace_path = os.path.join(self.traces_dir, name)
+        os.makedirs(trace_path, exist_ok=True)
+        started = time.monotonic()
+
+        step_file = os.path.join(trace_path, "step_0.json")
+        shutil.copyfile(seed_file, step_file)
+        with open(seed_file, "r") as f:
+            state = extract_search_state_from_log_entries(json.load(f))
+
+        with open(step_file.replace(".json", ".input-state.json"), "w") as f:
+            print(pretty_json(state), file=f)
+
+        result = {"name": name, "tracePath": trace_path, "status": "ok", "steps": 0}
+        covered = {}
+        insert_ids = set()
+        new_count = 0
+        continuation = None
+
+        for i in range(self.max_iterations + 1):
+            # continued queries were already picked
+            if not continuation:
+                claimed = self.registry.claim(
+                    name, set(state.get("traces") or []) | set(covered)
+                )
+                # traces of seeds that failed since
+                taken_over = [t for t in covered if t not in claimed]
+                if taken_over:
+                    logger.info(f"{name}: took over {len(taken_over)} traces")
+
+                covered = claimed
+                state = with_traces(without_traces(state, covered), taken_over)
+
+            try:
+                (resp_msg, resp_data) = find_entries(
+                    state,
+                    query_fn=self.query_fn,
+                    max_entries=self.max_entries,
+                    continuation=continuation,
+                    compact=self.compact,
+                )
+            except FilterTooBigError as err:
+                (result["status"], result["msg"]) = ("error", str(err))
+                self.registry.release(name)
+                break
+
+            result["steps"] = i + 1
+            result["msg"] = resp_msg
+            logger.info(f"{name}: step {i}: {resp_msg}")
+
+            resp_file = step_file.replace(".json", ".resp.json")
+            with open(resp_file, "w") as f:
+                write_json(resp_data, f)
+                f.write("\n")
+
+            # same as the wrapper, indexes are usable mid-run
+            try:
+                update_indexes(trace_path, [resp_file])
+            except (OSError, ValueError) as err:
+                logger.warning(f"{name}: could not update indexes: {err}")
+
+            entries = resp_data["logEntries"]
+            insert_ids.update(e.get("insertId") for e in entries)
+            new_count += len(self.store.add(entries))
+
+            resp_state = resp_data["searchState"]
+            continuation = resp_data.get("continuation")
+            out_state = (
+                dict(resp_state, continuation=continuation)
+                if continuation
+                else resp_state
+            )
+            step_file = os.path.join(trace_path, f"step_{i + 1}.json")
+            with open(step_file, "w") as f:
+                print(pretty_json(out_state), file=f)
+
+            if continuation:
+                state = resp_state
+                continue
+
+            # same stopping conditions as ./correlate_logs.py's exit statuses.
+            # covered traces always come back (from the seed's own entries).
+            # traces released by failed seeds are taken over before stopping.
+            if (
+                without_traces(resp_state, covered) == state or not entries
+            ) and not self.registry.released(covered):
+                break
+
+            state = resp_state
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"{name}: found {len(insert_ids)} log entries ({new_count} new) in "
+            f"{result['steps']} steps, {elapsed:.1f}s"
+        )
+        if covered:
+            logger.info(f"{name}: skipped {len(covered)} traces covered by others")
+
+        return dict(
+            result,
+            logEntryCount=len(insert_ids),
+            newLogEntryCount=new_count,
+            coveredTraces=covered,
+            elapsedSeconds=round(elapsed, 3),
+            searchState=state,
+        )
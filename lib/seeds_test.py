@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+
+from .seeds import SeedRunner, TraceRegistry, seed_name, without_traces
+from .testing import mock_entry
+
+# trace -> its log entries
+MOCK_TRACES = {
+    "abc": [mock_entry("a1", trace="abc"), mock_entry("a2", trace="abc")],
+    "def": [mock_entry("d1", trace="def")],
+}
+
+
+class TraceRegistryTest(unittest.TestCase):
+    def test_first_seed_covers_trace(self):
+        registry = TraceRegistry()
+
+        self.assertEqual(registry.claim("one", ["abc"]), {})
+        self.assertEqual(registry.claim("two", ["abc", "def"]), {"abc": "one"})
+        self.assertEqual(registry.claim("one", ["abc", "def"]), {"def": "two"})
+
+    def test_released_traces_are_taken_over(self):
+        registry = TraceRegistry()
+        registry.claim("one", ["abc"])
+        covered = registry.claim("two", ["abc", "def"])
+
+        self.assertEqual(registry.release("one"), ["abc"])
+        self.assertEqual(registry.released(covered), ["abc"])
+        self.assertEqual(registry.uncovered(), ["abc"])
+
+        self.assertEqual(registry.claim("two", ["abc", "def"]), {})
+        self.assertEqual(registry.uncovered(), [])
+
+    def test_without_traces(self):
+        state = {"traces": ["abc", "def"], "tracesNew": ["def"], "insertIds": []}
+
+        self.assertEqual(
+            without_traces(state, {"def": "two"}),
+            {"traces": ["abc"], "tracesNew": [], "insertIds": []},
+        )
+        self.assertIs(without_traces(state, {}), state)
+
+
+class SeedRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.traces_dir = os.path.join(self.tmpdir.name, "traces")
+
+        self.lock = threading.Lock()
+        self.queried_traces = []
+
+    def query_fn(self, query, project=None):
+        # traces/abc" (equals) or traces/(abc|def)" (regex)
+        traces = [
+            t
+            for match in re.findall(r"traces/\(?([\w|]+)", query)
+            for t in match.split("|")
+        ]
+        with self.lock:
+            self.queried_traces.extend(traces)
+
+        return [e for t in traces for e in MOCK_TRACES.get(t, [])]
+
+    def write_seed(self, name, entries):
+        filename = os.path.join(self.tmpdir.name, f"{name}.json")
+        with open(filename, "w") as f:
+            json.dump(entries, f)
+
+        return filename
+
+    def test_seeds_share_traces_and_entries(self):
+        seeds = [
+            self.write_seed("one", [mock_entry("a1", trace="abc")]),
+            self.write_seed(
+                "two", [mock_entry("a2", trace="abc"), mock_entry("d1", trace="def")]
+            ),
+        ]
+        runner = SeedRunner(self.traces_dir, max_workers=1, query_fn=self.query_fn)
+
+        report = runner.run(seeds)
+
+        (one, two) = report["seeds"]
+        self.assertEqual((one["status"], two["status"]), ("ok", "ok"))
+        self.assertEqual(one["logEntryCount"], 2)
+        # abc was left to the first seed
+        self.assertEqual(two["coveredTraces"], {"abc": "one"})
+        self.assertEqual(two["logEntryCount"], 1)
+        self.assertEqual(self.queried_traces.count("abc"), one["steps"])
+
+        self.assertEqual(report["logEntryCount"], 3)
+        self.assertEqual(sorted(report["searchState"]["traces"]), ["abc", "def"])
+
+    def test_writes_wrapper_step_files(self):
+        seed = self.write_seed("one", [mock_entry("a1", trace="abc")])
+
+        report = SeedRunner(self.traces_dir, query_fn=self.query_fn).run([seed])
+
+        trace_path = os.path.join(self.traces_dir, "one")
+        steps = report["seeds"][0]["steps"]
+        files = sorted(os.listdir(trace_path))
+        self.assertIn("step_0.json", files)
+        self.assertIn("step_0.input-state.json", files)
+        self.assertIn(f"step_{steps - 1}.resp.json", files)
+        self.assertIn(f"step_{steps}.json", files)
+
+        with open(os.path.join(trace_path, "step_0.resp.json")) as f:
+            resp_data = json.load(f)
+        self.assertEqual([e["insertId"] for e in resp_data["logEntries"]], ["a1", "a2"])
+
+    def test_bad_seed_doesnt_fail_batch(self):
+        seeds = [
+            os.path.join(self.tmpdir.name, "missing.json"),
+            self.write_seed("one", [mock_entry("a1", trace="abc")]),
+        ]
+
+        report = SeedRunner(self.traces_dir, query_fn=self.query_fn).run(seeds)
+
+        self.assertEqual([s["status"] for s in report["seeds"]], ["error", "ok"])
+        self.assertEqual(report["logEntryCount"], 2)
+
+    def test_failed_seeds_traces_are_taken_over(self):
+        seed = self.write_seed(
+            "two", [mock_entry("a2", trace="abc"), mock_entry("d1", trace="def")]
+        )
+        runner = SeedRunner(self.traces_dir, query_fn=self.query_fn)
+        # another seed has abc, and fails after this seed's first step
+        runner.registry.claim("one", ["abc"])
+        query_fn = self.query_fn
+
+        def failing_query_fn(query, project=None):
+            entries = query_fn(query, project)
+            runner.registry.release("one")
+            return entries
+
+        runner.query_fn = failing_query_fn
+        report = runner.run([seed])
+
+        (two,) = report["seeds"]
+        self.assertEqual(two["coveredTraces"], {})
+        self.assertEqual(two["logEntryCount"], 3)
+        self.assertIn("abc", self.queried_traces)
+        self.assertEqual(report["uncoveredTraces"], [])
+
+    def test_failed_seed_releases_traces(self):
+        seeds = [
+            self.write_seed("one", [mock_entry("a1", trace="abc")]),
+            self.write_seed("two", [mock_entry("a2", trace="abc")]),
+        ]
+        calls = []
+
+        def query_fn(query, project=None):
+            calls.append(query)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return self.query_fn(query, project)
+
+        runner = SeedRunner(self.traces_dir, max_workers=1, query_fn=query_fn)
+        report = runner.run(seeds)
+
+        (one, two) = report["seeds"]
+        self.assertEqual((one["status"], two["status"]), ("error", "ok"))
+        self.assertEqual(two["coveredTraces"], {})
+        self.assertEqual(two["logEntryCount"], 2)
+
+    def test_seed_name(self):
+        self.assertEqual(seed_name("/tmp/seeds/foo.json"), "foo")
+        self.assertEqual(seed_name("foo.log"), "foo.log")
+
+
+if __name__ == "__main__":
+    unittest.main()
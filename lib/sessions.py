@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# where to store sessions, e.g. "sqlite:///tmp/sessions.db" or
+# "file:///tmp/sessions". sessions are disabled when unset.
+#
+# NOTE: on Cloud Functions, /tmp is an in-memory filesystem local to each
+# instance, so a session only survives as long as requests keep landing on the
+# instance that created it. point this at shared storage for anything more.
+SESSION_STORE_ENV_VAR = "SESSION_STORE"
+
+SESSION_TTL = 12 * 60 * 60  # seconds
+SESSION_TOKEN_REGEX = r"^[A-Za-z0-9_-]{16,64}$"
+
+
+class SessionNotFoundError(Exception):
+    pass
+
+
+def new_session_token():
+    return secrets.token_urlsafe(24)
+
+
+def validate_session_token(token):
+    if not (isinstance(token, str) and re.match(SESSION_TOKEN_REGEX, token)):
+        raise SessionNotFoundError
+
+
+class FileSessionStore:
+    """Stores each session as a JSON file named after its token."""
+
+    def __init__(self, path, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+
+    def _session_file(self, token):
+        validate_session_token(token)
+        return os.path.join(self.path, f"{token}.json")
+
+    def get(self, token):
+        try:
+            with open(self._session_file(token), "r") as f:
+                session = json.load(f)
+        except FileNotFoundError as err:
+            raise SessionNotFoundError from err
+
+        if time.time() - session["updated"] > self.ttl:
+            os.remove(self._session_file(token))
+            raise SessionNotFoundError
+
+        return session["data"]
+
+    def put(self, token, data):
+        session_file = self._session_file(token)
+
+        # write atomically so concurrent readers never see a partial session
+        tmp_file = f"{session_file}.{secrets.token_hex(4)}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"updated": time.time(), "data": data}, f)
+        os.replace(tmp_file, session_file)
+
+
+class SqliteSessionStore:
+    """Stores sessions as JSON blobs in a single SQLite table."""
+
+    def __init__(self, path, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(token TEXT PRIMARY KEY, updated REAL, data TEXT)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, token):
+        validate_session_token(token)
+
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,)
+            )
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE token = ?", (token,)
+            ).fetchone()
+
+        if not row:
+            raise SessionNotFoundError
+
+        return json.loads(row[0])
+
+    def put(self, token, data):
+        validate_session_token(token)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (token, updated, data) "
+                "VALUES (?, ?, ?)",
+                (token, time.time(), json.dumps(data)),
+            )
+
+
+SESSION_STORE_TYPES = {
+    "file": FileSessionStore,
+    "sqlite": SqliteSessionStore,
+}
+
+
+def session_store_from_url(url):
+    parsed_url = urlparse(url)
+
+    try:
+        store_cls = SESSION_STORE_TYPES[parsed_url.scheme]
+    except KeyError as err:
+        raise ValueError(f"Unknown session store: {url}") from err
+
+    return store_cls(parsed_url.path)
+
+
+_session_store = None
+
+
+def get_session_store():
+    """Returns the configured session store, or None if sessions are disabled."""
+    global _session_store
+
+    if _session_store is None and os.environ.get(SESSION_STORE_ENV_VAR):
+        _session_store = session_store_from_url(os.environ[SESSION_STORE_ENV_VAR])
+        logger.info(f"Using session store: {os.environ[SESSION_STORE_ENV_VAR]}")
+
+    return _session_store
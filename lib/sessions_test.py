@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .sessions import (
+    FileSessionStore,
+    SessionNotFoundError,
+    SqliteSessionStore,
+    new_session_token,
+    session_store_from_url,
+)
+
+
+def mock_session():
+    return {"searchState": {"traces": ["abc"]}, "prevUrl": "http://foo/bar"}
+
+
+class SessionStoreTestMixin:
+    def test_put_then_get(self):
+        token = new_session_token()
+        self.store.put(token, mock_session())
+        self.assertEqual(self.store.get(token), mock_session())
+
+    def test_put_overwrites(self):
+        token = new_session_token()
+        self.store.put(token, mock_session())
+        self.store.put(token, {"searchState": {}, "prevUrl": None})
+        self.assertEqual(self.store.get(token)["searchState"], {})
+
+    def test_get_unknown_token_raises(self):
+        with self.assertRaises(SessionNotFoundError):
+            self.store.get(new_session_token())
+
+    def test_get_invalid_token_raises(self):
+        with self.assertRaises(SessionNotFoundError):
+            self.store.get("../../etc/passwd")
+
+    def test_get_expired_token_raises(self):
+        token = new_session_token()
+        self.store.put(token, mock_session())
+
+        with mock.patch("time.time", return_value=self.store.ttl * 2e6):
+            with self.assertRaises(SessionNotFoundError):
+                self.store.get(token)
+
+
+class FileSessionStoreTest(SessionStoreTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = FileSessionStore(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class SqliteSessionStoreTest(SessionStoreTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = SqliteSessionStore(os.path.join(self.tmp_dir.name, "s.db"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class SessionStoreFromUrlTest(unittest.TestCase):
+    def test_creates_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = session_store_from_url(f"sqlite://{tmp_dir}/s.db")
+            self.assertIsInstance(store, SqliteSessionStore)
+            self.assertEqual(store.path, f"{tmp_dir}/s.db")
+
+    def test_creates_file_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = session_store_from_url(f"file://{tmp_dir}")
+            self.assertIsInstance(store, FileSessionStore)
+
+    def test_raises_for_unknown_store(self):
+        with self.assertRaises(ValueError):
+            session_store_from_url("redis://localhost")
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+
+from .log_entry import LogEntry, json_default
+from .timestamps import entry_timestamp_ns
+
+logger = logging.getLogger(__name__)
+
+# e.g. MEMORY_BUDGET_MB=200. unset means keep everything in memory (as before).
+MEMORY_BUDGET_ENV = "MEMORY_BUDGET_MB"
+# where spill files go; defaults to the system temp dir
+SPILL_DIR_ENV = "SPILL_DIR"
+
+# how many entries to read back at once, e.g. for extracting search state
+SPILL_CHUNK_SIZE = 500
+
+
+def memory_budget_from_env():
+    """Returns the RSS budget in bytes, or None when not configured."""
+    budget_mb = os.environ.get(MEMORY_BUDGET_ENV)
+
+    return int(float(budget_mb) * 1024 * 1024) if budget_mb else None
+
+
+def current_rss():
+    """Resident set size of this process, in bytes."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # no procfs (e.g. macOS); peak RSS is the best we can do. it's in bytes
+        # on macOS but kilobytes on linux.
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class SpillStore:
+    """
+    Collection of log entries, deduplicated by insertId, that stays within an
+    RSS budget. Once the process is over budget, further entries are appended
+    to a temporary JSON lines file and only their insertId, timestamp and file
+    offset are kept in memory. Iterating yields all entries sorted by timestamp,
+    reading spilled entries back one at a time.
+
+    Works as a drop-in for a list of entries in most places: len(), iteration,
+    and first/last item access. Adding entries is thread-safe, since projects
+    are queried concurrently.
+    """
+
+    def __init__(self, budget_bytes, rss_fn=current_rss, spill_dir=None):
+        self.budget_bytes = budget_bytes
+        self.rss_fn = rss_fn
+        self.spill_dir = spill_dir or os.environ.get(SPILL_DIR_ENV)
+
+        self.counts_by_project = {}
+        self.spilled_count = 0
+
+        # insertId -> (timestamp ns, arrival order, file offset or None)
+        self._index = {}
+        self._entries = {}
+        self._file = None
+        self._sorted_ids = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, insert_id):
+        return insert_id in self._index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def is_over_budget(self):
+        return self.budget_bytes is not None and self.rss_fn() > self.budget_bytes
+
+    def _spill_file(self):
+        if not self._file:
+            # deleted on close (or when the process exits)
+            self._file = tempfile.TemporaryFile(
+                prefix="correlate_logs_", suffix=".jsonl", dir=self.spill_dir
+            )
+            logger.info("Memory budget exceeded; spilling log entries to disk")
+
+        return self._file
+
+    def extend(self, entries, project=None):
+        """Adds entries, returning how many of them were not seen before."""
+        with self._lock:
+            return self._extend(entries, project)
+
+    def _extend(self, entries, project):
+        # checking RSS once per batch (e.g. an API page) is cheap enough
+        spill = self.is_over_budget()
+        added = 0
+
+        for entry in entries:
+            insert_id = entry.get("insertId")
+            if insert_id in self._index:
+                continue
+
+            # parsed before spilling, so spilled entries keep the parsed values
+            timestamp_ns = entry_timestamp_ns(entry) or 0
+            offset = None
+            if spill:
+                f = self._spill_file()
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(
+                    (
+                        entry.raw
+                        if isinstance(entry, LogEntry)
+                        else json.dumps(entry, separators=(",", ":")).encode()
+                    )
+                    + b"\n"
+                )
+                self.spilled_count += 1
+            else:
+                self._entries[insert_id] = entry
+
+            self._index[insert_id] = (timestamp_ns, len(self._index), offset)
+            added += 1
+
+        if project is not None:
+            self.counts_by_project[project] = (
+                self.counts_by_project.get(project, 0) + added
+            )
+
+        self._sorted_ids = None
+        return added
+
+    def for_project(self, project):
+        return SpillStoreProjectView(self, project)
+
+    def without(self, insert_ids):
+        """The entries not in insert_ids, still read back one at a time."""
+        return SpillStoreSubset(
+            self, [i for i in self.insert_ids() if i not in insert_ids]
+        )
+
+    def _read(self, insert_id):
+        if insert_id in self._entries:
+            return self._entries[insert_id]
+
+        with self._lock:
+            f = self._spill_file()
+            f.seek(self._index[insert_id][2])
+            line = f.readline()
+
+        return json.loads(line)
+
+    def insert_ids(self):
+        """insertIds sorted by timestamp (then arrival order)."""
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted(self._index, key=self._index.get)
+
+        return self._sorted_ids
+
+    def __iter__(self):
+        for insert_id in self.insert_ids():
+            yield self._read(insert_id)
+
+    def __getitem__(self, i):
+        # only single items; slices would defeat the point
+        return self._read(self.insert_ids()[i])
+
+    def __bool__(self):
+        return bool(self._index)
+
+    def chunks(self, size=SPILL_CHUNK_SIZE):
+        chunk = []
+        for entry in self:
+            chunk.append(entry)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+
+class SpillStoreProjectView:
+    """
+    A project's share of a SpillStore; used as a query_logs() sink so entries
+    are counted per project.
+    """
+
+    def __init__(self, store, project):
+        self.store = store
+        self.project = project
+
+    def __len__(self):
+        return self.store.counts_by_project.get(self.project, 0)
+
+    def __getitem__(self, i):
+        return self.store[i]
+
+    def extend(self, entries):
+        return self.store.extend(entries, self.project)
+
+
+class SpillStoreSubset:
+    """Some of a SpillStore's entries (see SpillStore.without()), in its order."""
+
+    def __init__(self, store, insert_ids):
+        self.store = store
+        self._insert_ids = insert_ids
+
+    def __len__(self):
+        return len(self._insert_ids)
+
+    def __bool__(self):
+        return bool(self._insert_ids)
+
+    def __iter__(self):
+        for insert_id in self._insert_ids:
+            yield self.store._read(insert_id)
+
+    def __getitem__(self, i):
+        return self.store._read(self._insert_ids[i])
+
+
+def is_spilled(entries):
+    """Whether the entries are (some of) a SpillStore's, to stream back out."""
+    return isinstance(entries, (SpillStore, SpillStoreSubset))
+
+
+# ---
+
+
+def concat_step_entries(filenames, store):
+    """
+    Adds the log entries of step response JSON files to the store, one file at a
+    time. Steps re-query known ids, so the same entries show up in several
+    steps; the store keeps each insertId once (same as concat_log_entries.jq).
+    """
+    for filename in filenames:
+        with open(filename, "r") as f:
+            store.extend(json.load(f).get("logEntries") or [])
+
+    return store
+
+
+def iter_json(data, indent=2, _level=0):
+    """
+    Like json.dumps(data, indent=indent), but yields the output in pieces and
+    streams SpillStore (and SpillStoreSubset) values entry by entry instead of
+    loading them at once.
+    LogEntry values are written as their dicts.
+    """
+    if isinstance(data, dict):
+        if not data:
+            yield "{}"
+            return
+
+        pad = " " * (indent * (_level + 1))
+        yield "{"
+        for i, (k, v) in enumerate(data.items()):
+            yield f"{',' if i else ''}\n{pad}{json.dumps(k)}: "
+            yield from iter_json(v, indent, _level + 1)
+        yield f"\n{' ' * (indent * _level)}}}"
+
+    elif is_spilled(data):
+        if not data:
+            yield "[]"
+            return
+
+        pad = " " * (indent * (_level + 1))
+        yield "["
+        for i, entry in enumerate(data):
+            yield f"{',' if i else ''}\n{pad}"
+            # each entry is small, so it can be dumped at once
+            yield json.dumps(entry, indent=indent, default=json_default).replace(
+                "\n", f"\n{pad}"
+            )
+        yield f"\n{' ' * (indent * _level)}]"
+
+    else:
+        text = json.dumps(data, indent=indent, default=json_default)
+        yield text.replace("\n", f"\n{' ' * (indent * _level)}")
+
+
+def write_json(data, f, indent=2):
+    for piece in iter_json(data, indent):
+        f.write(piece)
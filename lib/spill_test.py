@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from .correlate_logs import find_entries
+from .spill import SpillStore, concat_step_entries, write_json
+from .testing import mock_entry, mock_state
+
+
+class SpillStoreTest(unittest.TestCase):
+    def test_keeps_entries_in_memory_under_budget(self):
+        with SpillStore(100, rss_fn=lambda: 50) as store:
+            store.extend([mock_entry("1", 1)])
+
+            self.assertEqual(store.spilled_count, 0)
+            self.assertEqual([e["insertId"] for e in store], ["1"])
+
+    def test_spills_entries_over_budget(self):
+        rss = [50]
+
+        with SpillStore(100, rss_fn=lambda: rss[0]) as store:
+            store.extend([mock_entry("2", 2)], project="gen-prod")
+            rss[0] = 150
+            store.extend([mock_entry("3", 3), mock_entry("1", 1)], project="gen-prod")
+
+            self.assertEqual(store.spilled_count, 2)
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.counts_by_project, {"gen-prod": 3})
+            self.assertEqual([e["insertId"] for e in store], ["1", "2", "3"])
+            self.assertEqual(store[0]["insertId"], "1")
+            self.assertEqual(store[-1]["insertId"], "3")
+
+    def test_deduplicates_by_insert_id(self):
+        with SpillStore(None) as store:
+            added = store.extend([mock_entry("1", 1), mock_entry("1", 1)])
+
+            self.assertEqual(added, 1)
+            self.assertEqual(len(store), 1)
+
+    def test_chunks(self):
+        with SpillStore(0, rss_fn=lambda: 1) as store:
+            store.extend([mock_entry(str(i), i) for i in range(5)])
+
+            actual = [len(c) for c in store.chunks(size=2)]
+            self.assertEqual(actual, [2, 2, 1])
+
+
+class ConcatStepEntriesTest(unittest.TestCase):
+    def test_deduplicates_across_steps(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filenames = []
+            # later steps find earlier steps' entries again
+            for (i, entries) in enumerate(
+                [
+                    [mock_entry("2", 2), mock_entry("1", 1)],
+                    [mock_entry("1", 1), mock_entry("2", 2), mock_entry("3", 3)],
+                    [],
+                ]
+            ):
+                filenames.append(os.path.join(tmpdir, f"step_{i}.resp.json"))
+                with open(filenames[-1], "w") as f:
+                    json.dump({"logEntries": entries}, f)
+
+            with SpillStore(0, rss_fn=lambda: 1) as store:
+                concat_step_entries(filenames, store)
+
+                self.assertEqual([e["insertId"] for e in store], ["1", "2", "3"])
+
+
+class WriteJsonTest(unittest.TestCase):
+    def test_matches_json_dumps(self):
+        entries = [mock_entry("1", 1), mock_entry("2", 2)]
+        data = {"a": {"b": [1, 2], "c": {}}, "logEntries": entries, "d": []}
+
+        with SpillStore(0, rss_fn=lambda: 1) as store:
+            store.extend(entries)
+
+            f = io.StringIO()
+            write_json(dict(data, logEntries=store), f)
+
+        self.assertEqual(json.loads(f.getvalue()), json.loads(json.dumps(data)))
+        self.assertEqual(f.getvalue(), json.dumps(data, indent=2))
+
+
+class FindEntriesMemoryBudgetTest(unittest.TestCase):
+    def test_same_result_when_spilling(self):
+        def query_fn(query, project=None):
+            return [mock_entry("2", 2, "def"), mock_entry("1", 1)]
+
+        (_, expected) = find_entries(mock_state(), query_fn=query_fn)
+        # every entry spills with a 1 byte budget
+        (_, actual) = find_entries(mock_state(), query_fn=query_fn, memory_budget=1)
+
+        self.assertIsInstance(actual["logEntries"], SpillStore)
+        self.assertEqual(actual["logEntries"].spilled_count, 2)
+        self.assertEqual(list(actual["logEntries"]), expected["logEntries"])
+        self.assertEqual(actual["searchState"], expected["searchState"])
+        self.assertEqual(
+            actual["logEntryCountsByProject"], expected["logEntryCountsByProject"]
+        )
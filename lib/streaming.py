@@ -0,0 +1,235 @@
+import json
+import logging
+import queue
+import threading
+
+from .correlate_logs import (
+    FilterTooBigError,
+    create_logs_filter_from_search_state,
+    find_entries,
+    gcp_logs_url,
+    query_logs,
+    state_time_range,
+)
+from .tail import TAIL_DURATION, TAIL_INTERVAL, LiveTail
+from .trace_graph import has_unqueried_traces
+
+logger = logging.getLogger(__name__)
+
+# same as the wrapper script's default MAX_ITERATIONS
+MAX_STREAM_ITERATIONS = 32
+
+_DONE = object()
+
+
+def sse_event(event, data):
+    """Formats a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def state_url(state, url_params=None, url_qs=None):
+    return gcp_logs_url(
+        create_logs_filter_from_search_state(state),
+        state_time_range(state),
+        url_params,
+        url_qs,
+    )
+
+
+class StreamProgress:
+    """
+    Tracks which log entries were already sent, so each event only carries new
+    entries. Pages arrive from per-project query threads, hence the lock.
+    """
+
+    def __init__(self):
+        self.insert_ids = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.insert_ids)
+
+    def new_entries(self, entries):
+        with self._lock:
+            new = [e for e in entries if e.get("insertId") not in self.insert_ids]
+            self.insert_ids.update(e.get("insertId") for e in new)
+
+        return new
+
+
+def _run_in_background(fn, events):
+    """Runs fn in a thread, putting its result (or error) on the events queue."""
+
+    def run():
+        try:
+            events.put(("result", fn()))
+        except Exception as err:
+            events.put(("error", err))
+        finally:
+            events.put(_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    return thread
+
+
+def correlate_stream(
+    state,
+    url_params=None,
+    url_qs=None,
+    query_fn=None,
+    graph_ordering=False,
+    max_iterations=MAX_STREAM_ITERATIONS,
+):
+    """
+    Iterates find_entries() until no more log entries are found (and with graph
+    ordering, no traces are left to query), yielding (event, data) tuples as it
+    goes:
+
+    - "page" after each page of log entries from the Logging API
+    - "iteration" after each find_entries() call, with the updated search state
+    - "done" (or "error") once finished
+
+    Every event carries the new log entries (if any), the running count, and the
+    current url. `query_fn` must accept an `on_page` callback like query_logs().
+    """
+    query_fn = query_fn or query_logs
+    progress = StreamProgress()
+    url = state_url(state, url_params, url_qs)
+
+    for iteration in range(max_iterations):
+        events = queue.Queue()
+
+        def page_event(page_entries, project, iteration=iteration, url=url):
+            return (
+                "page",
+                {
+                    "iteration": iteration,
+                    "project": project,
+                    "logEntries": progress.new_entries(page_entries),
+                    "pageEntryCount": len(page_entries),
+                    "logEntryCount": len(progress),
+                    "url": url,
+                },
+            )
+
+        def streaming_query_fn(query, project=None, events=events):
+            return query_fn(
+                query,
+                project,
+                on_page=lambda page: events.put(page_event(page, project)),
+            )
+
+        _run_in_background(
+            lambda s=state: find_entries(
+                s,
+                url_params,
+                url_qs,
+                query_fn=streaming_query_fn,
+                graph_ordering=graph_ordering,
+            ),
+            events,
+        )
+
+        result = None
+        for item in iter(events.get, _DONE):
+            (kind, data) = item
+            if kind == "page":
+                yield item
+            elif kind == "error":
+                yield ("error", _error_data(data, url, progress))
+                return
+            else:
+                result = data
+
+        (resp_msg, resp_data) = result
+        resp_state = resp_data["searchState"]
+        url = resp_data["url"]
+
+        yield (
+            "iteration",
+            {
+                "iteration": iteration,
+                "msg": resp_msg,
+                # normally all sent with "page" events already
+                "logEntries": progress.new_entries(resp_data["logEntries"]),
+                "logEntryCountNew": resp_data["logEntryCount"],
+                "logEntryCount": len(progress),
+                "url": url,
+                "searchState": resp_state,
+            },
+        )
+
+        (prev_state, state) = (state, resp_state)
+
+        # same stopping conditions as correlate_logs.py: graph-ordered steps
+        # keep going while there are traces left to query
+        if state == prev_state or not (
+            resp_data["logEntries"] or (graph_ordering and has_unqueried_traces(state))
+        ):
+            break
+
+    yield (
+        "done",
+        {
+            "iterations": iteration + 1,
+            "msg": f"Found {len(progress)} log entries",
+            "logEntryCount": len(progress),
+            "url": url,
+            "searchState": state,
+        },
+    )
+
+
+def _error_data(err, url, progress):
+    logger.error(f"Streaming correlation failed: {err!r}", exc_info=err)
+
+    msg = (
+        "Computed filter is too big for GCP Logging API."
+        if isinstance(err, FilterTooBigError)
+        else "Unexpected error while correlating log entries"
+    )
+
+    return {"msg": msg, "logEntryCount": len(progress), "url": url}
+
+
+def sse_stream(*args, **kwargs):
+    """correlate_stream(), formatted as server-sent events."""
+    for (event, data) in correlate_stream(*args, **kwargs):
+        yield sse_event(event, data)
+
+
+def tail_sse_stream(
+    state,
+    query_fn=None,
+    interval=TAIL_INTERVAL,
+    duration=TAIL_DURATION,
+    last_seen=None,
+):
+    """
+    Live-tails the correlation (see LiveTail) as server-sent events: a "tail"
+    event per refresh with its new entries and newly tracked ids, then a "done"
+    event with the updated search state and last seen timestamp, which the
+    client sends back to keep tailing.
+    """
+    live_tail = LiveTail(state, query_fn, last_seen=last_seen)
+
+    try:
+        for result in live_tail.run(interval, duration):
+            yield sse_event("tail", result)
+    except Exception as err:
+        logger.error(f"Live tail failed: {err!r}", exc_info=err)
+        yield sse_event(
+            "error",
+            {"msg": "Unexpected error while tailing log entries"},
+        )
+
+    yield sse_event(
+        "done",
+        {
+            "refreshes": live_tail.refreshes,
+            "lastSeen": live_tail.last_seen,
+            "searchState": live_tail.state,
+        },
+    )
@@ -0,0 +1,116 @@
+import json
+import unittest
+
+from .correlate_logs import FilterTooBigError
+from .streaming import correlate_stream, sse_event, tail_sse_stream
+from .testing import mock_entry, mock_state
+
+NEW_TIMESTAMP = "2022-11-29T16:05:30.000Z"
+
+
+class CorrelateStreamTest(unittest.TestCase):
+    def test_emits_pages_iterations_and_done(self):
+        calls = []
+
+        def query_fn(query, project=None, on_page=None):
+            calls.append(query)
+            # 1st iteration finds a new trace, 2nd finds nothing new
+            pages = (
+                [[mock_entry("1", 1)], [mock_entry("2", 2, "def")]]
+                if len(calls) == 1
+                else []
+            )
+            for page in pages:
+                on_page(page)
+
+            return [e for page in pages for e in page]
+
+        events = list(correlate_stream(mock_state(), query_fn=query_fn))
+
+        self.assertEqual(
+            [event for (event, _) in events],
+            ["page", "page", "iteration", "iteration", "done"],
+        )
+
+        (_, first_page) = events[0]
+        self.assertEqual([e["insertId"] for e in first_page["logEntries"]], ["1"])
+        self.assertEqual(first_page["logEntryCount"], 1)
+        self.assertIn("url", first_page)
+
+        (_, iteration) = events[2]
+        self.assertEqual(iteration["logEntries"], [])
+        self.assertEqual(iteration["logEntryCount"], 2)
+        self.assertIn("def", iteration["searchState"]["traces"])
+
+        (_, done) = events[-1]
+        self.assertEqual(done["iterations"], 2)
+        self.assertEqual(done["logEntryCount"], 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_graph_ordering_streams_until_traces_are_queried(self):
+        queries = []
+
+        def query_fn(query, project=None, on_page=None):
+            queries.append(query)
+            return []
+
+        # each trace's entries are known already, so no step finds anything new
+        state = dict(
+            mock_state(),
+            traces=["child", "grandchild", "seed"],
+            graphRoots=["trace:seed"],
+            graphEdges=[
+                "trace:seed>task:1",
+                "task:1>trace:child",
+                "trace:child>task:2",
+                "task:2>trace:grandchild",
+            ],
+        )
+
+        events = list(correlate_stream(state, query_fn=query_fn, graph_ordering=True))
+
+        (_, done) = events[-1]
+        self.assertEqual(done["iterations"], 3)
+        self.assertEqual(
+            done["searchState"]["tracesQueried"], ["child", "grandchild", "seed"]
+        )
+
+    def test_emits_error(self):
+        def query_fn(query, project=None, on_page=None):
+            raise FilterTooBigError
+
+        events = list(correlate_stream(mock_state(), query_fn=query_fn))
+
+        self.assertEqual([event for (event, _) in events], ["error"])
+        self.assertIn("too big", events[0][1]["msg"])
+
+
+class TailSseStreamTest(unittest.TestCase):
+    def test_emits_tail_and_done(self):
+        def query_fn(query, project=None):
+            return [mock_entry("1", 1), mock_entry("2", timestamp=NEW_TIMESTAMP)]
+
+        # one refresh, since the next one would be past the duration
+        events = [
+            e.split("\n")
+            for e in tail_sse_stream(
+                dict(mock_state(), insertIds=["1"]),
+                query_fn=query_fn,
+                interval=10,
+                duration=5,
+            )
+        ]
+
+        self.assertEqual([e[0] for e in events], ["event: tail", "event: done"])
+        tail = json.loads(events[0][1].split("data: ")[1])
+        self.assertEqual([e["insertId"] for e in tail["logEntries"]], ["2"])
+        done = json.loads(events[1][1].split("data: ")[1])
+        self.assertEqual(done["searchState"]["timeRangeEnd"], NEW_TIMESTAMP)
+
+
+class SseEventTest(unittest.TestCase):
+    def test_formats_event(self):
+        actual = sse_event("page", {"a": 1})
+
+        self.assertEqual(actual, 'event: page\ndata: {"a":1}\n\n')
+        self.assertEqual(json.loads(actual.split("data: ")[1]), {"a": 1})
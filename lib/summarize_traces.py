@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .jq_programs import compile_jq_program
+from .log_entry import json_default
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZE_TRACES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "summarize_traces.jq"
+)
+
+# more chunks than workers so a few huge traces don't leave workers idle
+CHUNKS_PER_WORKER = 4
+
+# compiled once per worker process (see _init_worker)
+_summarize_program = None
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def chunk_traces(traces_by_id, chunk_count):
+    """
+    Splits {trace id: entries} into up to `chunk_count` dicts with roughly equal
+    numbers of log entries, placing the largest traces first.
+    """
+    chunk_count = max(1, min(chunk_count, len(traces_by_id)))
+    chunks = [{} for _ in range(chunk_count)]
+    sizes = [0] * chunk_count
+
+    for trace_id in sorted(traces_by_id, key=lambda t: -len(traces_by_id[t])):
+        i = sizes.index(min(sizes))
+        chunks[i][trace_id] = traces_by_id[trace_id]
+        sizes[i] += len(traces_by_id[trace_id])
+
+    return [c for c in chunks if c]
+
+
+def _init_worker():
+    global _summarize_program
+    _summarize_program = compile_jq_program(SUMMARIZE_TRACES_PATH)
+
+
+def _summarize_chunk(chunk_json):
+    # JSON text in and out is cheaper to pass between processes than dicts
+    return _summarize_program.input_text(chunk_json).text()
+
+
+def summarize_traces(traces_by_id, workers=None):
+    """
+    Summarizes each trace's log entries via summarize_traces.jq, spreading the
+    traces across a pool of `workers` processes. The result has the same shape
+    (and key order) as running the jq program on the whole input.
+    """
+    workers = workers or default_workers()
+
+    if workers == 1 or len(traces_by_id) <= 1:
+        _init_worker()
+        return json.loads(
+            _summarize_chunk(json.dumps(traces_by_id, default=json_default))
+        )
+
+    chunks = chunk_traces(traces_by_id, workers * CHUNKS_PER_WORKER)
+    logger.info(
+        f"Summarizing {len(traces_by_id)} traces in {len(chunks)} chunks using "
+        f"{workers} workers"
+    )
+
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        chunks_json = (json.dumps(c, default=json_default) for c in chunks)
+        for result in pool.map(_summarize_chunk, chunks_json):
+            summaries.update(json.loads(result))
+
+    return {trace_id: summaries[trace_id] for trace_id in traces_by_id}
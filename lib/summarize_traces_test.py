@@ -0,0 +1,58 @@
+import unittest
+
+from .jq_programs import compile_jq_program, read_jq_program
+from .summarize_traces import SUMMARIZE_TRACES_PATH, chunk_traces, summarize_traces
+
+
+def mock_entry(trace_id, i, message):
+    return {
+        "insertId": f"{trace_id}-{i}",
+        "timestamp": f"2022-11-29T16:00:0{i}.000Z",
+        "trace": f"projects/gen-prod/traces/{trace_id}",
+        "resource": {"labels": {"module_id": "default"}},
+        "protoPayload": {
+            "requestId": f"{trace_id}-req",
+            "endTime": f"2022-11-29T16:00:0{i}.500Z",
+            "line": [{"logMessage": message}],
+        },
+        "_timestampEnd": f"2022-11-29T16:00:0{i}.500Z",
+    }
+
+
+def mock_traces():
+    return {
+        trace_id: [mock_entry(trace_id, i, f"post:{i} task:{n}") for i in range(n)]
+        for (n, trace_id) in enumerate(["a", "b", "c", "d", "e"], start=1)
+    }
+
+
+class ReadJqProgramTest(unittest.TestCase):
+    def test_inlines_includes(self):
+        program = read_jq_program(SUMMARIZE_TRACES_PATH)
+
+        self.assertNotIn("include", program)
+        self.assertNotIn("module {", program)
+        self.assertIn("def timestampNs($entry):", program)
+
+
+class ChunkTracesTest(unittest.TestCase):
+    def test_balances_chunks_by_entry_count(self):
+        chunks = chunk_traces(mock_traces(), 2)
+
+        actual = sorted(sum(len(v) for v in c.values()) for c in chunks)
+        self.assertEqual(actual, [7, 8])
+
+    def test_never_returns_empty_chunks(self):
+        self.assertEqual(len(chunk_traces(mock_traces(), 10)), 5)
+
+
+class SummarizeTracesTest(unittest.TestCase):
+    def test_parallel_matches_jq(self):
+        traces = mock_traces()
+        expected = compile_jq_program(SUMMARIZE_TRACES_PATH).input(traces).first()
+
+        for workers in [1, 2]:
+            actual = summarize_traces(traces, workers=workers)
+
+            self.assertEqual(actual, expected)
+            self.assertEqual(list(actual), list(traces))
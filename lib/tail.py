@@ -0,0 +1,178 @@
+import logging
+import os
+import time
+from copy import deepcopy
+from datetime import timedelta
+
+from .correlate_logs import (
+    LogsQueryInput,
+    extract_search_state_from_log_entries,
+    format_gcp_time,
+    merge_project_entries,
+    query_projects,
+    sum_search_states,
+)
+from .domain_index import record_domain_objects
+from .timestamps import (
+    entry_timestamp_ns,
+    ns_to_datetime,
+    parse_timestamp_ns,
+    timedelta_to_ns,
+)
+
+logger = logging.getLogger(__name__)
+
+# seconds between refreshes, and how long an HTTP tail stream lasts (keep it
+# under the function's timeout; clients reconnect with the returned state)
+TAIL_INTERVAL = float(os.environ.get("TAIL_INTERVAL", 10))
+TAIL_DURATION = float(os.environ.get("TAIL_DURATION", 240))
+
+# entries can show up in the Logging API a little after their timestamp, so each
+# refresh looks back this far (and skips entries it already returned)
+TAIL_LAG = timedelta(seconds=30)
+
+# ids that join the tracked set as they're found
+TAIL_ID_KEYS = ["traces", "operations", "tasks", "projects"]
+
+
+class LiveTail:
+    """
+    Follows a correlation as new log entries come in. Each refresh queries only
+    for entries since the last seen one (minus TAIL_LAG) that match any of the
+    tracked ids, i.e. all traces, operations and tasks in the search state. Ids
+    found in new entries are added to the state, so later refreshes track them
+    too.
+
+    The last seen entry's timestamp isn't in the state (its time range is
+    widened and rounded, see find_entries()), so unless it's given as last_seen
+    (e.g. from an earlier tail's "lastSeen"), the first refresh looks at the
+    state's whole time range and starts from the newest entry there.
+    """
+
+    def __init__(
+        self,
+        state,
+        query_fn=None,
+        lag=TAIL_LAG,
+        now_ns=time.time_ns,
+        last_seen=None,
+    ):
+        self.state = deepcopy(state)
+        self.query_fn = query_fn
+        self.lag_ns = timedelta_to_ns(lag)
+        self.now_ns = now_ns
+        self.refreshes = 0
+
+        self.last_seen_ns = parse_timestamp_ns(last_seen)
+
+        # insertId -> timestamp of entries within the look-back window. known
+        # entries' timestamps aren't in the state, but they're no later than
+        # its end (and the first refresh gets them, unless last_seen is given).
+        end_ns = parse_timestamp_ns(state["timeRangeEnd"])
+        self._recent = {i: end_ns for i in state.get("insertIds") or []}
+
+    @property
+    def last_seen(self):
+        if self.last_seen_ns is None:
+            return None
+
+        return format_gcp_time(ns_to_datetime(self.last_seen_ns))
+
+    def query_state(self):
+        start_ns = (
+            self.last_seen_ns - self.lag_ns
+            if self.last_seen_ns is not None
+            else parse_timestamp_ns(self.state["timeRangeStart"])
+        )
+        end_ns = max(self.now_ns(), self.last_seen_ns or 0) + self.lag_ns
+
+        # all tracked ids, not just new ones. already-returned entries are
+        # filtered out here instead of by insertId in the query.
+        return dict(
+            self.state,
+            insertIds=[],
+            operationsNew=self.state.get("operations") or [],
+            tasksNew=self.state.get("tasks") or [],
+            timeRangeStart=format_gcp_time(ns_to_datetime(start_ns)),
+            timeRangeEnd=format_gcp_time(ns_to_datetime(end_ns)),
+        )
+
+    def refresh(self):
+        """Fetches new entries, returning them along with any newly tracked ids."""
+        query_input = LogsQueryInput(self.query_state())
+        entries_by_key = query_projects(
+            query_input.queries,
+            self.query_fn,
+            plans=query_input.plans,
+            planner=query_input.planner,
+        )
+        fetched = merge_project_entries(entries_by_key)
+        entries = [e for e in fetched if e.get("insertId") not in self._recent]
+
+        self.refreshes += 1
+        # known entries count as seen too, they're where the tail starts from
+        self._seen(fetched)
+        new_ids = self._update(entries) if entries else {}
+        record_domain_objects(entries)
+
+        logger.info(
+            f"Tail refresh {self.refreshes}: {len(entries)} new log entries",
+            extra={"json_fields": new_ids},
+        )
+
+        return {
+            "refresh": self.refreshes,
+            "logEntries": entries,
+            "logEntryCount": len(entries),
+            "newIds": new_ids,
+            "lastSeen": self.last_seen,
+        }
+
+    def _seen(self, entries):
+        if not entries:
+            return
+
+        for entry in entries:
+            self._recent[entry.get("insertId")] = entry_timestamp_ns(entry)
+
+        self.last_seen_ns = max(
+            self.last_seen_ns or 0, max(entry_timestamp_ns(e) for e in entries)
+        )
+        cutoff_ns = self.last_seen_ns - self.lag_ns
+        self._recent = {i: ts for (i, ts) in self._recent.items() if ts >= cutoff_ns}
+
+    def _update(self, entries):
+        state = sum_search_states(
+            self.state, extract_search_state_from_log_entries(entries)
+        )
+        # the tail keeps its start and primary project; the end is the latest entry
+        state.update(
+            project=self.state.get("project"),
+            timeRangeStart=self.state["timeRangeStart"],
+            timeRangeEnd=format_gcp_time(ns_to_datetime(self.last_seen_ns)),
+        )
+        self.state = state
+
+        return {k: state[f"{k}New"] for k in TAIL_ID_KEYS if state.get(f"{k}New")}
+
+    def run(
+        self,
+        interval=TAIL_INTERVAL,
+        duration=None,
+        sleep=time.sleep,
+        clock=time.monotonic,
+    ):
+        """
+        Refreshes every `interval` seconds, yielding each refresh's result, for
+        `duration` seconds (or until the caller stops iterating).
+        """
+        deadline = clock() + duration if duration else None
+
+        while True:
+            started = clock()
+            yield self.refresh()
+
+            if deadline and started + interval >= deadline:
+                return
+
+            sleep(max(0.0, interval - (clock() - started)))
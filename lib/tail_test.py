@@ -0,0 +1,121 @@
+import re
+import unittest
+
+from .tail import LiveTail
+from .testing import MOCK_PROJECT, mock_entry, mock_state
+from .timestamps import parse_timestamp_ns
+
+
+def mock_tail_state():
+    return mock_state(projects=[MOCK_PROJECT], insertIds=["1"])
+
+
+class MockLogs:
+    """
+    Serves all entries in the query's time range; LiveTail has to skip the ones
+    it already returned.
+    """
+
+    def __init__(self, *entries):
+        self.entries = list(entries)
+        self.queries = []
+
+    def query_fn(self, query, project=None):
+        self.queries.append(query)
+        (start, end) = re.findall(r'timestamp[<>]="([^"]+)"', query)
+
+        return [
+            dict(e)
+            for e in self.entries
+            if parse_timestamp_ns(start)
+            <= parse_timestamp_ns(e["timestamp"])
+            <= parse_timestamp_ns(end)
+        ]
+
+
+# newest entry of the correlation the tail picks up from
+LAST_SEEN = "2022-11-29T16:02:00.000Z"
+
+
+def mock_now():
+    return parse_timestamp_ns("2022-11-29T16:06:00.000Z")
+
+
+class LiveTailTest(unittest.TestCase):
+    def test_returns_only_new_entries(self):
+        logs = MockLogs(
+            mock_entry("1", timestamp="2022-11-29T16:04:00.000Z"),
+            mock_entry("2", timestamp="2022-11-29T16:05:10.000Z"),
+        )
+        live_tail = LiveTail(mock_tail_state(), logs.query_fn, now_ns=mock_now)
+
+        result = live_tail.refresh()
+        self.assertEqual([e["insertId"] for e in result["logEntries"]], ["2"])
+        self.assertEqual(live_tail.state["timeRangeEnd"], "2022-11-29T16:05:10.000Z")
+
+        # nothing new the second time around
+        self.assertEqual(live_tail.refresh()["logEntries"], [])
+
+    def test_queries_since_last_seen(self):
+        logs = MockLogs()
+        LiveTail(
+            mock_tail_state(), logs.query_fn, now_ns=mock_now, last_seen=LAST_SEEN
+        ).refresh()
+
+        # look-back of TAIL_LAG before the last seen entry, and no insertId clause
+        self.assertIn('timestamp>="2022-11-29T16:01:30.000Z"', logs.queries[0])
+        self.assertNotIn("insertId", logs.queries[0])
+
+    def test_starts_from_newest_known_entry(self):
+        logs = MockLogs(
+            mock_entry("1", timestamp="2022-11-29T16:02:00.000Z"),
+            mock_entry("2", timestamp="2022-11-29T16:03:00.000Z"),
+        )
+        live_tail = LiveTail(mock_tail_state(), logs.query_fn, now_ns=mock_now)
+
+        # the state's end is widened past its entries, so look at all of it
+        result = live_tail.refresh()
+        self.assertIn('timestamp>="2022-11-29T16:00:00.000Z"', logs.queries[0])
+        self.assertEqual([e["insertId"] for e in result["logEntries"]], ["2"])
+
+        # then from the newest entry, known or not
+        logs.entries = [mock_entry("1", timestamp="2022-11-29T16:02:00.000Z")]
+        live_tail.refresh()
+        self.assertIn('timestamp>="2022-11-29T16:02:30.000Z"', logs.queries[1])
+        self.assertEqual(live_tail.last_seen, "2022-11-29T16:03:00.000Z")
+
+    def test_tracks_found_ids(self):
+        logs = MockLogs(
+            mock_entry(
+                "2",
+                timestamp="2022-11-29T16:05:10.000Z",
+                protoPayload={
+                    "line": [{"logMessage": "trace:projects/gen-prod/traces/def"}]
+                },
+            )
+        )
+        live_tail = LiveTail(mock_tail_state(), logs.query_fn, now_ns=mock_now)
+
+        result = live_tail.refresh()
+        self.assertEqual(result["newIds"], {"traces": ["def"]})
+
+        live_tail.refresh()
+        self.assertIn("def", logs.queries[-1])
+
+    def test_run_stops_after_duration(self):
+        live_tail = LiveTail(mock_tail_state(), MockLogs().query_fn, now_ns=mock_now)
+        clock = [0.0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        results = list(
+            live_tail.run(interval=10, duration=25, sleep=sleep, clock=lambda: clock[0])
+        )
+
+        # refreshes at 0s, 10s and 20s; the next one would be past the deadline
+        self.assertEqual([r["refresh"] for r in results], [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+"""
+Log entry and search state factories shared by the tests. Everything is in
+project gen-prod, within the first 5 minutes of 2022-11-29T16:00:00Z.
+"""
+
+MOCK_PROJECT = "gen-prod"
+MOCK_TIME_RANGE = ("2022-11-29T16:00:00.000Z", "2022-11-29T16:05:00.000Z")
+
+# patch this with a ReplayBackend's fetch_page to correlate against it
+FETCH_PAGE = "lib.correlate_logs.fetch_log_entries_page"
+
+
+def mock_timestamp(second):
+    return f"2022-11-29T16:00:0{second}.000Z"
+
+
+def mock_entry(insert_id, second=1, trace="abc", **fields):
+    """A log entry in trace `trace`; `fields` add to or replace its keys."""
+    return {
+        "insertId": insert_id,
+        "timestamp": mock_timestamp(second),
+        "trace": f"projects/{MOCK_PROJECT}/traces/{trace}",
+        "resource": {"labels": {"project_id": MOCK_PROJECT}},
+        **fields,
+    }
+
+
+def mock_state(traces=("abc",), **kwargs):
+    return {
+        "project": MOCK_PROJECT,
+        "timeRangeStart": MOCK_TIME_RANGE[0],
+        "timeRangeEnd": MOCK_TIME_RANGE[1],
+        "insertIds": [],
+        "traces": list(traces),
+        **kwargs,
+    }
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+NS_PER_SECOND = 1_000_000_000
+
+EPOCH = datetime(1970, 1, 1)
+
+# parsed entry timestamps are kept here, by timestamp, rather than on the entries
+# (which get serialized as they are). big enough for a step's entries.
+TIMESTAMP_CACHE_SIZE = 1 << 16
+
+
+def days_from_civil(year, month, day):
+    """
+    Days since 1970-01-01 for a proleptic Gregorian date. Pure integer math, so
+    it's much faster than going through datetime/strptime.
+
+    See http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    """
+    year -= month <= 2
+    era = (year if year >= 0 else year - 399) // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+
+    return era * 146097 + doe - 719468
+
+
+def parse_timestamp_ns(ts):
+    """
+    Parses an RFC3339 timestamp (as found in log entries, e.g.
+    "2022-11-29T16:00:00.123456789Z") to integer nanoseconds since the epoch,
+    keeping full sub-second precision. Returns None for empty values.
+    """
+    if not ts:
+        return None
+
+    try:
+        seconds = (
+            days_from_civil(int(ts[0:4]), int(ts[5:7]), int(ts[8:10])) * 86400
+            + int(ts[11:13]) * 3600
+            + int(ts[14:16]) * 60
+            + int(ts[17:19])
+        )
+    except (TypeError, ValueError) as err:
+        raise ValueError(f"Invalid timestamp: {ts}") from err
+
+    # everything after the seconds is an optional fraction plus a "Z" or offset
+    rest = ts[19:]
+    nanos = 0
+
+    if rest.startswith("."):
+        digits_end = 1
+        while digits_end < len(rest) and rest[digits_end].isdigit():
+            digits_end += 1
+
+        nanos = int(rest[1:digits_end][:9].ljust(9, "0") or 0)
+        rest = rest[digits_end:]
+
+    if rest in ("Z", "z", ""):
+        offset = 0
+    elif rest[0] in "+-" and len(rest) == 6 and rest[3] == ":":
+        offset = (int(rest[1:3]) * 3600 + int(rest[4:6]) * 60) * (
+            -1 if rest[0] == "-" else 1
+        )
+    else:
+        raise ValueError(f"Invalid timestamp: {ts}")
+
+    return (seconds - offset) * NS_PER_SECOND + nanos
+
+
+def parse_duration_ns(duration):
+    """Parses a protobuf duration string (e.g. "0.012345s") to nanoseconds."""
+    if not duration:
+        return None
+
+    if not duration.endswith("s"):
+        raise ValueError(f"Invalid duration: {duration}")
+
+    (whole, _, fraction) = duration[:-1].partition(".")
+    sign = -1 if whole.startswith("-") else 1
+
+    return sign * (
+        abs(int(whole or 0)) * NS_PER_SECOND + int(fraction[:9].ljust(9, "0") or 0)
+    )
+
+
+def ns_to_datetime(ns):
+    """Converts nanoseconds since the epoch to a naive (UTC) datetime."""
+    return EPOCH + timedelta(microseconds=ns // 1000)
+
+
+def timedelta_to_ns(td):
+    return td // timedelta(microseconds=1) * 1000
+
+
+def datetime_to_ns(dt):
+    return timedelta_to_ns(dt - EPOCH)
+
+
+# ---
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def cached_timestamp_ns(ts):
+    return parse_timestamp_ns(ts)
+
+
+def entry_timestamp_ns(entry):
+    """
+    The entry's timestamp in integer nanoseconds, parsed once (see
+    TIMESTAMP_CACHE_SIZE) so sorting, windowing and durations can reuse it.
+    """
+    if not isinstance(entry, dict):
+        # LogEntry, parsed when it was created
+        return entry.timestamp_ns
+
+    return cached_timestamp_ns(entry.get("timestamp"))
+
+
+def entry_timestamp_end_ns(entry):
+    """Same as entry_timestamp_ns(), for the end time (protoPayload.endTime)."""
+    if not isinstance(entry, dict):
+        return entry.timestamp_end_ns
+
+    end_time = (entry.get("protoPayload") or {}).get("endTime")
+    return cached_timestamp_ns(end_time) if end_time else entry_timestamp_ns(entry)
+
+
+def sort_entries_by_timestamp(entries):
+    # entries without a timestamp sort first, same as an empty string would
+    return sorted(entries, key=lambda e: entry_timestamp_ns(e) or 0)
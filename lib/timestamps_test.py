@@ -0,0 +1,94 @@
+import unittest
+from datetime import datetime, timezone
+
+from .timestamps import (
+    days_from_civil,
+    entry_timestamp_end_ns,
+    entry_timestamp_ns,
+    parse_duration_ns,
+    parse_timestamp_ns,
+    sort_entries_by_timestamp,
+)
+
+
+def epoch_ns(*args):
+    dt = datetime(*args, tzinfo=timezone.utc)
+    return int(dt.timestamp()) * 1_000_000_000
+
+
+class DaysFromCivilTest(unittest.TestCase):
+    def test_matches_datetime(self):
+        for (y, m, d) in [(1970, 1, 1), (2000, 2, 29), (2022, 11, 29), (1969, 12, 31)]:
+            expected = (datetime(y, m, d) - datetime(1970, 1, 1)).days
+            self.assertEqual(days_from_civil(y, m, d), expected)
+
+
+class ParseTimestampNsTest(unittest.TestCase):
+    def test_parses_nanoseconds(self):
+        actual = parse_timestamp_ns("2022-11-29T16:00:00.123456789Z")
+        self.assertEqual(actual, epoch_ns(2022, 11, 29, 16) + 123456789)
+
+    def test_parses_microseconds(self):
+        actual = parse_timestamp_ns("2022-11-29T16:00:00.123456Z")
+        self.assertEqual(actual, epoch_ns(2022, 11, 29, 16) + 123456000)
+
+    def test_parses_without_fraction(self):
+        actual = parse_timestamp_ns("2022-11-29T16:00:00Z")
+        self.assertEqual(actual, epoch_ns(2022, 11, 29, 16))
+
+    def test_parses_offset(self):
+        actual = parse_timestamp_ns("2022-11-29T11:00:00.5-05:00")
+        self.assertEqual(actual, epoch_ns(2022, 11, 29, 16) + 500000000)
+
+    def test_returns_none_for_empty_values(self):
+        self.assertIsNone(parse_timestamp_ns(None))
+        self.assertIsNone(parse_timestamp_ns(""))
+
+    def test_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            parse_timestamp_ns("foo")
+        with self.assertRaises(ValueError):
+            parse_timestamp_ns("2022-11-29T16:00:00.1234 UTC")
+
+
+class ParseDurationNsTest(unittest.TestCase):
+    def test_parses_duration(self):
+        self.assertEqual(parse_duration_ns("0.012345s"), 12345000)
+        self.assertEqual(parse_duration_ns("2s"), 2000000000)
+        self.assertEqual(parse_duration_ns("-1.5s"), -1500000000)
+
+    def test_returns_none_for_empty_values(self):
+        self.assertIsNone(parse_duration_ns(None))
+
+    def test_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            parse_duration_ns("12ms")
+
+
+class EntryTimestampsTest(unittest.TestCase):
+    def test_parses_timestamp_and_end_time(self):
+        entry = {
+            "timestamp": "2022-11-29T16:00:00.5Z",
+            "protoPayload": {"endTime": "2022-11-29T16:00:01Z"},
+        }
+
+        start_ns = epoch_ns(2022, 11, 29, 16)
+        self.assertEqual(entry_timestamp_ns(entry), start_ns + 5 * 10**8)
+        self.assertEqual(entry_timestamp_end_ns(entry), start_ns + 10**9)
+        # nothing is added to the entry, it's serialized as it is
+        self.assertEqual(list(entry), ["timestamp", "protoPayload"])
+
+    def test_end_time_falls_back_to_timestamp(self):
+        entry = {"timestamp": "2022-11-29T16:00:00Z"}
+        self.assertEqual(entry_timestamp_end_ns(entry), entry_timestamp_ns(entry))
+
+    def test_sorts_by_parsed_time_not_string(self):
+        # string sorting puts the offset timestamp last even though it's first
+        entries = [
+            {"insertId": "a", "timestamp": "2022-11-29T16:00:00.1Z"},
+            {"insertId": "b", "timestamp": "2022-11-29T17:00:00-02:00"},
+            {"insertId": "c", "timestamp": "2022-11-29T16:00:00Z"},
+        ]
+
+        actual = [e["insertId"] for e in sort_entries_by_timestamp(entries)]
+        self.assertEqual(actual, ["c", "a", "b"])
@@ -0,0 +1,245 @@
+import json
+import logging
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# cap the number of traces per query so each query stays small
+MAX_FRONTIER_TRACES = 50
+
+EDGE_SEPARATOR = ">"
+NODE_SEPARATOR = ":"
+
+# search state keys for the graph and graph-ordered steps. they're only kept
+# when used, since every step's state would carry them otherwise.
+GRAPH_STATE_KEYS = ["graphEdges", "graphRoots", "tracesQueried", "tracesExhausted"]
+
+
+def parse_node(node):
+    (kind, node_id) = node.split(NODE_SEPARATOR, 1)
+    return (kind, node_id)
+
+
+def trace_node(trace_id):
+    return f"trace{NODE_SEPARATOR}{trace_id}"
+
+
+class TraceGraph:
+    """
+    Graph index of traces, deferred tasks, operations and pubsub messages, built
+    from the "graphEdges" search state values found by gcp_logs_find.jq. Edges
+    point from parent (e.g. the trace that deferred a task) to child (e.g. the
+    task, which in turn points to the trace that ran it).
+    """
+
+    def __init__(self, edges=()):
+        self.children = defaultdict(set)
+        self.parents = defaultdict(set)
+
+        for edge in edges:
+            self.add_edge(*edge.split(EDGE_SEPARATOR, 1))
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state.get("graphEdges") or [])
+
+    def add_edge(self, parent, child):
+        self.children[parent].add(child)
+        self.parents[child].add(parent)
+
+    def nodes(self):
+        return sorted(set(self.children) | set(self.parents))
+
+    def edges(self):
+        return sorted(
+            (parent, child)
+            for (parent, children) in self.children.items()
+            for child in children
+        )
+
+    def neighbors(self, node):
+        return self.children.get(node, set()) | self.parents.get(node, set())
+
+    def has_entries(self, node):
+        """
+        Whether any of a trace's own log entries are known. Edges into a trace,
+        and from it to tasks, operations and messages, come from its own entries
+        (see entryGraphEdges in gcp_logs_find.jq); trace>trace edges come from
+        the child's.
+        """
+        return bool(self.parents.get(node)) or any(
+            parse_node(child)[0] != "trace" for child in self.children.get(node, ())
+        )
+
+    def depths(self, roots, exhausted=()):
+        """
+        Breadth-first distances from the roots, ignoring edge direction (a seed
+        may be a child as well as a parent). Exhausted nodes are not expanded,
+        so anything only reachable through them is left out.
+        """
+        exhausted = set(exhausted)
+        depths = {root: 0 for root in roots}
+        queue = deque(roots)
+
+        while queue:
+            node = queue.popleft()
+            if node in exhausted:
+                continue
+
+            for neighbor in sorted(self.neighbors(node)):
+                if neighbor not in depths:
+                    depths[neighbor] = depths[node] + 1
+                    queue.append(neighbor)
+
+        return depths
+
+    def to_json(self):
+        return {
+            "nodes": [
+                {"id": node, "kind": parse_node(node)[0]} for node in self.nodes()
+            ],
+            "edges": [
+                {"source": parent, "target": child} for (parent, child) in self.edges()
+            ],
+        }
+
+    def to_dot(self):
+        lines = ["digraph traces {"]
+        lines += [
+            f"  {json.dumps(parent)} -> {json.dumps(child)};"
+            for (parent, child) in self.edges()
+        ]
+        lines.append("}")
+
+        return "\n".join(lines) + "\n"
+
+
+# ---
+
+
+def graph_roots(state):
+    # the seed's traces, i.e. those known before the first graph-ordered query
+    return state.get("graphRoots") or [trace_node(t) for t in state.get("traces") or []]
+
+
+def trace_frontier(state, max_traces=MAX_FRONTIER_TRACES):
+    """
+    Picks the next traces to query: the not-yet-queried traces closest to the
+    seed, one BFS level at a time. Traces only connected to the seed through
+    exhausted traces (see update_graph_state()) are skipped.
+    """
+    graph = TraceGraph.from_state(state)
+    queried = set(state.get("tracesQueried") or [])
+    exhausted = [trace_node(t) for t in state.get("tracesExhausted") or []]
+    depths = graph.depths(graph_roots(state), exhausted)
+
+    candidates = []
+    for trace_id in state.get("traces") or []:
+        node = trace_node(trace_id)
+        if trace_id in queried:
+            continue
+
+        if node in depths:
+            candidates.append((depths[node], trace_id))
+        elif not graph.neighbors(node):
+            # no known links at all, so query it once everything else is done
+            candidates.append((float("inf"), trace_id))
+        else:
+            logger.debug(f"Pruning trace {trace_id}; its subtree yielded nothing")
+
+    if not candidates:
+        return []
+
+    min_depth = min(depth for (depth, _) in candidates)
+
+    return sorted(t for (depth, t) in candidates if depth == min_depth)[:max_traces]
+
+
+def without_graph_state(state):
+    """Copy of the state without the graph keys (and their "*New" keys)."""
+    return {
+        k: v
+        for (k, v) in state.items()
+        if k not in GRAPH_STATE_KEYS
+        and not (k.endswith("New") and k[: -len("New")] in GRAPH_STATE_KEYS)
+    }
+
+
+def has_unqueried_traces(state):
+    """
+    Whether graph-ordered steps have traces left to query, so a step that found
+    no new entries isn't the last one.
+    """
+    return bool(trace_frontier(state, max_traces=1))
+
+
+def graph_query_state(state):
+    """
+    Returns (query_state, frontier): a copy of the state that only queries the
+    trace frontier (plus any new operations and tasks), and the frontier itself.
+    """
+    frontier = trace_frontier(state)
+
+    query_state = dict(state)
+    query_state.update(traces=frontier)
+    query_state.setdefault("graphRoots", graph_roots(state))
+
+    logger.info(
+        f"Querying {len(frontier)} of {len(state.get('traces') or [])} traces "
+        "breadth-first from seed",
+        extra={"json_fields": frontier},
+    )
+
+    return (query_state, frontier)
+
+
+def update_graph_state(resp_state, input_state, frontier, entries, complete=True):
+    """
+    Records which traces were queried and which of those are exhausted, so
+    their subtrees are not expanded further. A trace is exhausted when it
+    yielded no new entries and either has no entries at all or no children in
+    the graph; known entries are excluded from queries, so a trace whose
+    entries were all found through its tasks or operations still leads on to
+    its children. Nothing is marked exhausted for incomplete (i.e. to be
+    continued) results.
+
+    Like sum_search_states(), each key gets a "*New" key with the values added
+    by this step, so search state deltas (see lib/deltas.py) carry them.
+    """
+    graph = TraceGraph.from_state(resp_state)
+    found_traces = set(
+        e["trace"].split("/")[-1] for e in entries if isinstance(e.get("trace"), str)
+    )
+    if not complete:
+        found_traces |= set(frontier)
+
+    exhausted = set(
+        t
+        for t in frontier
+        if t not in found_traces
+        and not (graph.has_entries(trace_node(t)) and graph.children.get(trace_node(t)))
+    )
+    graph_state = {
+        "graphRoots": graph_roots(input_state),
+        "tracesQueried": sorted(
+            set(input_state.get("tracesQueried") or []) | set(frontier)
+        ),
+        "tracesExhausted": sorted(
+            set(input_state.get("tracesExhausted") or []) | exhausted
+        ),
+    }
+
+    for (k, values) in graph_state.items():
+        prev = set(input_state.get(k) or [])
+        resp_state[k] = values
+        resp_state[f"{k}New"] = [v for v in values if v not in prev]
+
+    return resp_state
+
+
+def has_pending_queries(query_state):
+    return bool(
+        query_state.get("traces")
+        or query_state.get("operationsNew")
+        or query_state.get("tasksNew")
+    )
@@ -0,0 +1,265 @@
+import unittest
+from unittest import mock
+
+from .correlate_logs import extract_search_state_from_log_entries, find_entries
+from .replay_backend import ReplayBackend
+from .testing import FETCH_PAGE, mock_entry, mock_state
+from .trace_graph import (
+    TraceGraph,
+    graph_query_state,
+    has_unqueried_traces,
+    trace_frontier,
+    update_graph_state,
+    without_graph_state,
+)
+
+
+def mock_graph_state(**kwargs):
+    graph = {
+        "traces": ["seed", "child", "grandchild"],
+        "graphRoots": ["trace:seed"],
+        "graphEdges": [
+            "trace:seed>task:1",
+            "task:1>trace:child",
+            "trace:child>task:2",
+            "task:2>trace:grandchild",
+        ],
+    }
+    return mock_state(**{**graph, **kwargs})
+
+
+def mock_request_entry(insert_id, trace, second, task=None, messages=()):
+    proto = {"line": [{"logMessage": m} for m in messages]}
+    if task:
+        proto["taskName"] = task
+
+    return mock_entry(insert_id, second, trace, protoPayload=proto)
+
+
+# trace-s defers task 101, which runs in trace-t and defers task 102, which runs
+# in trace-u. trace-t's only entry is found through its task, so querying the
+# trace itself yields nothing new.
+CHAIN_ENTRIES = [
+    mock_request_entry("s1", "trace-s", 1, messages=["task:101"]),
+    mock_request_entry("t1", "trace-t", 2, task="101", messages=["task:102"]),
+    mock_request_entry("u1", "trace-u", 3, task="102"),
+    mock_request_entry("u2", "trace-u", 4),
+]
+
+
+def correlate_chain(graph_ordering, max_steps=10):
+    """Runs steps from the chain's seed until done, like ./correlate_logs does."""
+    backend = ReplayBackend(CHAIN_ENTRIES)
+    state = extract_search_state_from_log_entries(CHAIN_ENTRIES[:1])
+
+    for _ in range(max_steps):
+        with mock.patch(FETCH_PAGE, backend.fetch_page):
+            (_, resp_data) = find_entries(state, graph_ordering=graph_ordering)
+        (prev_state, state) = (state, resp_data["searchState"])
+
+        if state == prev_state or not (
+            resp_data["logEntries"] or (graph_ordering and has_unqueried_traces(state))
+        ):
+            break
+
+    return state
+
+
+class ExtractGraphEdgesTest(unittest.TestCase):
+    def test_extracts_edges_from_entries(self):
+        entries = [
+            {
+                "insertId": "1",
+                "timestamp": "2022-11-29T16:00:00.000Z",
+                "trace": "projects/gen-prod/traces/child",
+                "operation": {"id": "op1"},
+                "protoPayload": {
+                    "taskName": "1",
+                    "line": [
+                        {"logMessage": "trace:projects/gen-prod/traces/seed;"},
+                        {"logMessage": "task:2 msgid:3"},
+                    ],
+                },
+            }
+        ]
+
+        actual = extract_search_state_from_log_entries(entries)["graphEdges"]
+        expected = [
+            "operation:op1>trace:child",
+            "task:1>trace:child",
+            "trace:child>message:3",
+            "trace:child>task:2",
+            "trace:seed>trace:child",
+        ]
+        self.assertEqual(actual, expected)
+
+
+class TraceGraphTest(unittest.TestCase):
+    def test_depths_ignore_edge_direction(self):
+        graph = TraceGraph(["trace:parent>task:1", "task:1>trace:seed"])
+
+        actual = graph.depths(["trace:seed"])
+        expected = {"trace:seed": 0, "task:1": 1, "trace:parent": 2}
+        self.assertEqual(actual, expected)
+
+    def test_depths_do_not_expand_exhausted_nodes(self):
+        graph = TraceGraph.from_state(mock_graph_state())
+
+        actual = graph.depths(["trace:seed"], exhausted=["trace:child"])
+        self.assertNotIn("task:2", actual)
+
+    def test_exports_json_and_dot(self):
+        graph = TraceGraph(["trace:a>task:1"])
+
+        self.assertEqual(
+            graph.to_json(),
+            {
+                "nodes": [
+                    {"id": "task:1", "kind": "task"},
+                    {"id": "trace:a", "kind": "trace"},
+                ],
+                "edges": [{"source": "trace:a", "target": "task:1"}],
+            },
+        )
+        self.assertIn('"trace:a" -> "task:1";', graph.to_dot())
+
+
+class TraceFrontierTest(unittest.TestCase):
+    def test_starts_with_seed(self):
+        self.assertEqual(trace_frontier(mock_graph_state()), ["seed"])
+
+    def test_moves_one_level_at_a_time(self):
+        state = mock_graph_state(tracesQueried=["seed"])
+        self.assertEqual(trace_frontier(state), ["child"])
+
+    def test_prunes_subtrees_of_exhausted_traces(self):
+        state = mock_graph_state(
+            tracesQueried=["seed", "child"], tracesExhausted=["child"]
+        )
+        self.assertEqual(trace_frontier(state), [])
+
+    def test_has_unqueried_traces(self):
+        self.assertTrue(has_unqueried_traces(mock_graph_state(tracesQueried=["seed"])))
+
+        state = mock_graph_state(tracesQueried=["seed", "child", "grandchild"])
+        self.assertFalse(has_unqueried_traces(state))
+
+    def test_unlinked_traces_are_queried_last(self):
+        state = mock_graph_state(traces=["seed", "child", "loner"])
+        self.assertEqual(trace_frontier(state), ["seed"])
+
+        state.update(tracesQueried=["seed", "child"])
+        self.assertEqual(trace_frontier(state), ["loner"])
+
+    def test_limits_frontier_size(self):
+        state = mock_graph_state(traces=["a", "b", "c"], graphRoots=[], graphEdges=[])
+        self.assertEqual(trace_frontier(state, max_traces=2), ["a", "b"])
+
+
+class UpdateGraphStateTest(unittest.TestCase):
+    def test_records_queried_and_exhausted_traces(self):
+        input_state = mock_graph_state(tracesQueried=["seed"])
+        entries = [{"trace": "projects/gen-prod/traces/child"}]
+
+        actual = update_graph_state({}, input_state, ["child", "other"], entries)
+
+        self.assertEqual(actual["tracesQueried"], ["child", "other", "seed"])
+        self.assertEqual(actual["tracesExhausted"], ["other"])
+        self.assertEqual(actual["graphRoots"], ["trace:seed"])
+
+    def test_records_new_values(self):
+        input_state = mock_graph_state(tracesQueried=["seed"])
+        del input_state["graphRoots"]
+
+        actual = update_graph_state({}, input_state, ["other"], [])
+
+        self.assertEqual(actual["tracesQueriedNew"], ["other"])
+        self.assertEqual(actual["tracesExhaustedNew"], ["other"])
+        self.assertEqual(actual["graphRootsNew"], actual["graphRoots"])
+
+    def test_traces_with_children_are_not_exhausted(self):
+        # child's entries are known (it ran task 1) and it deferred task 2
+        input_state = mock_graph_state(tracesQueried=["seed"])
+
+        actual = update_graph_state(dict(input_state), input_state, ["child"], [])
+
+        self.assertEqual(actual["tracesExhausted"], [])
+        self.assertEqual(trace_frontier(actual), ["grandchild"])
+
+    def test_traces_without_entries_are_exhausted(self):
+        # seed is only mentioned by child's entries
+        input_state = mock_graph_state(
+            graphEdges=["trace:seed>trace:child", "trace:child>task:2"]
+        )
+
+        actual = update_graph_state(dict(input_state), input_state, ["seed"], [])
+
+        self.assertEqual(actual["tracesExhausted"], ["seed"])
+
+
+class GraphStateKeysTest(unittest.TestCase):
+    def test_without_graph_state(self):
+        state = mock_graph_state(tracesQueried=["seed"], graphEdgesNew=["a>b"])
+
+        self.assertEqual(
+            without_graph_state(state), without_graph_state(mock_graph_state())
+        )
+        self.assertNotIn("graphEdges", without_graph_state(state))
+        self.assertIn("traces", without_graph_state(state))
+
+    def test_only_kept_when_used(self):
+        backend = ReplayBackend(CHAIN_ENTRIES)
+        state = extract_search_state_from_log_entries(CHAIN_ENTRIES[:1])
+
+        with mock.patch(FETCH_PAGE, backend.fetch_page):
+            (_, resp_data) = find_entries(state)
+            (_, graph_resp_data) = find_entries(state, export_graph=True)
+
+        self.assertNotIn("graphEdges", resp_data["searchState"])
+        self.assertNotIn("graphEdgesNew", resp_data["searchState"])
+        self.assertEqual(
+            graph_resp_data["searchState"]["graphEdges"], ["trace:trace-s>task:101"]
+        )
+
+
+class FindEntriesGraphOrderingTest(unittest.TestCase):
+    def test_queries_frontier_only(self):
+        queries = []
+
+        def query_fn(query, project=None):
+            queries.append(query)
+            return []
+
+        (query_state, frontier) = graph_query_state(mock_graph_state())
+        self.assertEqual(query_state["traces"], ["seed"])
+
+        (_, resp_data) = find_entries(
+            mock_graph_state(tracesQueried=["seed"]),
+            query_fn=query_fn,
+            graph_ordering=True,
+        )
+
+        self.assertEqual(len(queries), 1)
+        # trace clause form depends on the query plan
+        self.assertRegex(queries[0], r"traces/\(?child")
+        self.assertNotIn("seed", queries[0])
+        # child deferred task 2, so its subtree is still worth querying
+        self.assertEqual(resp_data["searchState"]["tracesExhausted"], [])
+
+    def test_skips_query_when_nothing_left(self):
+        def query_fn(query, project=None):
+            raise AssertionError("should not query")
+
+        state = mock_graph_state(tracesQueried=["seed", "child", "grandchild"])
+        (_, resp_data) = find_entries(state, query_fn=query_fn, graph_ordering=True)
+
+        self.assertEqual(resp_data["logEntries"], [])
+
+    def test_follows_traces_found_through_tasks(self):
+        baseline = correlate_chain(graph_ordering=False)
+        self.assertEqual(baseline["insertIds"], ["s1", "t1", "u1", "u2"])
+
+        actual = correlate_chain(graph_ordering=True)
+
+        self.assertEqual(actual["insertIds"], baseline["insertIds"])
+        self.assertEqual(actual["tracesQueried"], ["trace-s", "trace-t", "trace-u"])
@@ -1,20 +1,36 @@
 import json
 import logging
+import math
 from copy import deepcopy
 
 import functions_framework
-import google.cloud.logging
+from flask import Response, stream_with_context
 from werkzeug.exceptions import BadRequest
 
+from lib.batch import compact_batch_results, correlate_batch, parse_batch_seeds
 from lib.correlate_logs import (
+    LOGS_CLIENTS,
+    MAX_LOG_ENTRIES,
     FilterTooBigError,
     NoEntriesError,
-    find_entries,
     get_state_from_url,
     parse_gcp_logs_url,
 )
+from lib.cursors import InvalidContinuationError
+from lib.deltas import delta_response_data
+from lib.log_entry import compact_entries_from_env
+from lib.prefetch import find_entries_prefetched
+from lib.profiling import RequestProfiler, profile_all_from_env, profile_dir_from_env
+from lib.scheduler import QuotaWaitError
+from lib.sessions import SessionNotFoundError, get_session_store, new_session_token
+from lib.spill import is_spilled, iter_json, memory_budget_from_env
+from lib.streaming import sse_stream, tail_sse_stream
+from lib.tail import TAIL_DURATION, TAIL_INTERVAL
+from lib.timestamps import parse_timestamp_ns
+from lib.trace_graph import TraceGraph
 
-logs_client = google.cloud.logging.Client()
+# same (default project) client used for querying
+logs_client = LOGS_CLIENTS.client()
 logs_client.setup_logging(log_level=logging.DEBUG)
 
 logger = logging.getLogger(__name__)
@@ -44,19 +60,225 @@ def handle_bad_request(e):
     return response, 400
 
 
+@functions_framework.errorhandler(QuotaWaitError)
+def handle_quota_wait(e):
+    # see LOGS_MAX_QUOTA_WAIT
+    retry_after = math.ceil(e.retry_after)
+    resp_data = {
+        "status": "error",
+        "msg": str(e),
+        "data": {"code": 429, "retryAfterSeconds": retry_after},
+    }
+    logger.info(f"RESP: {resp_data['msg']}", extra={"json_fields": resp_data})
+
+    return (resp_data, 429, {"Retry-After": str(retry_after)})
+
+
+def correlate_logs_batch(req_data):
+    try:
+        seeds = parse_batch_seeds(
+            req_data.get("urls"),
+            req_data.get("prevSearchStates"),
+            req_data.get("prevUrl"),
+        )
+    except ValueError as err:
+        raise BadRequest(str(err)) from err
+
+    if not seeds:
+        raise BadRequest("Missing required param(s)")
+
+    (results, merged) = correlate_batch(seeds)
+
+    resp_msg = (
+        f"Found {merged['logEntryCount']} log entries across {len(seeds)} seeds"
+        if merged
+        else NO_ENTRIES_RESPONSE_JSON["msg"]
+    )
+    resp_data = {
+        "results": compact_batch_results(results),
+        "merged": merged,
+    }
+
+    resp_data_logged = deepcopy(resp_data)
+    if merged:
+        resp_data_logged["merged"].update(logEntries=[])
+    logger.info(f"RESP: {resp_msg}", extra={"json_fields": resp_data_logged})
+
+    return {
+        "status": "ok",
+        "msg": resp_msg,
+        "data": resp_data,
+    }
+
+
+def correlate_logs_stream(req_data, prev_state, url_params, url_qs):
+    """
+    Streams progress as server-sent events, iterating until no more log entries
+    are found. See lib/streaming.py for the events.
+    """
+    logger.info("RESP: streaming results")
+
+    stream = sse_stream(
+        prev_state,
+        url_params,
+        url_qs,
+        graph_ordering=bool(req_data.get("graphOrdering")),
+    )
+
+    return Response(
+        stream_with_context(stream),
+        mimetype="text/event-stream",
+        # don't let proxies buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def correlate_logs_tail(req_data, prev_state):
+    """
+    Live-tails the correlation as server-sent events. See tail_sse_stream() in
+    lib/streaming.py for the events.
+    """
+    interval = positive_number_param(req_data, "tailInterval", TAIL_INTERVAL)
+    duration = positive_number_param(req_data, "tailDuration", TAIL_DURATION)
+    # the "done" event's lastSeen, when tailing on
+    last_seen = timestamp_param(req_data, "lastSeen")
+
+    logger.info(f"RESP: tailing every {interval}s for {duration}s")
+
+    return Response(
+        stream_with_context(
+            tail_sse_stream(
+                prev_state, interval=interval, duration=duration, last_seen=last_seen
+            )
+        ),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def positive_number_param(req_data, name, default):
+    value = req_data.get(name, default)
+    if isinstance(value, bool) or not (isinstance(value, (int, float)) and value > 0):
+        raise BadRequest(f"{name} must be a positive number")
+
+    return value
+
+
+def timestamp_param(req_data, name):
+    value = req_data.get(name)
+    if value is None:
+        return None
+
+    try:
+        if not isinstance(value, str) or parse_timestamp_ns(value) is None:
+            raise ValueError(f"Invalid timestamp: {value}")
+    except ValueError as err:
+        raise BadRequest(f"{name} must be a timestamp") from err
+
+    return value
+
+
+def max_entries_param(req_data):
+    # `"maxEntries": true` uses the default limit
+    max_entries = req_data.get("maxEntries")
+    if max_entries is True:
+        return MAX_LOG_ENTRIES
+
+    if max_entries is not None and not (
+        isinstance(max_entries, int) and max_entries > 0
+    ):
+        raise BadRequest("maxEntries must be a positive integer")
+
+    return max_entries
+
+
+def load_session(req_data):
+    """
+    Returns (session_store, session_token, session) for requests that opt into
+    server-side session state via "sessionToken" or "session": true.
+    """
+    session_token = req_data.get("sessionToken")
+    if not (session_token or req_data.get("session")):
+        return (None, None, None)
+
+    session_store = get_session_store()
+    if not session_store:
+        raise BadRequest("Sessions are not enabled")
+
+    if not session_token:
+        return (session_store, new_session_token(), None)
+
+    try:
+        return (session_store, session_token, session_store.get(session_token))
+    except SessionNotFoundError as err:
+        raise BadRequest("Unknown or expired session") from err
+
+
+def request_client(request, req_data):
+    """Who a request is from, for per-client limits (see PREFETCH)."""
+    forwarded = request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
+    return req_data.get("sessionToken") or forwarded or request.remote_addr
+
+
 @functions_framework.http
 def correlate_logs(request):
     req_data = request.get_json()
     logger.info("REQ: post body", extra={"json_fields": req_data})
+    client = request_client(request, req_data)
+
+    # profiling: CPU profile and allocation snapshot, written to PROFILE_DIR
+    profile_dir = profile_dir_from_env()
+    if req_data.get("profile") or (profile_dir and profile_all_from_env()):
+        if not profile_dir:
+            raise BadRequest("Profiling is not enabled")
+
+        with RequestProfiler(profile_dir, "http", req_data) as profiler:
+            resp = handle_correlate_logs(req_data, client)
+
+        # streamed responses run after this returns, so they're not covered
+        return dict(resp, profile=profiler.path) if isinstance(resp, dict) else resp
+
+    return handle_correlate_logs(req_data, client)
+
+
+def handle_correlate_logs(req_data, client=None):
+    # batch mode: many seeds in one request
+    if req_data.get("urls") or req_data.get("prevSearchStates"):
+        return correlate_logs_batch(req_data)
+
+    if req_data.get("stream") and (
+        req_data.get("session") or req_data.get("sessionToken")
+    ):
+        raise BadRequest("Streaming does not support sessions")
+
+    # preview mode: first page per id class, counts and bounding entries only
+    preview = bool(req_data.get("preview"))
+    if preview and (req_data.get("stream") or req_data.get("continuation")):
+        raise BadRequest("Preview does not support streaming or continuation")
+
+    if req_data.get("tail") and (
+        preview or req_data.get("session") or req_data.get("sessionToken")
+    ):
+        raise BadRequest("Tailing does not support preview or sessions")
+
+    (session_store, session_token, session) = load_session(req_data)
 
     url = req_data.get("url")
     # or
     prev_state = req_data.get("prevSearchState")
     prev_url = req_data.get("prevUrl")
+    # or
+    if session and not url:
+        prev_state = session["searchState"]
+        prev_url = session["prevUrl"]
 
     if not (url or (prev_state and prev_url)):
         raise BadRequest("Missing required param(s)")
 
+    # continuing a truncated result only makes sense for the state it came with
+    continuation = None if url else req_data.get("continuation")
+    max_entries = max_entries_param(req_data)
+
     (url_params, url_qs) = parse_gcp_logs_url(url or prev_url)
 
     if url:
@@ -77,8 +299,31 @@ def correlate_logs(request):
             )
             return NO_ENTRIES_RESPONSE_JSON
 
+    # tail mode: keep pulling new entries for the tracked ids as events
+    if req_data.get("tail"):
+        return correlate_logs_tail(req_data, prev_state)
+
+    # streaming mode: progressive results as server-sent events
+    if req_data.get("stream"):
+        return correlate_logs_stream(req_data, prev_state, url_params, url_qs)
+
     try:
-        (resp_msg, resp_data) = find_entries(prev_state, url_params, url_qs)
+        # see PREFETCH
+        (resp_msg, resp_data) = find_entries_prefetched(
+            prev_state,
+            url_params,
+            url_qs,
+            client=client,
+            graph_ordering=bool(req_data.get("graphOrdering")),
+            export_graph=bool(req_data.get("exportGraph")),
+            memory_budget=memory_budget_from_env(),
+            max_entries=max_entries,
+            continuation=continuation,
+            preview=preview,
+            compact=compact_entries_from_env(),
+        )
+    except InvalidContinuationError as err:
+        raise BadRequest(str(err)) from err
     except FilterTooBigError:
         return {
             "status": "error",
@@ -86,12 +331,61 @@ def correlate_logs(request):
             "data": None,
         }
 
-    resp_data_logged = deepcopy(resp_data)
+    resp_state = resp_data["searchState"]
+
+    if req_data.get("exportGraph"):
+        resp_data["traceGraph"] = TraceGraph.from_state(resp_state).to_json()
+
+    # delta mode: only return new entries and a versioned state diff (plus the
+    # filter and urls with `"includeFilter": true`). sessions always use delta
+    # mode, since the full state is kept server-side.
+    if session_store or req_data.get("delta"):
+        client_version = req_data.get("searchStateVersion")
+        base_version = session.get("version", 0) if session else (client_version or 0)
+
+        # when starting over or when the client is out of sync with the session,
+        # send a full delta so the client can resync
+        resync = bool(url) or (
+            session is not None
+            and client_version is not None
+            and client_version != base_version
+        )
+
+        resp_data = delta_response_data(
+            resp_data,
+            prev_state,
+            base_version + 1,
+            full=resync,
+            include_filter=bool(req_data.get("includeFilter")),
+        )
+
+    if session_store:
+        session_store.put(
+            session_token,
+            {
+                "searchState": resp_state,
+                "prevUrl": url or prev_url,
+                "version": resp_data["searchStateDelta"]["version"],
+            },
+        )
+        resp_data["sessionToken"] = session_token
+
+    resp_data_logged = deepcopy(
+        {k: v for (k, v) in resp_data.items() if k != "logEntries"}
+    )
     resp_data_logged.update(logEntries=[])
     logger.info(f"RESP: {resp_msg}", extra={"json_fields": resp_data_logged})
 
-    return {
+    resp_body = {
         "status": "ok",
         "msg": resp_msg,
         "data": resp_data,
     }
+
+    # log entries spilled to disk (see MEMORY_BUDGET_MB) are streamed back out
+    # instead of building the whole response in memory. same for compact entries
+    # (see COMPACT_LOG_ENTRIES), which are decoded one at a time.
+    if is_spilled(resp_data["logEntries"]) or compact_entries_from_env():
+        return Response(iter_json(resp_body), mimetype="application/json")
+
+    return resp_body
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import sys
+
+import coloredlogs
+from dotenv import load_dotenv
+
+from lib.summarize_traces import default_workers, summarize_traces
+
+# init coloredlogs based on .env file
+load_dotenv()
+coloredlogs.auto_install()
+
+logger = logging.getLogger(__name__)
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Summarize traces' log entries (e.g. log_entries_by_trace_id.json) "
+        "in parallel. Output is the same as summarize_traces.jq."
+    )
+    parser.add_argument("input", help="Filename for input log entries by trace JSON")
+    parser.add_argument(
+        "-o", "--output", help="Filename for output summary JSON (default: stdout)"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=default_workers(),
+        help="Number of worker processes (default: %(default)s, the CPU count)",
+    )
+
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    with open(args.input, "r") as f:
+        traces_by_id = json.load(f)
+
+    summaries = summarize_traces(traces_by_id, workers=args.workers)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summaries, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(summaries, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    cli()
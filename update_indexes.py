@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+
+import coloredlogs
+from dotenv import load_dotenv
+
+from lib.indexes import INDEX_FILES, update_indexes
+
+# init coloredlogs based on .env file
+load_dotenv()
+coloredlogs.auto_install()
+
+logger = logging.getLogger(__name__)
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Merge step responses into a trace dir's log entry indexes "
+        f"({', '.join(INDEX_FILES.values())}). Only new log entries are indexed, "
+        "so this runs after each step and the indexes are usable mid-run."
+    )
+    parser.add_argument("trace_path", help="Trace dir, e.g. ./traces/foo")
+    parser.add_argument(
+        "step_files",
+        nargs="*",
+        help="Step response JSON files (default: the trace dir's step_N.resp.json "
+        "files not merged yet)",
+    )
+
+    args = parser.parse_args()
+
+    count = update_indexes(args.trace_path, args.step_files or None)
+    logger.info(f"Indexed {count} new log entries in {args.trace_path}")
+
+
+if __name__ == "__main__":
+    cli()